@@ -0,0 +1,7 @@
+"""Performance benchmarks for the NegoKart backend. Run modules from the backend directory, e.g. `python -m bench.startup`.
+
+startup  - worker cold start to first /health
+datagen  - synthetic users, sessions, transcripts and history at production scale
+load     - end-to-end retailer/wholesaler load test against a stand-in LLM, per-endpoint p50/p95/p99
+compare  - side-by-side diff of two load reports
+"""
@@ -0,0 +1,52 @@
+"""
+Compare two load-test reports (python -m bench.load --json ...) endpoint by endpoint.
+
+    python -m bench.compare before.json after.json
+
+Latency deltas are relative to the first report; negative is faster.
+"""
+import argparse
+import json
+
+
+def delta_pct(before, after):
+    if before is None or after is None or not before:
+        return None
+    return (after - before) / before * 100
+
+
+def fmt_delta(value) -> str:
+    return "-" if value is None else f"{value:+.1f}%"
+
+
+def print_comparison(before: dict, after: dict):
+    b_meta, a_meta = before.get("meta", {}), after.get("meta", {})
+    print("=" * 96)
+    print(f"COMPARISON  {b_meta.get('commit')} -> {a_meta.get('commit')}{' (dirty)' if a_meta.get('dirty') else ''}")
+    print(f"throughput {before['throughput_rps']:.1f} -> {after['throughput_rps']:.1f} req/s "
+          f"({fmt_delta(delta_pct(before['throughput_rps'], after['throughput_rps']))}), "
+          f"errors {before['errors']} -> {after['errors']}")
+    print(f"{'endpoint':<46}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'Δp95':>9}")
+    for label in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        b, a = before["endpoints"].get(label), after["endpoints"].get(label)
+        if b is None or a is None:
+            print(f"{label:<46}{'only in ' + ('after' if b is None else 'before'):>16}")
+            continue
+        cells = "".join(f"{b[k]:>7.1f} ->{a[k]:>7.1f}" for k in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{label:<46}{cells}{fmt_delta(delta_pct(b['p95_ms'], a['p95_ms'])):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two NegoKart load-test reports")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print_comparison(before, after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Synthetic data generator: fills a migrated database with users, sessions, transcripts,
+offers and history at production-like scale, so endpoint latency can be measured
+against large tables rather than an empty dev database.
+
+    python -m bench.datagen --database-url sqlite:////tmp/negokart-bench.db
+    python -m bench.datagen --database-url postgresql://... --wholesalers 10000 --sessions 100000 --messages 12
+
+Each session negotiates with --per-session wholesalers (not every wholesaler), so the
+defaults produce 100k sessions, 500k negotiations and ~6M chat messages. Every generated
+user's password is --password, so the load driver can log in as them.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, text
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from simulator import CATALOG  # noqa: E402
+
+QUANTITIES = (10, 25, 50, 100, 200, 500)
+REGIONS = ("north", "south", "east", "west")
+
+
+def next_id(conn, table) -> int:
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def reset_sequences(conn, tables):
+    """Explicit ids bypass Postgres serial sequences; move them past the generated rows"""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in tables:
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), COALESCE((SELECT MAX(id) FROM {table.name}), 1))"
+        ))
+
+
+class Batches:
+    """Row buffers per table, flushed as executemany INSERTs once a buffer is full.
+    All buffers flush together, in first-use order, so parents land before rows that reference them."""
+
+    def __init__(self, conn, size: int):
+        self.conn = conn
+        self.size = size
+        self.rows = {}
+        self.counts = {}
+
+    def add(self, table, row: dict):
+        rows = self.rows.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= self.size:
+            self.flush()
+
+    def flush(self):
+        for t, rows in self.rows.items():
+            if rows:
+                self.conn.execute(insert(t), rows)
+                self.counts[t.name] = self.counts.get(t.name, 0) + len(rows)
+                self.rows[t] = []
+
+
+def chat_transcript(rng: random.Random, floors: dict, messages: int, started: datetime, finalized: bool):
+    """Alternating wholesaler quotes and agent counters; the last assistant turn carries FINAL_JSON when finalized"""
+    prices = {name: round(price * rng.uniform(1.15, 1.4), 2) for name, price in floors.items()}
+    out = []
+    at = started
+    for i in range(messages):
+        at += timedelta(seconds=rng.randint(5, 300))
+        quote = ", ".join(f"{name}: {prices[name]:.2f}" for name in prices)
+        if i % 2 == 0:
+            out.append(("user", f"My prices are {quote}. INR per unit.", at))
+            continue
+        if finalized and i >= messages - 2:
+            items = [{"name": name, "final_price": prices[name]} for name in prices]
+            out.append(("assistant", "Agreed, thank you. <FINAL_JSON> " + json.dumps({"currency": "INR", "items": items}) + " </FINAL_JSON>", at))
+            break
+        counters = ", ".join(f"{name}: {price * 0.92:.2f}" for name, price in prices.items())
+        out.append(("assistant", f"Thanks. Given our volumes, can you do {counters}? Please confirm your final prices.", at))
+        prices = {name: max(floors[name], round(price * 0.95, 2)) for name, price in prices.items()}
+    return out, prices, at
+
+
+def generate(main, args) -> dict:
+    rng = random.Random(args.seed)
+    tables = {
+        name: model.__table__ for name, model in (
+            ("users", main.User), ("product_lists", main.ProductList), ("product_list_items", main.ProductListItem),
+            ("negotiation_sessions", main.NegotiationSession), ("wholesaler_negotiations", main.WholesalerNegotiation),
+            ("chat_messages", main.ChatMessage), ("offers", main.Offer), ("wholesaler_history", main.WholesalerHistory),
+            ("session_best_prices", main.SessionBestPrice),
+            ("wholesaler_profiles", main.WholesalerProfile), ("wholesaler_terms", main.WholesalerTerm),
+        )
+    }
+    hashed = main.get_password_hash(args.password)
+    catalog = sorted(CATALOG)
+    with main.SessionLocal() as db:
+        product_ids = main.resolve_product_ids(db, catalog)
+        db.commit()
+    started = time.perf_counter()
+
+    with main.engine.begin() as conn:
+        ids = {name: next_id(conn, table) for name, table in tables.items()}
+        batches = Batches(conn, args.batch_size)
+
+        # Users
+        retailers, wholesalers = [], []
+        for role, count, bucket in (("retailer", args.retailers, retailers), ("wholesaler", args.wholesalers, wholesalers)):
+            for i in range(count):
+                uid = ids["users"]
+                ids["users"] += 1
+                name = f"{args.prefix}-{role}-{uid}"
+                batches.add(tables["users"], {"id": uid, "username": name, "hashed_password": hashed, "role": role})
+                bucket.append((uid, name))
+        batches.flush()
+
+        # Capability profiles: a few catalog words (categories) and regions per profiled wholesaler
+        words = sorted(set().union(*(main.routing_words(name) for name in catalog)))
+        for uid, _ in wholesalers:
+            if rng.random() >= args.profiled_ratio:
+                continue
+            categories = rng.sample(words, rng.randint(1, min(3, len(words))))
+            batches.add(tables["wholesaler_profiles"], {
+                "id": ids["wholesaler_profiles"], "wholesaler_id": uid, "categories": json.dumps(categories), "skus": "[]",
+                "regions": json.dumps(rng.sample(REGIONS, rng.randint(1, 2))), "capacity": None, "updated_at": datetime.utcnow().isoformat(),
+            })
+            ids["wholesaler_profiles"] += 1
+            for word in categories:
+                batches.add(tables["wholesaler_terms"], {
+                    "id": ids["wholesaler_terms"], "term": f"w:{word}", "wholesaler_id": uid,
+                    "source": "profile", "weight": main.ROUTING_CATEGORY_WEIGHT,
+                })
+                ids["wholesaler_terms"] += 1
+        batches.flush()
+
+        clock = datetime.utcnow() - timedelta(days=args.days)
+        step = timedelta(days=args.days) / max(1, args.sessions)
+        for n in range(args.sessions):
+            clock += step
+            retailer_id, retailer_name = rng.choice(retailers)
+            products = [{"name": name, "quantity": rng.choice(QUANTITIES)} for name in rng.sample(catalog, rng.randint(2, min(5, len(catalog))))]
+            list_id, session_id = ids["product_lists"], ids["negotiation_sessions"]
+            ids["product_lists"] += 1
+            ids["negotiation_sessions"] += 1
+            batches.add(tables["product_lists"], {"id": list_id, "retailer_id": retailer_id, "products": json.dumps(products)})
+            for position, p in enumerate(products):
+                batches.add(tables["product_list_items"], {
+                    "id": ids["product_list_items"], "product_list_id": list_id, "position": position,
+                    "name": p["name"], "quantity": p["quantity"], "product_id": product_ids[p["name"]],
+                })
+                ids["product_list_items"] += 1
+            batches.add(tables["negotiation_sessions"], {
+                "id": session_id, "product_list_id": list_id, "created_at": clock.isoformat(),
+                "system_prompt": main.build_system_prompt(retailer_name, products),
+                "greeting": main.build_greeting(retailer_name, products),
+            })
+
+            best = {p["name"]: [] for p in products}
+            for wholesaler_id, wholesaler_name in rng.sample(wholesalers, min(args.per_session, len(wholesalers))):
+                finalized = rng.random() < args.finalized_ratio
+                floors = {p["name"]: round(CATALOG[p["name"]] * rng.uniform(0.82, 0.98), 2) for p in products}
+                transcript, prices, ended = chat_transcript(rng, floors, args.messages, clock, finalized)
+                for role, content, at in transcript:
+                    batches.add(tables["chat_messages"], {
+                        "id": ids["chat_messages"], "session_id": session_id, "wholesaler_id": wholesaler_id,
+                        "role": role, "content": content, "created_at": at.isoformat(),
+                    })
+                    ids["chat_messages"] += 1
+                batches.add(tables["wholesaler_negotiations"], {
+                    "id": ids["wholesaler_negotiations"], "session_id": session_id, "wholesaler_id": wholesaler_id,
+                    "status": "finalized" if finalized else "in_progress",
+                    "finalized_at": ended.isoformat() if finalized else None,
+                })
+                ids["wholesaler_negotiations"] += 1
+                if not finalized:
+                    continue
+                for name, price in prices.items():
+                    batches.add(tables["offers"], {
+                        "id": ids["offers"], "session_id": session_id, "wholesaler_id": wholesaler_id,
+                        "product_name": name, "product_id": product_ids[name], "price": price,
+                    })
+                    ids["offers"] += 1
+                    best[name].append((price, wholesaler_id, wholesaler_name))
+                batches.add(tables["wholesaler_history"], {
+                    "id": ids["wholesaler_history"], "session_id": session_id, "wholesaler_id": wholesaler_id,
+                    "retailer_id": retailer_id, "finalized_at": ended.isoformat(),
+                    "data": json.dumps({"currency": "INR", "items": [{"name": k, "final_price": v} for k, v in prices.items()]}),
+                })
+                ids["wholesaler_history"] += 1
+
+            for p in products:
+                bids = sorted(best[p["name"]])
+                top = bids[0] if bids else (None, None, None)
+                batches.add(tables["session_best_prices"], {
+                    "id": ids["session_best_prices"], "session_id": session_id, "product_name": p["name"],
+                    "quantity": p["quantity"], "best_price": top[0], "best_wholesaler_id": top[1], "best_wholesaler": top[2],
+                    "second_price": bids[1][0] if len(bids) > 1 else None, "offer_count": len(bids),
+                    "line_total": round(top[0] * p["quantity"], 2) if top[0] is not None else None,
+                })
+                ids["session_best_prices"] += 1
+
+            if (n + 1) % args.progress_every == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  {n + 1}/{args.sessions} sessions, {batches.counts.get('chat_messages', 0)} messages, {elapsed:.0f}s", flush=True)
+        batches.flush()
+        reset_sequences(conn, tables.values())
+
+    elapsed = time.perf_counter() - started
+    return {"elapsed_s": elapsed, "rows": batches.counts, "rows_per_s": sum(batches.counts.values()) / elapsed if elapsed else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic NegoKart data at scale")
+    parser.add_argument("--database-url", default=None, help="default: a fresh SQLite file in the temp dir")
+    parser.add_argument("--wholesalers", type=int, default=10000)
+    parser.add_argument("--retailers", type=int, default=1000)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--per-session", type=int, default=5, help="wholesalers negotiating in each session")
+    parser.add_argument("--messages", type=int, default=12, help="chat messages per negotiation")
+    parser.add_argument("--finalized-ratio", type=float, default=0.7)
+    parser.add_argument("--profiled-ratio", type=float, default=0.8, help="wholesalers with a capability profile")
+    parser.add_argument("--days", type=int, default=180, help="spread session timestamps over this many days")
+    parser.add_argument("--prefix", default="bench", help="username prefix for generated users")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per INSERT batch")
+    parser.add_argument("--progress-every", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", default=None, help="write row counts and timings to this file")
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        path = os.path.join(tempfile.gettempdir(), "negokart-bench.db")
+        if os.path.exists(path):
+            os.remove(path)
+        args.database_url = f"sqlite:///{path}"
+    # main reads its configuration at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("AUTO_MIGRATE", "0")
+    import main as app_main
+    import migrations
+
+    migrations.run_migrations(app_main.engine)
+    print(f"Generating into {app_main.engine.url.render_as_string(hide_password=True)}")
+    result = generate(app_main, args)
+    for name, count in sorted(result["rows"].items()):
+        print(f"  {name:<26} {count:>10}")
+    print(f"{sum(result['rows'].values())} rows in {result['elapsed_s']:.1f}s ({result['rows_per_s']:.0f} rows/s)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+End-to-end load test: replays retailer and wholesaler flows over HTTP and reports
+throughput and p50/p95/p99 latency per endpoint.
+
+Retailers submit product lists and poll their results until every simulated wholesaler
+has finalized. Wholesalers list their negotiations, load the chat, send quotes (scripted
+agents from simulator.py) until the AI finalizes, refresh the transcript incrementally
+and page their history.
+
+By default a uvicorn server and the simulator's stand-in LLM are started on free ports,
+so a run needs no network and no model:
+
+    python -m bench.load --duration 60 --retailers 5 --wholesalers 10
+    python -m bench.load --database-url sqlite:////tmp/negokart-bench.db   # after bench.datagen
+    python -m bench.load --base-url http://127.0.0.1:8000                   # already running server
+    python -m bench.load --json after.json --baseline before.json           # compare with an earlier run
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from simulator import CATALOG, STRATEGIES, make_agent, percentile  # noqa: E402
+
+from bench.compare import print_comparison  # noqa: E402
+from bench.startup import free_port  # noqa: E402
+
+
+class Recorder:
+    """Latency samples and status counts per endpoint label ("METHOD /route/{param}")"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, label: str, seconds: float, status):
+        self.latencies[label].append(seconds * 1000)
+        self.statuses[label][str(status)] += 1
+
+    async def request(self, client: httpx.AsyncClient, method: str, label: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.record(label, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.record(label, time.perf_counter() - started, response.status_code)
+        return response
+
+
+class LoadRun:
+    def __init__(self, args, client: httpx.AsyncClient):
+        self.args = args
+        self.client = client
+        self.recorder = Recorder()
+        self.rng = random.Random(args.seed)
+        self.deadline = None
+        self.retailer_ids = set()
+        self.sessions_submitted = 0
+        self.sessions_closed = 0
+        self.time_to_close = []
+        self.negotiations_finalized = 0
+        self.chat_turns = 0
+
+    def running(self) -> bool:
+        return time.perf_counter() < self.deadline
+
+    async def call(self, method: str, label: str, url: str, token: str | None = None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        return await self.recorder.request(self.client, method, label, url, headers=headers, **kwargs)
+
+    async def sign_in(self, username: str, role: str) -> tuple[int, str]:
+        password = self.args.password
+        await self.call("POST", "POST /register", "/register", json={"username": username, "password": password, "role": role})
+        response = await self.call("POST", "POST /login", "/login", data={"username": username, "password": password})
+        if response is None or response.status_code != 200:
+            raise RuntimeError(f"login failed for {username}: {response.status_code if response else 'no response'}")
+        token = response.json()["access_token"]
+        me = await self.call("GET", "GET /test-auth", "/test-auth", token)
+        return me.json()["user"]["id"] if me is not None and me.status_code == 200 else None, token
+
+    # -- retailer flow ------------------------------------------------------------------
+
+    async def retailer(self, token: str):
+        while self.running():
+            names = self.rng.sample(sorted(CATALOG), self.rng.randint(2, min(4, len(CATALOG))))
+            products = [{"name": name, "quantity": self.rng.choice((10, 25, 50, 100, 200))} for name in names]
+            response = await self.call("POST", "POST /retailer/products", "/retailer/products", token, json={"products": products})
+            if response is None or response.status_code != 200:
+                await asyncio.sleep(self.args.poll_interval)
+                continue
+            session_id = response.json()["session_id"]
+            # Sessions are routed to the best-matching wholesalers; the load users serve every SKU and rank first
+            expected = min(response.json().get("wholesalers", self.args.wholesalers), self.args.wholesalers)
+            self.sessions_submitted += 1
+            submitted = time.perf_counter()
+            while self.running():
+                await asyncio.sleep(self.args.poll_interval)
+                response = await self.call(
+                    "GET", "GET /retailer/negotiation_results", "/retailer/negotiation_results", token,
+                    params={"session_id": session_id},
+                )
+                if response is None or response.status_code != 200:
+                    continue
+                finalized = sum(1 for r in response.json().get("results", []) if r["status"] == "finalized")
+                if finalized >= expected:
+                    self.sessions_closed += 1
+                    self.time_to_close.append(time.perf_counter() - submitted)
+                    break
+            await asyncio.sleep(self.rng.uniform(0, self.args.think_time))
+
+    # -- wholesaler flow ----------------------------------------------------------------
+
+    async def send_turn(self, token: str, session_id: int, message: str) -> bool | None:
+        url = f"/wholesaler/chat/{session_id}"
+        if not self.args.stream:
+            response = await self.call("POST", "POST /wholesaler/chat/{session_id}", url, token, json={"message": message})
+            if response is None or response.status_code != 200:
+                return None
+            return response.json()["finalized"]
+        # Time the whole stream, from request to the "done" event
+        label = "POST /wholesaler/chat/{session_id}/stream"
+        started = time.perf_counter()
+        finalized, status = None, None
+        try:
+            async with self.client.stream("POST", url + "/stream", json={"message": message}, headers={"Authorization": f"Bearer {token}"}) as response:
+                status = response.status_code
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:") and event == "done":
+                        finalized = json.loads(line[5:])["finalized"]
+                    elif not line:
+                        event = None
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.recorder.record(label, time.perf_counter() - started, status)
+        return finalized
+
+    async def negotiate(self, token: str, negotiation: dict, rng: random.Random):
+        session_id = negotiation["session_id"]
+        chat_url = f"/wholesaler/chat/{session_id}"
+        response = await self.call("GET", "GET /wholesaler/chat/{session_id}", chat_url, token)
+        if response is None or response.status_code != 200:
+            return
+        last_id, etag = response.json()["last_id"], response.headers.get("etag")
+        agent = make_agent(self.args.strategy, negotiation["products"], rng)
+        for _ in range(self.args.max_turns):
+            if not self.running():
+                return
+            finalized = await self.send_turn(token, session_id, agent.message())
+            self.chat_turns += 1
+            # Incremental refresh, as the dashboard does after each turn
+            headers = {"If-None-Match": etag} if etag else {}
+            response = await self.call("GET", "GET /wholesaler/chat/{session_id}", chat_url, token, params={"after_id": last_id}, headers=headers)
+            if response is not None and response.status_code == 200:
+                last_id, etag = response.json()["last_id"], response.headers.get("etag")
+            if finalized:
+                self.negotiations_finalized += 1
+                return
+            await asyncio.sleep(rng.uniform(0, self.args.think_time))
+
+    async def wholesaler(self, token: str, index: int):
+        rng = random.Random(f"{self.args.seed}-{index}")
+        done = set()
+        while self.running():
+            pending, after = [], None
+            while True:
+                params = {"after": after} if after is not None else {}
+                response = await self.call("GET", "GET /wholesaler/negotiations", "/wholesaler/negotiations", token, params=params)
+                if response is None or response.status_code != 200:
+                    break
+                page = response.json()
+                pending.extend(
+                    n for n in page["negotiations"]
+                    if n["retailer_id"] in self.retailer_ids and n["session_id"] not in done
+                    and all(p["name"] in CATALOG for p in n["products"])
+                )
+                after = page.get("next_cursor")
+                if after is None:
+                    break
+            for negotiation in pending:
+                if not self.running():
+                    return
+                await self.negotiate(token, negotiation, rng)
+                done.add(negotiation["session_id"])
+            if not pending:
+                await self.call("GET", "GET /wholesaler/history", "/wholesaler/history", token, params={"summary": "true", "limit": 20})
+                await asyncio.sleep(self.args.poll_interval)
+
+    async def run(self) -> dict:
+        tag = f"{int(time.time()) % 1000000:06d}"
+        retailers = await asyncio.gather(*(self.sign_in(f"load-{tag}-r{i}", "retailer") for i in range(self.args.retailers)))
+        wholesalers = await asyncio.gather(*(self.sign_in(f"load-{tag}-w{i}", "wholesaler") for i in range(self.args.wholesalers)))
+        self.retailer_ids = {user_id for user_id, _ in retailers}
+        await asyncio.gather(*(
+            self.call("PUT", "PUT /wholesaler/profile", "/wholesaler/profile", token, json={"skus": sorted(CATALOG)})
+            for _, token in wholesalers
+        ))
+        # Sign-in (bcrypt) happens before the clock starts and is reported separately
+        setup, self.recorder = self.recorder, Recorder()
+
+        started = time.perf_counter()
+        self.deadline = started + self.args.duration
+        tasks = [asyncio.create_task(self.retailer(token)) for _, token in retailers]
+        tasks += [asyncio.create_task(self.wholesaler(token, i)) for i, (_, token) in enumerate(wholesalers)]
+        _, unfinished = await asyncio.wait(tasks, timeout=self.args.duration + self.args.drain)
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        report = self.report(self.recorder, elapsed)
+        report["sign_in"] = self.report(setup, None)["endpoints"]
+        return report
+
+    def report(self, recorder: Recorder, elapsed: float | None) -> dict:
+        endpoints = {}
+        for label, samples in sorted(recorder.latencies.items()):
+            statuses = recorder.statuses[label]
+            errors = sum(n for status, n in statuses.items() if not (status.isdigit() and int(status) < 400))
+            endpoints[label] = {
+                "count": len(samples),
+                "errors": errors,
+                "rps": len(samples) / elapsed if elapsed else None,
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+                "max_ms": max(samples),
+                "statuses": dict(statuses),
+            }
+        total = sum(e["count"] for e in endpoints.values())
+        return {
+            "meta": run_metadata(self.args),
+            "elapsed_s": elapsed,
+            "requests": total,
+            "throughput_rps": total / elapsed if elapsed else None,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "flows": {
+                "sessions_submitted": self.sessions_submitted,
+                "sessions_closed": self.sessions_closed,
+                "negotiations_finalized": self.negotiations_finalized,
+                "chat_turns": self.chat_turns,
+                "time_to_close_s": {
+                    "p50": percentile(self.time_to_close, 50),
+                    "p95": percentile(self.time_to_close, 95),
+                },
+            },
+            "endpoints": endpoints,
+        }
+
+
+def run_metadata(args) -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "started_at": datetime.utcnow().isoformat(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Server under test
+# ---------------------------------------------------------------------------
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float):
+    deadline = time.perf_counter() + timeout
+    with httpx.Client(timeout=0.5) as client:
+        while time.perf_counter() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{proc.args[2]} exited with status {proc.returncode}")
+            try:
+                client.get(url)
+                return
+            except httpx.TransportError:
+                time.sleep(0.05)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def start_stack(args) -> tuple[str, list]:
+    """Stand-in LLM plus a uvicorn server wired to it; returns the base URL and the processes"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    database_url = args.database_url
+    if database_url is None:
+        path = os.path.join(tempfile.gettempdir(), "negokart-load.db")
+        if os.path.exists(path):
+            os.remove(path)
+        database_url = f"sqlite:///{path}"
+    env["DATABASE_URL"] = database_url
+    subprocess.run([sys.executable, "migrations.py"], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+    procs = []
+    llm_port, app_port = free_port(), free_port()
+    procs.append(subprocess.Popen(
+        [sys.executable, "simulator.py", "--serve-llm", "--port", str(llm_port),
+         "--llm-latency-ms", str(args.llm_latency_ms), "--llm-jitter-ms", str(args.llm_jitter_ms)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    ))
+    wait_ready(f"http://127.0.0.1:{llm_port}/api/tags", procs[0], 30)
+    env.update({
+        "AUTO_MIGRATE": "0",
+        "LLM_PROVIDER": "",
+        "LLM_ROUTES": f"ollama:standin@http://127.0.0.1:{llm_port}",
+        "ACCESS_LOG_SAMPLE_RATE": env.get("ACCESS_LOG_SAMPLE_RATE", "0"),
+    })
+    procs.append(subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+    ))
+    base_url = f"http://127.0.0.1:{app_port}"
+    wait_ready(f"{base_url}/health", procs[1], 60)
+    return base_url, procs
+
+
+def print_report(report: dict):
+    meta = report["meta"]
+    print("=" * 96)
+    print(f"LOAD TEST  commit {meta['commit']}{' (dirty)' if meta['dirty'] else ''}  {meta['started_at']}")
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f}s: {report['throughput_rps']:.1f} req/s, {report['errors']} errors")
+    f = report["flows"]
+    close = f["time_to_close_s"]
+    print(f"Sessions submitted {f['sessions_submitted']}, closed {f['sessions_closed']}"
+          f" (time to close p50 {close['p50'] or 0:.2f}s, p95 {close['p95'] or 0:.2f}s);"
+          f" negotiations finalized {f['negotiations_finalized']}, chat turns {f['chat_turns']}")
+    print(f"{'endpoint':<46}{'count':>7}{'err':>5}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for label, e in report["endpoints"].items():
+        print(f"{label:<46}{e['count']:>7}{e['errors']:>5}{e['rps']:>8.1f}{e['p50_ms']:>9.1f}{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}{e['max_ms']:>9.1f}")
+
+
+async def run_load(args, base_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.retailers + args.wholesalers + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        return await LoadRun(args, client).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end NegoKart load test")
+    parser.add_argument("--base-url", default=None, help="test a running server instead of starting one")
+    parser.add_argument("--database-url", default=None, help="database for the started server (default: fresh SQLite file)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started server")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="stand-in LLM mean latency")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0, help="stand-in LLM latency std-dev")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    parser.add_argument("--drain", type=float, default=10.0, help="seconds to let in-flight flows finish")
+    parser.add_argument("--retailers", type=int, default=5, help="concurrent retailer users")
+    parser.add_argument("--wholesalers", type=int, default=10, help="concurrent wholesaler users")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="mixed", help="wholesaler quoting strategy")
+    parser.add_argument("--max-turns", type=int, default=12)
+    parser.add_argument("--stream", action="store_true", help="send chat turns through the streaming endpoint")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between result/negotiation polls")
+    parser.add_argument("--think-time", type=float, default=0.5, help="max random pause between user actions")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", default=None, help="write the report to this file")
+    parser.add_argument("--baseline", default=None, help="earlier report to compare against")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    procs = []
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            base_url, procs = start_stack(args)
+        report = asyncio.run(run_load(args, base_url))
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            proc.wait()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print_comparison(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Cold-start benchmark: time from launching a uvicorn worker to its first successful /health.
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --database-url postgresql://...  # against a migrated Postgres
+
+Also reports the bare `import main` time, which every worker process pays.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_import(env: dict) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def time_first_health(env: dict, timeout: float) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    # One client for all polls: building a client per attempt costs more than the poll interval
+    client = httpx.Client(timeout=0.5)
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {proc.returncode}")
+            try:
+                if client.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"/health not ready after {timeout}s")
+    finally:
+        client.close()
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold-start time to first /health")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", default=None, help="default: a pre-migrated temporary SQLite file")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    else:
+        # Simulate a deployed worker: schema already migrated, no auto-migration at startup
+        path = os.path.join(tempfile.gettempdir(), "negokart-startup-bench.db")
+        if os.path.exists(path):
+            os.remove(path)
+        env["DATABASE_URL"] = f"sqlite:///{path}"
+        subprocess.run([sys.executable, "migrations.py"], cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+    env.setdefault("AUTO_MIGRATE", "0")
+
+    imports = [time_import(env) for _ in range(args.runs)]
+    health = [time_first_health(env, args.timeout) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "import_s": {"median": statistics.median(imports), "min": min(imports), "max": max(imports)},
+        "first_health_s": {"median": statistics.median(health), "min": min(health), "max": max(health)},
+    }
+    print(f"import main:       median {result['import_s']['median']:.3f}s  (min {result['import_s']['min']:.3f}s, max {result['import_s']['max']:.3f}s)")
+    print(f"first /health 200: median {result['first_health_s']['median']:.3f}s  (min {result['first_health_s']['min']:.3f}s, max {result['first_health_s']['max']:.3f}s)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
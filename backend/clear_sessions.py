@@ -4,10 +4,14 @@ cur = conn.cursor()
 cur.executescript('''
 PRAGMA foreign_keys=OFF;
 DELETE FROM offers;
+DELETE FROM session_best_prices;
 DELETE FROM chat_messages;
+DELETE FROM chat_summaries;
+DELETE FROM chat_archives;
 DELETE FROM wholesaler_negotiations;
 DELETE FROM wholesaler_history;
 DELETE FROM negotiation_sessions;
+DELETE FROM product_list_items;
 DELETE FROM product_lists;
 VACUUM;
 ''')
@@ -1,11 +1,15 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.routing import Match
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Float, text
+from sqlalchemy import create_engine, Column, Integer, String, LargeBinary, ForeignKey, Float, Index, text, insert, select, literal, bindparam, event, or_, and_, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from jose import JWTError, jwt
 import os
 from typing import List
@@ -14,13 +18,27 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from fastapi import Header
 import random
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
 from fastapi import Body
-from datetime import datetime
+from fastapi import Request
+from datetime import datetime, timedelta
 import json
+import csv
+import codecs
 import httpx
 import re
 import logging
+import importlib.util
+import asyncio
+from contextlib import asynccontextmanager, aclosing
+from dataclasses import dataclass, field
+from contextvars import ContextVar
+from types import SimpleNamespace
+import threading
+import time
+import hashlib
+import zlib
+import sqlite3
 
 # Setup logging first
 logging.basicConfig(level=logging.INFO)
@@ -49,85 +67,95 @@ else:
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async engine for async endpoints (aiosqlite for SQLite, psycopg's async mode for Postgres),
+# so chat turns don't block the event loop on database I/O
+def async_database_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    return url
+
+async_engine = create_async_engine(async_database_url(DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Metrics (see metrics.py; served at /metrics)
+from metrics import REGISTRY
+
+# Per-request counters, set by the request middleware and updated by the query hooks below.
+# Context variables follow the request into threadpool workers and AsyncSession.run_sync.
+@dataclass
+class RequestStats:
+    db_queries: int = 0
+    db_seconds: float = 0.0
+
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "negokart_db_query_duration_seconds", "Duration of individual SQL statements", ("engine",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Helper: time every statement executed through an engine ("sync" or "async")
+def attach_query_timing(target, label: str):
+    @event.listens_for(target, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY_SECONDS.observe(elapsed, engine=label)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_seconds += elapsed
+
+attach_query_timing(engine, "sync")
+attach_query_timing(async_engine.sync_engine, "async")
+
 # JWT config
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 
-# Password hashing - use a more reliable approach
-import hashlib
-import secrets
+# Password hashing runs in a dedicated, size-limited process pool (see passwords.py)
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from passwords import get_password_hash, verify_and_rehash
 
-# Simple but secure password hashing for production
-def simple_hash_password(password: str) -> str:
-    """Create a secure hash of the password"""
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-    return f"{salt}:{password_hash.hex()}"
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "16"))  # running + queued hash jobs
+HASH_ADMISSION_TIMEOUT = float(os.getenv("HASH_ADMISSION_TIMEOUT", "2"))
 
-def simple_verify_password(password: str, hashed: str) -> bool:
-    """Verify a password against its hash"""
-    try:
-        salt, stored_hash = hashed.split(':')
-        password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-        return password_hash.hex() == stored_hash
-    except:
-        return False
+class HashingPool:
+    """Process pool for password hashing with admission control: callers wait at most
+    HASH_ADMISSION_TIMEOUT for a slot and get a 503 instead of piling up behind a login burst."""
 
-# Try to use bcrypt if available, otherwise fall back to simple hashing
-try:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    # Test bcrypt to see if it works
-    test_hash = pwd_context.hash("test")
-    USE_BCRYPT = True
-    logger.info("Using bcrypt for password hashing")
-except Exception as e:
-    logger.warning(f"bcrypt not available, using fallback hashing: {e}")
-    USE_BCRYPT = False
-
-def get_password_hash(password: str) -> str:
-    """Hash a password using the best available method"""
-    try:
-        if not isinstance(password, str):
-            password = str(password)
-        
-        if USE_BCRYPT:
-            # Use bcrypt if available
-            password_bytes = password.encode('utf-8')
-            if len(password_bytes) > 72:
-                password_bytes = password_bytes[:72]
-                password = password_bytes.decode('utf-8', errors='ignore')
-            return pwd_context.hash(password)
-        else:
-            # Use fallback hashing
-            return simple_hash_password(password)
-    except Exception as e:
-        logger.error(f"Error hashing password: {e}")
-        # Final fallback
-        return simple_hash_password(password)
+    def __init__(self, workers: int, max_pending: int, admission_timeout: float):
+        self.workers = workers
+        self.admission_timeout = admission_timeout
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor: ProcessPoolExecutor | None = None
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    try:
-        if not isinstance(plain_password, str):
-            plain_password = str(plain_password)
-        
-        if USE_BCRYPT and not hashed_password.startswith(':'):
-            # Try bcrypt first if the hash looks like bcrypt
-            try:
-                password_bytes = plain_password.encode('utf-8')
-                if len(password_bytes) > 72:
-                    password_bytes = password_bytes[:72]
-                    plain_password = password_bytes.decode('utf-8', errors='ignore')
-                return pwd_context.verify(plain_password, hashed_password)
-            except Exception:
-                pass
-        
-        # Try fallback hash verification
-        return simple_verify_password(plain_password, hashed_password)
-            
-    except Exception as e:
-        logger.error(f"Error verifying password: {e}")
-        return False
+    async def run(self, fn, *args):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.admission_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Password hashing pool saturated, rejecting request")
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+        try:
+            if self._executor is None:
+                # Spawned, not forked: a child forked while another thread holds OpenSSL's lock
+                # deadlocks in pbkdf2/bcrypt and the login never returns
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+hashing_pool = HashingPool(HASH_POOL_WORKERS, HASH_MAX_PENDING, HASH_ADMISSION_TIMEOUT)
 
 # User model
 class User(Base):
@@ -149,8 +177,49 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1" if DATABASE_URL.startswith("sqlite") else "0").lower() in ("1", "true", "yes")
+
+# Warm the async connection pool in the background and flag an unmigrated database
+async def check_schema_version():
+    import migrations
+    try:
+        async with async_engine.connect() as conn:
+            version = (await conn.execute(text("SELECT MAX(version) FROM schema_migrations"))).scalar()
+        if (version or 0) < migrations.LATEST_VERSION:
+            logger.error("Database schema is at version %s, expected %s: run `python migrations.py`", version, migrations.LATEST_VERSION)
+    except Exception as e:
+        logger.error("Database schema check failed (run `python migrations.py`?): %s", e)
+
+# App lifetime: migrate/check the database, open pooled LLM clients; close them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes run as a separate step (python migrations.py); by default only the
+    # local SQLite database is migrated here, so workers never do DDL at import or per request
+    if AUTO_MIGRATE:
+        import migrations
+        await asyncio.to_thread(migrations.run_migrations, engine)
+        warmup = None
+    else:
+        warmup = asyncio.create_task(check_schema_version())
+    # Open pooled LLM clients in the background so /health is served immediately
+    llm_warmup = asyncio.create_task(asyncio.to_thread(llm_clients.open, sorted({r.provider for r in llm_router.routes} - {"ollama"})))
+    results_broker.bind(asyncio.get_running_loop())
+    compaction = asyncio.create_task(compaction_loop()) if COMPACTION_INTERVAL_SECONDS > 0 else None
+    try:
+        yield
+    finally:
+        if warmup is not None:
+            warmup.cancel()
+        if compaction is not None:
+            compaction.cancel()
+        await asyncio.gather(llm_warmup, return_exceptions=True)
+        await llm_clients.aclose()
+        await async_engine.dispose()
+        hashing_pool.shutdown()
+        llm_response_cache.close()
+
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 allowed_origins = [
@@ -175,16 +244,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # read by the chat client to send If-None-Match
 )
 
-# Add request logging middleware for debugging
+# Request metrics and sampled access logging
+# Every request feeds the per-route histograms; only a sample (plus every 5xx and slow
+# request) is written to the "negokart.access" log as one JSON line. Streaming responses
+# are timed to their first byte.
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.05"))
+ACCESS_LOG_SLOW_MS = float(os.getenv("ACCESS_LOG_SLOW_MS", "1000"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # when set, /metrics requires "Authorization: Bearer <token>"
+access_logger = logging.getLogger("negokart.access")
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "negokart_http_request_duration_seconds", "Request latency by route template", ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("negokart_http_requests_in_flight", "Requests currently being handled", ("method", "route"))
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "negokart_db_queries_per_request", "SQL statements executed per request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_SECONDS_PER_REQUEST = REGISTRY.histogram("negokart_db_seconds_per_request", "Time spent in SQL per request", ("route",))
+
+# Helper: route template for a request ("/wholesaler/chat/{session_id}"), keeping label values bounded
+def route_template(scope) -> str:
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
 @app.middleware("http")
-async def log_requests(request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
-    logger.info(f"Origin: {request.headers.get('origin', 'No origin header')}")
-    response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
-    return response
+async def observe_requests(request, call_next):
+    method = request.method
+    route = route_template(request.scope)
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    status_code = 500
+    started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc(method=method, route=route)
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        HTTP_IN_FLIGHT.dec(method=method, route=route)
+        request_stats.reset(token)
+        HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status_code)
+        DB_QUERIES_PER_REQUEST.observe(stats.db_queries, route=route)
+        DB_SECONDS_PER_REQUEST.observe(stats.db_seconds, route=route)
+        if status_code >= 500 or elapsed * 1000 >= ACCESS_LOG_SLOW_MS or random.random() < ACCESS_LOG_SAMPLE_RATE:
+            access_logger.info(json.dumps({
+                "method": method,
+                "path": request.url.path,
+                "route": route,
+                "status": status_code,
+                "duration_ms": round(elapsed * 1000, 2),
+                "db_queries": stats.db_queries,
+                "db_ms": round(stats.db_seconds * 1000, 2),
+                "origin": request.headers.get("origin"),
+            }))
 
 def get_db():
     db = SessionLocal()
@@ -193,9 +313,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Registration endpoint
 @app.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     try:
         # Validate input
         if not user.username or len(user.username.strip()) < 3:
@@ -208,20 +332,19 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Role must be either 'retailer' or 'wholesaler'")
         
         # Check if user already exists
-        db_user = db.query(User).filter(User.username == user.username).first()
+        db_user = (await db.execute(select(User).where(User.username == user.username))).scalars().first()
         if db_user:
             raise HTTPException(status_code=400, detail="Username already registered")
         
         # Hash password and create user
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await hashing_pool.run(get_password_hash, user.password)
         db_user = User(
             username=user.username.strip(), 
             hashed_password=hashed_password, 
             role=user.role
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
         
         logger.info(f"User registered successfully: {user.username}")
         return {"message": "User registered successfully", "user_id": db_user.id}
@@ -230,28 +353,32 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         raise
     except Exception as e:
         logger.error(f"Registration error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Registration failed")
 
 # Login endpoint
 @app.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     try:
         # Validate input
         if not form_data.username or not form_data.password:
             raise HTTPException(status_code=400, detail="Username and password are required")
         
         # Find user
-        user = db.query(User).filter(User.username == form_data.username).first()
+        user = (await db.execute(select(User).where(User.username == form_data.username))).scalars().first()
         if not user:
             logger.warning(f"Login attempt with non-existent username: {form_data.username}")
             raise HTTPException(status_code=401, detail="Incorrect username or password")
         
-        # Verify password
-        password_valid = verify_password(form_data.password, user.hashed_password)
+        # Verify password (and get an upgraded hash if the stored one uses an older scheme)
+        password_valid, new_hash = await hashing_pool.run(verify_and_rehash, form_data.password, user.hashed_password)
         if not password_valid:
             logger.warning(f"Invalid password attempt for user: {form_data.username}")
             raise HTTPException(status_code=401, detail="Incorrect username or password")
+        if new_hash:
+            user.hashed_password = new_hash
+            await db.commit()
+            logger.info(f"Upgraded password hash for user: {user.username}")
             
         # Generate JWT token
         token_data = {
@@ -275,6 +402,12 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 def read_root():
     return {"message": "Hello, AI Negotiator Backend!"}
 
+@app.get("/metrics")
+def metrics_endpoint(authorization: str | None = Header(default=None)):
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
     logger.info("Health check endpoint accessed")
@@ -283,7 +416,9 @@ def health_check():
         "status": "healthy", 
         "message": "Backend is running", 
         "database_type": db_type,
-        "database_url": DATABASE_URL[:20] + "..." if DATABASE_URL else "SQLite"
+        "database_url": DATABASE_URL[:20] + "..." if DATABASE_URL else "SQLite",
+        "llm_cache": llm_response_cache.stats(),
+        "llm_routes": llm_router.snapshot(),
     }
 
 
@@ -292,7 +427,43 @@ class ProductList(Base):
     __tablename__ = "product_lists"
     id = Column(Integer, primary_key=True, index=True)
     retailer_id = Column(Integer)
-    products = Column(String)  
+    products = Column(String)  # JSON copy kept for compatibility; readers use product_list_items
+
+# One row per requested product
+class ProductListItem(Base):
+    __tablename__ = "product_list_items"
+    id = Column(Integer, primary_key=True, index=True)
+    product_list_id = Column(Integer, ForeignKey("product_lists.id"), index=True)
+    position = Column(Integer)
+    name = Column(String)
+    quantity = Column(Integer)
+    product_id = Column(Integer, nullable=True)  # canonical product, see resolve_product_ids
+
+# Canonical product identity
+# Every spelling seen in a list, offer or price book is an alias of one canonical product; the
+# grams table is an inverted index of each product's key trigrams used to match new spellings.
+class Product(Base):
+    __tablename__ = "products"
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True)  # product_key() of the first spelling
+    name = Column(String)  # first spelling seen, for display
+    gram_count = Column(Integer, default=0)
+    created_at = Column(String, nullable=True, default=lambda: datetime.utcnow().isoformat())
+
+class ProductAlias(Base):
+    __tablename__ = "product_aliases"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True)  # exact spelling as written
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
+
+class ProductGram(Base):
+    __tablename__ = "product_grams"
+    id = Column(Integer, primary_key=True, index=True)
+    gram = Column(String)
+    product_id = Column(Integer, ForeignKey("products.id"))
+    __table_args__ = (
+        Index("ux_product_grams_gram_product", "gram", "product_id", unique=True),
+    )
 
 # Database tables will be created at the end of the file
 
@@ -302,20 +473,32 @@ class ProductItem(BaseModel):
 
 class ProductListRequest(BaseModel):
     products: List[ProductItem]
+    region: str | None = None  # only wholesalers serving this region (or every region) are routed
 
 # Negotiation session and offer models
 class NegotiationSession(Base):
     __tablename__ = "negotiation_sessions"
     id = Column(Integer, primary_key=True, index=True)
     product_list_id = Column(Integer, ForeignKey("product_lists.id"))
+    # Shared by every wholesaler in the session (older sessions keep per-wholesaler ChatMessage copies)
+    system_prompt = Column(String, nullable=True)
+    greeting = Column(String, nullable=True)
+    created_at = Column(String, nullable=True, default=lambda: datetime.utcnow().isoformat())
+    # Items per negotiation chunk for long lists (None: the whole list is negotiated at once)
+    chunk_size = Column(Integer, nullable=True)
 
 class Offer(Base):
     __tablename__ = "offers"
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("negotiation_sessions.id"))
     wholesaler_id = Column(Integer)
-    product_name = Column(String)
+    product_name = Column(String)  # the session's spelling when the product was requested
+    product_id = Column(Integer, nullable=True)
     price = Column(Float)
+    __table_args__ = (
+        # One price per product per wholesaler per session; target of the upsert in upsert_offers
+        Index("ux_offers_session_wholesaler_product", "session_id", "wholesaler_id", "product_name", unique=True),
+    )
 
 # Per-wholesaler negotiation status
 class WholesalerNegotiation(Base):
@@ -325,6 +508,15 @@ class WholesalerNegotiation(Base):
     wholesaler_id = Column(Integer, index=True)
     status = Column(String, default="in_progress")  
     finalized_at = Column(String, nullable=True)
+    chunk_index = Column(Integer, default=0)  # chunk of a chunked session being negotiated
+    chunk_message_id = Column(Integer, nullable=True)  # assistant message that opened that chunk
+    archived_at = Column(String, nullable=True)  # when compaction moved the transcript to chat_archives
+    __table_args__ = (
+        # Serves the wholesaler's active-negotiation listing (filter + keyset order)
+        Index("ix_wholesaler_negotiations_wholesaler_status_session", "wholesaler_id", "status", "session_id"),
+        # Serves the compaction scan for finalized, not yet archived conversations
+        Index("ix_wholesaler_negotiations_status_archived_finalized", "status", "archived_at", "finalized_at"),
+    )
 
 # Archived history per wholesaler after finalization
 class WholesalerHistory(Base):
@@ -335,6 +527,10 @@ class WholesalerHistory(Base):
     retailer_id = Column(Integer, index=True)
     finalized_at = Column(String)
     data = Column(String)  
+    __table_args__ = (
+        # Serves the wholesaler's history listing newest-first (filter + keyset order)
+        Index("ix_wholesaler_history_wholesaler_finalized", wholesaler_id, finalized_at.desc(), id.desc()),
+    )
 
 # Chat message model for AI ↔ wholesaler conversation
 class ChatMessage(Base):
@@ -345,13 +541,163 @@ class ChatMessage(Base):
     role = Column(String)  
     content = Column(String)
     created_at = Column(String, default=lambda: datetime.utcnow().isoformat())
+    __table_args__ = (
+        # Serves transcript reads and after_id cursors for one (session, wholesaler) conversation
+        Index("ix_chat_messages_session_wholesaler_id", "session_id", "wholesaler_id", "id"),
+    )
+
+# Rolling summary of older chat turns per (session, wholesaler), updated incrementally
+class ChatSummary(Base):
+    __tablename__ = "chat_summaries"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer)
+    wholesaler_id = Column(Integer)
+    summary = Column(String, default="")  # one condensed line per folded message
+    summarized_through_id = Column(Integer, default=0)  # last ChatMessage.id folded into summary
+    price_state = Column(String, default="{}")  # {"product": {"wholesaler": price, "agent": price}}
+    updated_at = Column(String, nullable=True)
+    __table_args__ = (
+        Index("ux_chat_summaries_session_wholesaler", "session_id", "wholesaler_id", unique=True),
+    )
+
+# Transcript of a finalized (session, wholesaler) conversation, moved out of chat_messages by compaction
+class ChatArchive(Base):
+    __tablename__ = "chat_archives"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer)
+    wholesaler_id = Column(Integer)
+    message_count = Column(Integer, default=0)
+    last_message_id = Column(Integer, default=0)  # last ChatMessage.id folded into transcript
+    transcript = Column(LargeBinary)  # zlib-compressed JSON list of {id, role, content, created_at}
+    archived_at = Column(String, nullable=True)
+    __table_args__ = (
+        Index("ux_chat_archives_session_wholesaler", "session_id", "wholesaler_id", unique=True),
+    )
+
+# Best price per requested product per session, maintained on every offer write (see upsert_offers)
+# so retailer result reads are one indexed scan of this table, however many wholesalers bid
+class SessionBestPrice(Base):
+    __tablename__ = "session_best_prices"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer)
+    product_name = Column(String)
+    quantity = Column(Integer, nullable=True)  # None for products offered but not requested
+    best_price = Column(Float, nullable=True)
+    best_wholesaler_id = Column(Integer, nullable=True)
+    best_wholesaler = Column(String, nullable=True)  # username, denormalized for join-free reads
+    second_price = Column(Float, nullable=True)
+    offer_count = Column(Integer, default=0)
+    line_total = Column(Float, nullable=True)  # best_price * quantity
+    __table_args__ = (
+        Index("ux_session_best_prices_session_product", "session_id", "product_name", unique=True),
+    )
+
+# Standing per-wholesaler prices, one row per product and quantity tier, used to prefill offers
+# on new sessions. normalized_name is what session products are matched on.
+class PriceBookEntry(Base):
+    __tablename__ = "price_book_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    wholesaler_id = Column(Integer)
+    product_name = Column(String)  # as uploaded, for display
+    normalized_name = Column(String)
+    product_id = Column(Integer, nullable=True)
+    min_quantity = Column(Integer, default=1)  # tier applies to orders of at least this many units
+    price = Column(Float)
+    moq = Column(Integer, nullable=True)
+    currency = Column(String, default="INR")
+    updated_at = Column(String, nullable=True)
+    __table_args__ = (
+        # Upsert target for uploads
+        Index("ux_price_book_entries_wholesaler_name_tier", "wholesaler_id", "normalized_name", "min_quantity", unique=True),
+        # Serves prefill: every wholesaler's tiers for a session's products
+        Index("ix_price_book_entries_product_wholesaler", "product_id", "wholesaler_id", "min_quantity"),
+    )
+
+# Wholesaler capability profile, used to route new sessions (see route_wholesalers)
+class WholesalerProfile(Base):
+    __tablename__ = "wholesaler_profiles"
+    id = Column(Integer, primary_key=True, index=True)
+    wholesaler_id = Column(Integer, unique=True)
+    categories = Column(String, default="[]")  # JSON list of product words served, e.g. "rice"
+    skus = Column(String, default="[]")  # JSON list of product names served
+    regions = Column(String, default="[]")  # JSON list; empty = every region
+    capacity = Column(Integer, nullable=True)  # max active negotiations; None = unlimited
+    updated_at = Column(String, nullable=True)
+
+# Inverted routing index: term ("p:<product id>" or "w:<word>") -> wholesalers serving it.
+# Rebuilt per wholesaler and source when their profile or price book changes.
+class WholesalerTerm(Base):
+    __tablename__ = "wholesaler_terms"
+    id = Column(Integer, primary_key=True, index=True)
+    term = Column(String)
+    wholesaler_id = Column(Integer)
+    source = Column(String)  # "profile" | "price_book"
+    weight = Column(Float, default=1.0)
+    __table_args__ = (
+        Index("ux_wholesaler_terms_term_wholesaler_source", "term", "wholesaler_id", "source", unique=True),
+        Index("ix_wholesaler_terms_wholesaler_source", "wholesaler_id", "source"),
+    )
 
 # Database tables will be created at the end of the file
 
 # Helper to get current user from JWT
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Authenticated principal: the user fields endpoints rely on, detached from any DB session
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    role: str
+
+# Bounded TTL + LRU cache of principals by user id, so authenticated requests skip the users query.
+# Entries are invalidated only by ORM changes made in this process: other workers or instances, and
+# Core/raw `UPDATE users` statements, are not seen, so a role change or deleted user can keep
+# authenticating there for up to AUTH_CACHE_TTL_SECONDS. Keep the TTL short (0 disables the cache).
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, Principal]] = OrderedDict()
+        self._lock = threading.Lock()  # sync endpoints resolve users from the threadpool
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return principal
+
+    def put(self, principal: Principal):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+principal_cache = PrincipalCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+
+# Any ORM change to a user (password, role, deletion) drops its cached principal in this process
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_cached_principal(mapper, connection, target):
+    principal_cache.invalidate(target.id)
+
+def decode_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -364,13 +710,38 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    return payload
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    payload = decode_token(token)
+    username = payload["sub"]
+    user_id = payload.get("user_id")
+    if user_id is not None:
+        cached = principal_cache.get(user_id)
+        if cached is not None and cached.username == username:
+            return cached
     user = db.query(User).filter(User.username == username).first()
     if user is None:
-        raise credentials_exception
-    return user
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    principal = Principal(id=user.id, username=user.username, role=user.role)
+    principal_cache.put(principal)
+    return principal
+
+# Claims-only verification for read-only endpoints: trusts the signed token's user_id/role
+# without a database lookup (role changes apply once the token is reissued)
+def get_token_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    payload = decode_token(token)
+    if payload.get("user_id") is None or payload.get("role") is None:
+        # Tokens without the full claim set still go through the user lookup
+        return get_current_user(token, db)
+    return Principal(id=payload["user_id"], username=payload["sub"], role=payload["role"])
 
 @app.get("/test-auth")
-def test_auth(current_user: User = Depends(get_current_user)):
+def test_auth(current_user: Principal = Depends(get_current_user)):
     """Test endpoint to verify authentication is working"""
     return {
         "message": "Authentication successful",
@@ -413,88 +784,943 @@ DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "").lower()  # "openai" | "groq" | "deepseek"
 LLM_MODEL = os.getenv("LLM_MODEL", "")  # optional override
 
+# Negotiation chunks
+# Lists longer than NEGOTIATION_CHUNK_SIZE are negotiated a chunk of items at a time: prompts and
+# greetings name only the current chunk, and agreeing on a chunk opens the next one in the same chat.
+NEGOTIATION_CHUNK_SIZE = int(os.getenv("NEGOTIATION_CHUNK_SIZE", "25"))  # 0 disables chunking
+
+@dataclass
+class NegotiationChunk:
+    index: int  # 0-based
+    count: int  # chunks in the session
+    total: int  # products in the session
+    items: list  # [{"name", "quantity"}] in list order
+    started_after: int = 0  # id of the assistant message that opened this chunk
+
+    @property
+    def chunked(self) -> bool:
+        return self.count > 1
+
+def chunk_count(total: int, chunk_size: int | None) -> int:
+    return max(1, -(-total // chunk_size)) if chunk_size else 1
+
 # Helper: build system prompt from context
-def build_system_prompt(retailer_username: str, products: list[dict]):
+def build_system_prompt(retailer_username: str, products: list[dict], chunk: NegotiationChunk | None = None):
     product_lines = "\n".join([f"- {p['name']} x {p['quantity']}" for p in products])
+    if chunk and chunk.chunked:
+        heading = f"Requested products (batch {chunk.index + 1} of {chunk.count}; {chunk.total} products in the order, negotiated one batch at a time):"
+        scope = "- The FINAL_JSON covers only the products in this batch; the next batch follows once it is agreed\n"
+    else:
+        heading, scope = "Requested products:", ""
     return (
         "You are an expert B2B purchasing agent negotiating on behalf of a retailer. "
         "Be concise, professional, and aim to get the best all-in price per product. "
         "Ask for per-unit prices, bulk discounts, MOQs, and confirm currency. Use short messages (2-4 sentences).\n\n"
-        f"Retailer: {retailer_username}\nRequested products:\n{product_lines}\n\n"
+        f"Retailer: {retailer_username}\n{heading}\n{product_lines}\n\n"
         "Negotiation rules:\n"
         "- Start by greeting and requesting their BEST FINAL per-unit price for each item\n"
         "- If prices seem high, propose reasonable counter-offers leveraging quantities\n"
         "- Once final agreement is reached for ALL items, OUTPUT A SINGLE JSON BLOCK between markers like this exactly:\n"
         "<FINAL_JSON> {\n  \"currency\": \"INR\",\n  \"items\": [{\"name\": \"ITEM_NAME\", \"final_price\": 123.45}]\n} </FINAL_JSON>\n"
+        + scope +
         "- Do not include any commentary inside the JSON markers.\n"
     )
 
-# Helper: call hosted LLMs (if configured) or local Ollama, else fallback
-async def generate_ai_reply(messages: list[dict]) -> str:
-    try:
-        logger.info("LLM selection provider=%s model=%s", LLM_PROVIDER or "", LLM_MODEL or "")
-        async with httpx.AsyncClient(timeout=60) as client:
-            # OpenAI
-            if LLM_PROVIDER == "openai" and OPENAI_API_KEY:
-                url = "https://api.openai.com/v1/chat/completions"
-                model = LLM_MODEL or "gpt-4o-mini"
-                payload = {"model": model, "messages": messages, "temperature": 0.2}
-                headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
-                r = await client.post(url, json=payload, headers=headers)
-                r.raise_for_status()
-                data = r.json()
-                logger.info("OpenAI ok status=%s", r.status_code)
-                return (data.get("choices", [{}])[0].get("message", {}) or {}).get("content", "") or ""
-
-            # Groq (OpenAI-compatible)
-            if LLM_PROVIDER == "groq" and GROQ_API_KEY:
-                url = "https://api.groq.com/openai/v1/chat/completions"
-                model = LLM_MODEL or "llama-3.1-70b-versatile"
-                payload = {"model": model, "messages": messages, "temperature": 0.2}
-                headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-                r = await client.post(url, json=payload, headers=headers)
-                r.raise_for_status()
-                data = r.json()
-                logger.info("Groq ok status=%s", r.status_code)
-                return (data.get("choices", [{}])[0].get("message", {}) or {}).get("content", "") or ""
-
-            # DeepSeek (OpenAI-style)
-            if LLM_PROVIDER == "deepseek" and DEEPSEEK_API_KEY:
-                url = "https://api.deepseek.com/chat/completions"
-                model = LLM_MODEL or "deepseek-chat"
-                payload = {"model": model, "messages": messages, "temperature": 0.2}
-                headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}
-                r = await client.post(url, json=payload, headers=headers)
-                r.raise_for_status()
-                data = r.json()
-                logger.info("DeepSeek ok status=%s", r.status_code)
-                return (data.get("choices", [{}])[0].get("message", {}) or {}).get("content", "") or ""
-
-            # Ollama (local) as a best-effort if configured/reachable
+# Pooled HTTP clients for LLM providers
+# One keep-alive client per provider for the lifetime of the app, so chat turns
+# reuse open TCP/TLS connections instead of handshaking on every request.
+LLM_PROVIDER_URLS = {
+    "openai": "https://api.openai.com/v1/chat/completions",
+    "groq": "https://api.groq.com/openai/v1/chat/completions",
+    "deepseek": "https://api.deepseek.com/chat/completions",
+}
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# HTTP/2 needs the optional "h2" package (httpx[http2]); fall back to HTTP/1.1 without it
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") not in ("0", "false", "no") and importlib.util.find_spec("h2") is not None
+
+class LLMClientRegistry:
+    """Holds one pooled httpx.AsyncClient per LLM provider."""
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()  # clients may be built from the startup warm-up thread
+
+    def _build(self, provider: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+        # Hosted providers speak HTTP/2 over TLS; Ollama is plain HTTP/1.1 on localhost
+        http2 = LLM_HTTP2 and provider in LLM_PROVIDER_URLS
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+    def open(self, providers: list[str]):
+        # Building a client loads TLS configuration (~100ms), so startup runs this off the event loop
+        for provider in list(providers) + ["ollama"]:
+            self.get(provider)
+        logger.info("LLM clients ready providers=%s http2=%s", sorted(self._clients), LLM_HTTP2)
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._clients.get(provider)
+                if client is None or client.is_closed:
+                    client = self._build(provider)
+                    self._clients[provider] = client
+        return client
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning("Error closing LLM client: %s", str(e))
+
+llm_clients = LLMClientRegistry()
+
+# Content-addressed cache of LLM replies
+# Identical prompts (repeated opening turns, client retries, duplicate submissions) are answered
+# from memory, or from an optional SQLite file shared by workers on the same host. Concurrent
+# identical requests wait on a single upstream call (single-flight).
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1000"))  # 0 disables the cache
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")  # e.g. /tmp/negokart-llm-cache.db; empty = memory only
+
+# Helper: whitespace-insensitive cache key for a prompt sent to the given routes ("provider:model,...") and temperature
+def llm_cache_key(routes: str, temperature, messages: list[dict]) -> str:
+    normalized = [
+        {"role": m.get("role", ""), "content": " ".join(str(m.get("content") or "").split())}
+        for m in messages
+    ]
+    raw = json.dumps([routes, temperature, normalized], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    def __init__(self, maxsize: int, ttl: float, path: str = ""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.counters = {"hits_memory": 0, "hits_sqlite": 0, "coalesced": 0, "misses": 0, "stores": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def _memory_get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, reply = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return reply
+
+    def _memory_put(self, key: str, reply: str, expires_at: float):
+        self._entries[key] = (expires_at, reply)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _sqlite(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _sqlite_get(self, key: str):
+        with self._db_lock:
+            row = self._sqlite().execute(
+                "SELECT reply, expires_at FROM llm_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row
+
+    def _sqlite_put(self, key: str, reply: str, expires_at: float):
+        with self._db_lock:
+            db = self._sqlite()
+            db.execute("INSERT OR REPLACE INTO llm_cache (key, reply, expires_at) VALUES (?, ?, ?)", (key, reply, expires_at))
+            db.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
+            db.commit()
+
+    async def lookup(self, key: str, count_miss: bool = False):
+        """Cached reply for key, or None"""
+        if not self.enabled:
+            return None
+        reply = self._memory_get(key)
+        if reply is not None:
+            self.counters["hits_memory"] += 1
+            logger.info("LLM cache hit tier=memory key=%s", key[:12])
+            return reply
+        if self.path:
             try:
-                url = f"{OLLAMA_BASE_URL}/api/chat"
-                payload = {"model": OLLAMA_MODEL, "messages": messages, "stream": False}
-                resp = await client.post(url, json=payload)
-                resp.raise_for_status()
-                data = resp.json()
-                content = data.get("message", {}).get("content")
-                if content:
-                    return content
+                row = await asyncio.to_thread(self._sqlite_get, key)
             except Exception as e:
-                logger.warning("Ollama call failed: %s", str(e))
+                logger.warning("LLM cache read failed: %s", str(e))
+                row = None
+            if row:
+                reply, expires_at = row
+                self._memory_put(key, reply, expires_at)
+                self.counters["hits_sqlite"] += 1
+                logger.info("LLM cache hit tier=sqlite key=%s", key[:12])
+                return reply
+        if count_miss:
+            self.counters["misses"] += 1
+        return None
+
+    async def store(self, key: str, reply: str):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self._memory_put(key, reply, expires_at)
+        self.counters["stores"] += 1
+        if self.path:
+            try:
+                await asyncio.to_thread(self._sqlite_put, key, reply, expires_at)
+            except Exception as e:
+                logger.warning("LLM cache write failed: %s", str(e))
+
+    async def get_or_call(self, key: str, call):
+        """Return the cached reply for key, or await call() once for all concurrent callers.
+        call() returns the reply text, or None when it must not be cached (errors, fallbacks)."""
+        if not self.enabled:
+            return await call()
+        reply = await self.lookup(key)
+        if reply is not None:
+            return reply
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.counters["coalesced"] += 1
+            logger.info("LLM cache coalesced key=%s", key[:12])
+            # asyncio.wait never cancels the shared future, even if this caller is cancelled
+            await asyncio.wait({pending})
+            if pending.cancelled():
+                # The leading request went away before the reply arrived; make our own call
+                reply = await call()
+                if reply is not None:
+                    await self.store(key, reply)
+                return reply
+            return pending.result()
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            reply = await call()
+            if reply is not None:
+                await self.store(key, reply)
+            future.set_result(reply)
+            return reply
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self._inflight.pop(key, None)
 
-            # Fallback safe static reply
-            return "Thanks. Please provide your best per-unit prices, any bulk discounts, and MOQs for the listed items."
-    except httpx.HTTPStatusError as he:
+    def stats(self) -> dict:
+        hits = self.counters["hits_memory"] + self.counters["hits_sqlite"] + self.counters["coalesced"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+llm_response_cache = LLMResponseCache(LLM_CACHE_SIZE, LLM_CACHE_TTL_SECONDS, LLM_CACHE_PATH)
+
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "negokart_llm_request_duration_seconds", "Upstream LLM call duration (streams: until the last token)",
+    ("provider", "model", "outcome"),
+)
+LLM_IN_FLIGHT = REGISTRY.gauge("negokart_llm_requests_in_flight", "Upstream LLM calls in progress", ("provider",))
+REGISTRY.callback(
+    "negokart_llm_cache_events_total", "LLM response cache lookups by result",
+    lambda: [({"event": name}, value) for name, value in llm_response_cache.counters.items()], kind="counter",
+)
+REGISTRY.callback(
+    "negokart_results_stream_subscribers", "Open retailer result streams",
+    lambda: [({}, sum(len(queues) for queues in results_broker._subscribers.values()))],
+)
+
+LLM_FALLBACK_REPLY = "Thanks. Please provide your best per-unit prices, any bulk discounts, and MOQs for the listed items."
+LLM_TEMPERATURE = 0.2  # sent to OpenAI-compatible providers; Ollama uses the model default
+
+# LLM routing
+# An ordered list of provider/model routes. Each call goes to the healthiest, fastest route
+# (EWMA latency and error rate); 429/5xx/timeouts are retried with jittered backoff and then
+# failed over, and a per-route circuit breaker skips routes that keep failing. With LLM_HEDGE
+# a second route is started when the first hasn't answered by its own p95 latency.
+#
+#   LLM_ROUTES="groq:llama-3.1-70b-versatile,openai:gpt-4o-mini,ollama:llama3.2:3b"
+#
+# An entry may end in "@<url>": the base URL for Ollama, or the full chat-completions URL for
+# OpenAI-compatible providers (API key optional then), e.g. a second Ollama host or a local
+# stand-in. Without LLM_ROUTES the route is LLM_PROVIDER when its key is set, else Ollama.
+LLM_ROUTES = os.getenv("LLM_ROUTES", "")
+LLM_ROUTER_POLICY = os.getenv("LLM_ROUTER_POLICY", "latency")  # "latency" | "ordered" (LLM_ROUTES order)
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", str(LLM_READ_TIMEOUT)))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))  # extra attempts per route on 429/5xx/timeouts
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.25"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # consecutive failures that open a route
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3"))  # until a route has enough samples
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.25"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_EWMA_ALPHA = 0.2
+LLM_LATENCY_WINDOW = 200
+
+LLM_DEFAULT_MODELS = {"openai": "gpt-4o-mini", "groq": "llama-3.1-70b-versatile", "deepseek": "deepseek-chat"}
+
+class LLMRouteError(Exception):
+    def __init__(self, message: str, retryable: bool = True, retry_after: float | None = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+@dataclass
+class LLMRoute:
+    provider: str  # "openai" | "groq" | "deepseek" | "ollama" | any OpenAI-compatible name
+    model: str
+    url: str
+    headers: dict
+    kind: str  # "openai" (chat completions) | "ollama" (/api/chat)
+    host: str = ""  # set for "@<url>" entries, so two hosts serving one model get distinct names
+    ewma_latency: float | None = None
+    ewma_error: float = 0.0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=LLM_LATENCY_WINDOW))
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    probing: bool = False
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}:{self.model}" + (f"@{self.host}" if self.host else "")
+
+    def state(self, now: float | None = None) -> str:
+        if self.consecutive_failures < LLM_BREAKER_FAILURES:
+            return "closed"
+        return "open" if (now or time.monotonic()) < self.open_until else "half_open"
+
+    def available(self) -> bool:
+        state = self.state()
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def p95(self) -> float | None:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self) -> float:
+        # Untried routes score 0 so they get measured; errors inflate the expected latency
+        return (self.ewma_latency or 0.0) * (1 + 4 * self.ewma_error)
+
+# Helper: parse an LLM_ROUTES entry ("provider[:model][@url]") into a route, or None if unusable
+def parse_llm_route(entry: str) -> LLMRoute | None:
+    spec, _, url = entry.strip().partition("@")
+    provider, _, model = spec.partition(":")
+    provider = provider.strip().lower()
+    if not provider:
+        return None
+    host = httpx.URL(url).netloc.decode() if url else ""
+    if provider == "ollama":
+        base = (url or OLLAMA_BASE_URL).rstrip("/")
+        return LLMRoute(provider, model or OLLAMA_MODEL, f"{base}/api/chat", {}, "ollama", host)
+    keys = {"openai": OPENAI_API_KEY, "groq": GROQ_API_KEY, "deepseek": DEEPSEEK_API_KEY}
+    api_key = keys.get(provider)
+    if not url and not (provider in LLM_PROVIDER_URLS and api_key):
+        logger.warning("Skipping LLM route %s: no API key or URL configured", entry.strip())
+        return None
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    model = model or LLM_DEFAULT_MODELS.get(provider, "")
+    return LLMRoute(provider, model, url or LLM_PROVIDER_URLS[provider], headers, "openai", host)
+
+# Helper: route list from LLM_ROUTES, else the legacy LLM_PROVIDER / Ollama selection
+def default_llm_routes() -> str:
+    if LLM_ROUTES:
+        return LLM_ROUTES
+    keys = {"openai": OPENAI_API_KEY, "groq": GROQ_API_KEY, "deepseek": DEEPSEEK_API_KEY}
+    if keys.get(LLM_PROVIDER):
+        return f"{LLM_PROVIDER}:{LLM_MODEL or LLM_DEFAULT_MODELS[LLM_PROVIDER]}"
+    return f"ollama:{OLLAMA_MODEL}"
+
+# Helper: raise LLMRouteError for error responses (429/5xx are retryable, other 4xx are not)
+def check_llm_status(route: LLMRoute, r: httpx.Response):
+    if r.status_code < 400:
+        return
+    retry_after = None
+    try:
+        retry_after = float(r.headers.get("retry-after", ""))
+    except ValueError:
+        pass
+    if r.status_code == 429 or r.status_code >= 500:
+        raise LLMRouteError(f"HTTP {r.status_code}", retry_after=retry_after)
+    logger.error("LLM HTTP error route=%s status=%s body=%s", route.name, r.status_code, r.text[:500])
+    raise LLMRouteError(f"HTTP {r.status_code}", retryable=False)
+
+LLM_RETRY_COUNT = REGISTRY.counter("negokart_llm_retries_total", "LLM attempts retried after a retryable error", ("route",))
+LLM_HEDGES = REGISTRY.counter("negokart_llm_hedges_total", "Hedged LLM requests by winner", ("outcome",))
+
+class LLMRouter:
+    def __init__(self):
+        self._routes: list[LLMRoute] | None = None
+
+    def configure(self, spec: str | None = None):
+        """(Re)build the route list; call again after changing LLM settings at runtime"""
+        routes = [route for route in (parse_llm_route(e) for e in (spec or default_llm_routes()).split(",") if e.strip()) if route]
+        self._routes = routes
+        logger.info("LLM routes: %s (policy=%s hedge=%s)", [r.name for r in routes], LLM_ROUTER_POLICY, LLM_HEDGE)
+
+    @property
+    def routes(self) -> list[LLMRoute]:
+        if self._routes is None:
+            self.configure()
+        return self._routes
+
+    def signature(self) -> str:
+        return ",".join(route.name for route in self.routes)
+
+    def candidates(self) -> list[LLMRoute]:
+        available = [route for route in self.routes if route.available()]
+        if LLM_ROUTER_POLICY == "ordered":
+            return available
+        return sorted(available, key=lambda route: route.score())  # stable: ties keep LLM_ROUTES order
+
+    def record_success(self, route: LLMRoute, elapsed: float):
+        route.ewma_latency = elapsed if route.ewma_latency is None else (1 - LLM_EWMA_ALPHA) * route.ewma_latency + LLM_EWMA_ALPHA * elapsed
+        route.ewma_error *= 1 - LLM_EWMA_ALPHA
+        route.latencies.append(elapsed)
+        if route.consecutive_failures >= LLM_BREAKER_FAILURES:
+            logger.info("LLM route %s recovered, circuit closed", route.name)
+        route.consecutive_failures = 0
+        route.probing = False
+
+    def record_failure(self, route: LLMRoute):
+        route.ewma_error = (1 - LLM_EWMA_ALPHA) * route.ewma_error + LLM_EWMA_ALPHA
+        route.consecutive_failures += 1
+        route.probing = False
+        if route.consecutive_failures >= LLM_BREAKER_FAILURES:
+            route.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+            logger.warning("LLM route %s circuit open for %ss after %s failures", route.name, LLM_BREAKER_COOLDOWN, route.consecutive_failures)
+
+    def backoff(self, attempt: int, retry_after: float | None) -> float:
+        # Full jitter: uniform in [0, base * 2^(attempt-1)], at least Retry-After, capped
+        delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return min(delay, LLM_RETRY_MAX_DELAY)
+
+    def hedge_delay(self, route: LLMRoute) -> float:
+        p95 = route.p95()
+        return LLM_HEDGE_DEFAULT_DELAY if p95 is None else max(LLM_HEDGE_MIN_DELAY, p95)
+
+    async def send(self, route: LLMRoute, messages: list[dict]) -> str:
+        client = llm_clients.get(route.provider)
         try:
-            err_body = he.response.text
-        except Exception:
-            err_body = "<no body>"
-        logger.error("LLM HTTP error status=%s body=%s", getattr(he.response, "status_code", "?"), err_body)
-        return "Thanks. Please provide your best per-unit prices, any bulk discounts, and MOQs for the listed items."
-    except Exception as e:
-        logger.error("LLM unexpected error: %s", str(e))
-        return "Thanks. Please provide your best per-unit prices, any bulk discounts, and MOQs for the listed items."
+            if route.kind == "openai":
+                payload = {"model": route.model, "messages": messages, "temperature": LLM_TEMPERATURE}
+                r = await client.post(route.url, json=payload, headers=route.headers)
+                check_llm_status(route, r)
+                content = ((r.json().get("choices") or [{}])[0].get("message") or {}).get("content")
+            else:
+                payload = {"model": route.model, "messages": messages, "stream": False}
+                r = await client.post(route.url, json=payload)
+                check_llm_status(route, r)
+                content = (r.json().get("message") or {}).get("content")
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            raise LLMRouteError(f"{type(e).__name__}: {e}")
+        except (ValueError, AttributeError) as e:
+            raise LLMRouteError(f"invalid response: {e}", retryable=False)
+        if not content:
+            raise LLMRouteError("empty reply", retryable=False)
+        return content
+
+    async def try_route(self, route: LLMRoute, messages: list[dict]) -> str | None:
+        """Call one route with retries; None once it fails (or its circuit opens)"""
+        retry_after = None
+        for attempt in range(LLM_RETRIES + 1):
+            if attempt:
+                LLM_RETRY_COUNT.inc(route=route.name)
+                await asyncio.sleep(self.backoff(attempt, retry_after))
+                if not route.available():
+                    return None
+            if route.state() == "half_open":
+                route.probing = True
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                with LLM_IN_FLIGHT.track(provider=route.provider):
+                    reply = await asyncio.wait_for(self.send(route, messages), LLM_ATTEMPT_TIMEOUT)
+                outcome = "ok"
+                self.record_success(route, time.perf_counter() - started)
+                return reply
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                route.probing = False
+                raise
+            except (LLMRouteError, asyncio.TimeoutError) as e:
+                error = e if isinstance(e, LLMRouteError) else LLMRouteError(f"no reply within {LLM_ATTEMPT_TIMEOUT}s")
+                logger.warning("LLM route %s attempt %s failed: %s", route.name, attempt + 1, error)
+                self.record_failure(route)
+                if not error.retryable:
+                    return None
+                retry_after = error.retry_after
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=route.provider, model=route.model, outcome=outcome)
+        return None
+
+    async def hedged(self, primary: LLMRoute, backup: LLMRoute, messages: list[dict]) -> str | None:
+        """Start backup if primary hasn't answered by its p95 latency; first reply wins"""
+        first = asyncio.create_task(self.try_route(primary, messages))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=self.hedge_delay(primary))
+            if done:
+                reply = first.result()
+                return reply if reply is not None else await self.try_route(backup, messages)
+            second = asyncio.create_task(self.try_route(backup, messages))
+            tasks.append(second)
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    reply = task.result()
+                    if reply is not None:
+                        LLM_HEDGES.inc(outcome="backup_won" if task is second else "primary_won")
+                        return reply
+            LLM_HEDGES.inc(outcome="both_failed")
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def complete(self, messages: list[dict]) -> str | None:
+        """Reply text from the best available route, or None if every route failed"""
+        routes = self.candidates()
+        if not routes:
+            logger.warning("No LLM route available (all circuits open)")
+            return None
+        if LLM_HEDGE and len(routes) > 1:
+            reply = await self.hedged(routes[0], routes[1], messages)
+            routes = routes[2:]
+        else:
+            reply = await self.try_route(routes[0], messages)
+            routes = routes[1:]
+        for route in routes:
+            if reply is not None:
+                break
+            if route.available():
+                reply = await self.try_route(route, messages)
+        return reply
+
+    async def send_stream(self, route: LLMRoute, messages: list[dict]):
+        client = llm_clients.get(route.provider)
+        try:
+            if route.kind == "openai":
+                # OpenAI-compatible SSE: "data: {json}" lines terminated by "data: [DONE]"
+                payload = {"model": route.model, "messages": messages, "temperature": LLM_TEMPERATURE, "stream": True}
+                async with client.stream("POST", route.url, json=payload, headers=route.headers) as r:
+                    if r.status_code >= 400:
+                        await r.aread()
+                    check_llm_status(route, r)
+                    async for line in r.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        chunk = line[5:].strip()
+                        if chunk == "[DONE]":
+                            break
+                        choice = (json.loads(chunk).get("choices") or [{}])[0]
+                        token = (choice.get("delta") or {}).get("content")
+                        if token:
+                            yield token
+            else:
+                # Ollama streams newline-delimited JSON objects until "done": true
+                payload = {"model": route.model, "messages": messages, "stream": True}
+                async with client.stream("POST", route.url, json=payload) as r:
+                    if r.status_code >= 400:
+                        await r.aread()
+                    check_llm_status(route, r)
+                    async for line in r.aiter_lines():
+                        if not line.strip():
+                            continue
+                        data = json.loads(line)
+                        token = (data.get("message") or {}).get("content")
+                        if token:
+                            yield token
+                        if data.get("done"):
+                            break
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            raise LLMRouteError(f"{type(e).__name__}: {e}")
+        except (ValueError, AttributeError) as e:
+            raise LLMRouteError(f"invalid stream: {e}", retryable=False)
+
+    async def stream(self, messages: list[dict]):
+        """Yield tokens from the best available route. Retries and failover happen only before
+        the first token; a stream that breaks midway raises LLMRouteError. Streams aren't hedged."""
+        for route in self.candidates():
+            retry_after = None
+            for attempt in range(LLM_RETRIES + 1):
+                if attempt:
+                    LLM_RETRY_COUNT.inc(route=route.name)
+                    await asyncio.sleep(self.backoff(attempt, retry_after))
+                if not route.available():
+                    break
+                if route.state() == "half_open":
+                    route.probing = True
+                started = time.perf_counter()
+                outcome = "error"
+                emitted = False
+                LLM_IN_FLIGHT.inc(provider=route.provider)
+                try:
+                    async with aclosing(self.send_stream(route, messages)) as tokens:
+                        async for token in tokens:
+                            emitted = True
+                            yield token
+                    if not emitted:
+                        raise LLMRouteError("empty stream", retryable=False)
+                    outcome = "ok"
+                    self.record_success(route, time.perf_counter() - started)
+                    return
+                except (asyncio.CancelledError, GeneratorExit):
+                    outcome = "cancelled"
+                    route.probing = False
+                    raise
+                except LLMRouteError as e:
+                    logger.warning("LLM route %s stream attempt %s failed: %s", route.name, attempt + 1, e)
+                    self.record_failure(route)
+                    if emitted:
+                        outcome = "partial"
+                        raise
+                    if not e.retryable:
+                        break
+                    retry_after = e.retry_after
+                finally:
+                    LLM_IN_FLIGHT.dec(provider=route.provider)
+                    LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=route.provider, model=route.model, outcome=outcome)
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {
+                "route": route.name,
+                "state": route.state(),
+                "ewma_latency_ms": round(route.ewma_latency * 1000, 1) if route.ewma_latency is not None else None,
+                "ewma_error_rate": round(route.ewma_error, 3),
+                "p95_ms": round(route.p95() * 1000, 1) if route.p95() is not None else None,
+            }
+            for route in self.routes
+        ]
+
+llm_router = LLMRouter()
+
+REGISTRY.callback(
+    "negokart_llm_route_state", "Circuit breaker state per LLM route (0 closed, 1 half-open, 2 open)",
+    lambda: [({"route": r.name}, {"closed": 0, "half_open": 1, "open": 2}[r.state()]) for r in llm_router.routes],
+)
+REGISTRY.callback(
+    "negokart_llm_route_ewma_latency_seconds", "Smoothed successful call latency per LLM route",
+    lambda: [({"route": r.name}, r.ewma_latency) for r in llm_router.routes if r.ewma_latency is not None],
+)
+REGISTRY.callback(
+    "negokart_llm_route_error_ratio", "Smoothed error rate per LLM route",
+    lambda: [({"route": r.name}, r.ewma_error) for r in llm_router.routes],
+)
+
+# Helper: cache key for a prompt; replies may come from any configured route
+def llm_request_key(messages: list[dict]) -> str:
+    return llm_cache_key(llm_router.signature(), LLM_TEMPERATURE, messages)
+
+# Helper: cached LLM reply, else fallback safe static reply (which is never cached)
+async def generate_ai_reply(messages: list[dict]) -> str:
+    key = llm_request_key(messages)
+    reply = await llm_response_cache.get_or_call(key, lambda: llm_router.complete(messages))
+    return reply or LLM_FALLBACK_REPLY
+
+# Helper: same routing as generate_ai_reply, but yields tokens as they arrive
+# A stream that breaks after its first token raises LLMRouteError; the partial reply isn't cached.
+async def stream_ai_reply(messages: list[dict]):
+    key = llm_request_key(messages)
+    cached = await llm_response_cache.lookup(key, count_miss=True)
+    if cached is not None:
+        yield cached
+        return
+    parts = []
+    async for token in llm_router.stream(messages):
+        parts.append(token)
+        yield token
+    if not parts:
+        yield LLM_FALLBACK_REPLY
+    else:
+        await llm_response_cache.store(key, "".join(parts))
+
+# Helper: INSERT ... ON CONFLICT for the active dialect (Postgres or SQLite)
+def dialect_insert(db: Session, model):
+    return (pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert)(model)
+
+# Canonical product identity
+# A name resolves to a product id by exact alias, then by product key (case, punctuation, word order
+# and pack-size spelling ignored: "basmati rice (5 kg)" and "Basmati Rice 5kg" share a key), then
+# through the trigram index for misspellings. A fuzzy match needs the same number of words, the
+# same numbers/pack sizes and PRODUCT_MATCH_THRESHOLD trigram similarity; anything else becomes a
+# new product. Every new spelling is stored as an alias, so each one is matched only once.
+PRODUCT_MATCH_THRESHOLD = float(os.getenv("PRODUCT_MATCH_THRESHOLD", "0.65"))
+PRODUCT_MATCH_CANDIDATES = 5
+UNIT_ALIASES = {
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg", "kilograms": "kg",
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g",
+    "l": "l", "ltr": "l", "ltrs": "l", "litre": "l", "litres": "l", "liter": "l", "liters": "l",
+    "ml": "ml", "mls": "ml", "pc": "pc", "pcs": "pc", "piece": "pc", "pieces": "pc",
+}
+PACK_SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(" + "|".join(sorted(UNIT_ALIASES, key=len, reverse=True)) + r")\b")
+
+# Helper: product name as matched across price books and product lists
+def normalize_product_name(name: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", (name or "").lower()).split())
+
+# Helper: canonical key of a product name (sorted words, pack sizes written as "5kg")
+def product_key(name: str) -> str:
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", (name or "").lower())  # keep decimal points only
+    text = re.sub(r"[^\w\s.]", " ", text)
+    text = PACK_SIZE_RE.sub(lambda m: m.group(1) + UNIT_ALIASES[m.group(2)], text)
+    return " ".join(sorted(text.split()))
+
+def product_grams(key: str) -> set[str]:
+    grams = set()
+    for word in key.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def key_numbers(key: str) -> list[str]:
+    return sorted(word for word in key.split() if any(c.isdigit() for c in word))
+
+# Helper: existing product whose key is a close spelling of this one, via the trigram index
+def fuzzy_match_product(db: Session, key: str) -> int | None:
+    grams = product_grams(key)
+    if not grams:
+        return None
+    shared = func.count(ProductGram.id)
+    candidates = (
+        db.query(Product.id, Product.key, Product.gram_count, shared.label("shared"))
+        .join(ProductGram, ProductGram.product_id == Product.id)
+        .filter(ProductGram.gram.in_(grams))
+        .group_by(Product.id, Product.key, Product.gram_count)
+        .order_by(shared.desc())
+        .limit(PRODUCT_MATCH_CANDIDATES)
+        .all()
+    )
+    words, numbers = len(key.split()), key_numbers(key)
+    best = None
+    for c in candidates:
+        if len(c.key.split()) != words or key_numbers(c.key) != numbers:
+            continue
+        score = c.shared / (len(grams) + (c.gram_count or 0) - c.shared)
+        if score >= PRODUCT_MATCH_THRESHOLD and (best is None or score > best[0]):
+            best = (score, c.id)
+    return best[1] if best else None
+
+# Helper: canonical product id for each name (None for names without any word characters).
+# Unknown spellings are matched or become new products, and are recorded as aliases.
+def resolve_product_ids(db: Session, names) -> dict[str, int | None]:
+    names = {name for name in names if name}
+    if not names:
+        return {}
+    ids = dict(db.query(ProductAlias.name, ProductAlias.product_id).filter(ProductAlias.name.in_(names)))
+    missing = names - ids.keys()
+    if not missing:
+        return ids
+    keys = {name: product_key(name) for name in missing}
+    by_key = dict(db.query(Product.key, Product.id).filter(Product.key.in_(set(keys.values()))))
+    new = {}  # key -> first spelling
+    for name, key in keys.items():
+        if not key or key in by_key or key in new:
+            continue
+        matched = fuzzy_match_product(db, key)
+        if matched:
+            by_key[key] = matched
+        else:
+            new[key] = name
+    if new:
+        # ON CONFLICT: a concurrent request may create the same product first
+        stmt = dialect_insert(db, Product).values([
+            {"key": key, "name": name, "gram_count": len(product_grams(key)), "created_at": datetime.utcnow().isoformat()}
+            for key, name in new.items()
+        ]).on_conflict_do_nothing(index_elements=["key"])
+        db.execute(stmt)
+        created = dict(db.query(Product.key, Product.id).filter(Product.key.in_(list(new))))
+        by_key.update(created)
+        grams = [{"gram": gram, "product_id": created[key]} for key in new for gram in product_grams(key)]
+        for start in range(0, len(grams), 1000):
+            db.execute(dialect_insert(db, ProductGram).values(grams[start:start + 1000]).on_conflict_do_nothing(index_elements=["gram", "product_id"]))
+    aliases = []
+    for name, key in keys.items():
+        ids[name] = by_key.get(key)
+        if ids[name] is not None:
+            aliases.append({"name": name, "product_id": ids[name]})
+    if aliases:
+        db.execute(dialect_insert(db, ProductAlias).values(aliases).on_conflict_do_nothing(index_elements=["name"]))
+    return ids
+
+# Helper: insert or update offers in a single INSERT ... ON CONFLICT DO UPDATE statement,
+# then refresh the session's best-price rows for those products.
+# Offered names are resolved to canonical products and stored under the session's own spelling
+# of the requested product, so results stay keyed by exact (session, product_name).
+# Returns (prices as stored, refreshed best-price rows).
+def upsert_offers(db: Session, session_id: int, wholesaler_id: int, prices: dict[str, float]) -> tuple[dict[str, float], list[dict]]:
+    if not prices:
+        return {}, []
+    product_ids = resolve_product_ids(db, prices.keys())
+    requested = dict(
+        db.query(ProductListItem.product_id, ProductListItem.name)
+        .join(NegotiationSession, NegotiationSession.product_list_id == ProductListItem.product_list_id)
+        .filter(NegotiationSession.id == session_id, ProductListItem.product_id.in_([pid for pid in product_ids.values() if pid]))
+    )
+    rows = {}
+    for name, price in prices.items():
+        product_id = product_ids.get(name)
+        rows[requested.get(product_id, name)] = {
+            "session_id": session_id, "wholesaler_id": wholesaler_id, "product_name": requested.get(product_id, name),
+            "product_id": product_id, "price": price,
+        }
+    stmt = dialect_insert(db, Offer).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["session_id", "wholesaler_id", "product_name"],
+        set_={"price": stmt.excluded.price, "product_id": stmt.excluded.product_id},
+    )
+    db.execute(stmt)
+    return {name: row["price"] for name, row in rows.items()}, refresh_best_prices(db, session_id, rows.keys())
+
+# Helper: one best-price row as returned by /retailer/negotiation_results
+def best_price_entry(row) -> dict:
+    return {
+        "product_name": row.product_name,
+        "quantity": row.quantity,
+        "best_price": row.best_price,
+        "best_wholesaler": row.best_wholesaler,
+        "second_price": row.second_price,
+        "offer_count": row.offer_count or 0,
+        "line_total": row.line_total,
+    }
+
+# Helper: recompute best/second-best price, offer count and line total for the given products.
+# Only the bids on those products are read; existing rows are locked first (Postgres) so
+# concurrent finalizations on the same products are applied one after the other.
+def refresh_best_prices(db: Session, session_id: int, product_names) -> list[dict]:
+    names = sorted(set(product_names))
+    if not names:
+        return []
+    db.query(SessionBestPrice.id).filter(
+        SessionBestPrice.session_id == session_id, SessionBestPrice.product_name.in_(names)
+    ).order_by(SessionBestPrice.product_name).with_for_update().all()
+    bids = defaultdict(list)
+    for name, price, wholesaler_id, username in (
+        db.query(Offer.product_name, Offer.price, Offer.wholesaler_id, User.username)
+        .outerjoin(User, User.id == Offer.wholesaler_id)
+        .filter(Offer.session_id == session_id, Offer.product_name.in_(names), Offer.price.isnot(None))
+        .order_by(Offer.price, Offer.id)
+    ):
+        bids[name].append((price, wholesaler_id, username or f"Wholesaler {wholesaler_id}"))
+    quantities = dict(
+        db.query(ProductListItem.name, ProductListItem.quantity)
+        .join(NegotiationSession, NegotiationSession.product_list_id == ProductListItem.product_list_id)
+        .filter(NegotiationSession.id == session_id, ProductListItem.name.in_(names))
+    )
+    rows = []
+    for name in names:
+        ranked = bids.get(name, [])
+        best = ranked[0] if ranked else (None, None, None)
+        quantity = quantities.get(name)
+        rows.append({
+            "session_id": session_id,
+            "product_name": name,
+            "quantity": quantity,
+            "best_price": best[0],
+            "best_wholesaler_id": best[1],
+            "best_wholesaler": best[2],
+            "second_price": ranked[1][0] if len(ranked) > 1 else None,
+            "offer_count": len(ranked),
+            "line_total": best[0] * quantity if best[0] is not None and quantity is not None else None,
+        })
+    stmt = dialect_insert(db, SessionBestPrice).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["session_id", "product_name"],
+        set_={c: getattr(stmt.excluded, c) for c in rows[0] if c not in ("session_id", "product_name")},
+    )
+    db.execute(stmt)
+    return [best_price_entry(SimpleNamespace(**row)) for row in rows]
+
+# Helper: requested products for a set of product lists, in submission order
+def load_product_items(product_list_ids: list[int], db: Session) -> dict[int, list[dict]]:
+    items = defaultdict(list)
+    if not product_list_ids:
+        return items
+    rows = db.query(ProductListItem.product_list_id, ProductListItem.name, ProductListItem.quantity, ProductListItem.product_id).filter(
+        ProductListItem.product_list_id.in_(product_list_ids)
+    ).order_by(ProductListItem.product_list_id, ProductListItem.position).all()
+    for row in rows:
+        items[row.product_list_id].append({"name": row.name, "quantity": row.quantity, "product_id": row.product_id})
+    return items
+
+# Helper: the chunk a wholesaler is negotiating (index overrides the stored one), or None for an
+# unknown session. Item positions are dense per list, so a chunk is one position range.
+def negotiation_chunk(session_id: int, wholesaler_id: int, db: Session, index: int | None = None) -> NegotiationChunk | None:
+    row = (
+        db.query(NegotiationSession.product_list_id, NegotiationSession.chunk_size, WholesalerNegotiation.chunk_index, WholesalerNegotiation.chunk_message_id)
+        .outerjoin(WholesalerNegotiation, and_(
+            WholesalerNegotiation.session_id == NegotiationSession.id,
+            WholesalerNegotiation.wholesaler_id == wholesaler_id,
+        ))
+        .filter(NegotiationSession.id == session_id)
+        .first()
+    )
+    if row is None:
+        return None
+    if not row.chunk_size:
+        items = load_product_items([row.product_list_id], db)[row.product_list_id]
+        return NegotiationChunk(index=0, count=1, total=len(items), items=items)
+    stored = row.chunk_index or 0
+    index = stored if index is None else index
+    total = db.query(func.count(ProductListItem.id)).filter(ProductListItem.product_list_id == row.product_list_id).scalar() or 0
+    items = [
+        {"name": r.name, "quantity": r.quantity}
+        for r in db.query(ProductListItem.name, ProductListItem.quantity).filter(
+            ProductListItem.product_list_id == row.product_list_id,
+            ProductListItem.position >= index * row.chunk_size,
+            ProductListItem.position < (index + 1) * row.chunk_size,
+        ).order_by(ProductListItem.position)
+    ]
+    return NegotiationChunk(
+        index=index, count=chunk_count(total, row.chunk_size), total=total, items=items,
+        started_after=(row.chunk_message_id or 0) if index == stored else 0,
+    )
 
 # Detect and parse final JSON from AI content
 FINAL_JSON_RE = re.compile(r"<FINAL_JSON>\s*(\{[\s\S]*?\})\s*</FINAL_JSON>", re.IGNORECASE)
@@ -505,27 +1731,65 @@ def maybe_apply_final_json(session_id: int, wholesaler_id: int, content: str, db
         return False
     try:
         data = json.loads(m.group(1))
+    except Exception:
+        return False
+    return apply_final_agreement(session_id, wholesaler_id, data, db)
+
+# Helper: store agreed prices, mark the negotiation finalized, archive it and notify the retailer
+# data is the FINAL_JSON payload: {"currency": ..., "items": [{"name": ..., "final_price": ...}]}
+# In a chunked session an agreement on any chunk but the last stores its prices and opens the next
+# chunk instead; that returns False since the negotiation goes on.
+def apply_final_agreement(session_id: int, wholesaler_id: int, data: dict, db: Session):
+    try:
+        wn = db.query(WholesalerNegotiation).filter(WholesalerNegotiation.session_id == session_id, WholesalerNegotiation.wholesaler_id == wholesaler_id).first()
+        # Finalized prices are settled; a later agreement must not rewrite them
+        if wn is None or wn.status == "finalized":
+            return False
         items = data.get("items", [])
         # Upsert offers for this wholesaler/session
+        prices = {}
         for item in items:
             name = item.get("name")
             price = float(item.get("final_price")) if item.get("final_price") is not None else None
             if not name or price is None:
                 continue
-            existing = db.query(Offer).filter(Offer.session_id == session_id, Offer.wholesaler_id == wholesaler_id, Offer.product_name == name).first()
-            if existing:
-                existing.price = price
-            else:
-                db.add(Offer(session_id=session_id, wholesaler_id=wholesaler_id, product_name=name, price=price))
-        # Mark wholesaler negotiation finalized
-        wn = db.query(WholesalerNegotiation).filter(WholesalerNegotiation.session_id == session_id, WholesalerNegotiation.wholesaler_id == wholesaler_id).first()
-        if wn:
-            wn.status = "finalized"
-            wn.finalized_at = datetime.utcnow().isoformat()
-        # Create history snapshot
+            prices[name] = price
+        prices, best_prices = upsert_offers(db, session_id, wholesaler_id, prices)
         session = db.query(NegotiationSession).filter(NegotiationSession.id == session_id).first()
         product_list = db.query(ProductList).filter(ProductList.id == session.product_list_id).first() if session else None
         retailer_id = product_list.retailer_id if product_list else None
+        chunk = negotiation_chunk(session_id, wholesaler_id, db) if session and session.chunk_size else None
+        if chunk and chunk.index + 1 < chunk.count:
+            following = negotiation_chunk(session_id, wholesaler_id, db, index=chunk.index + 1)
+            opening = ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="assistant", content=build_chunk_opening(following))
+            db.add(opening)
+            db.flush()
+            wn.chunk_index = following.index
+            wn.chunk_message_id = opening.id
+            # The settled chunk's summary and quoted prices don't carry over
+            db.query(ChatSummary).filter(ChatSummary.session_id == session_id, ChatSummary.wholesaler_id == wholesaler_id).delete()
+            db.commit()
+            wholesaler = db.query(User).filter(User.id == wholesaler_id).first()
+            publish_result_update(
+                retailer_id, session_id, wholesaler_id,
+                wholesaler.username if wholesaler else f"Wholesaler {wholesaler_id}",
+                "in_progress",
+                [{"product_name": name, "price": price} for name, price in prices.items()],
+                best_prices,
+            )
+            return False
+        if chunk:
+            # The archive covers every chunk, not just the one agreed last
+            items = [
+                {"name": name, "final_price": price}
+                for name, price in db.query(Offer.product_name, Offer.price).filter(
+                    Offer.session_id == session_id, Offer.wholesaler_id == wholesaler_id
+                ).order_by(Offer.id)
+            ]
+        # Mark wholesaler negotiation finalized
+        wn.status = "finalized"
+        wn.finalized_at = datetime.utcnow().isoformat()
+        # Create history snapshot
         existing_hist = db.query(WholesalerHistory).filter(WholesalerHistory.session_id == session_id, WholesalerHistory.wholesaler_id == wholesaler_id).first()
         if not existing_hist:
             snapshot = {
@@ -536,141 +1800,603 @@ def maybe_apply_final_json(session_id: int, wholesaler_id: int, content: str, db
                 session_id=session_id,
                 wholesaler_id=wholesaler_id,
                 retailer_id=retailer_id or 0,
-                finalized_at=wn.finalized_at if wn else datetime.utcnow().isoformat(),
+                finalized_at=wn.finalized_at,
                 data=json.dumps(snapshot)
             ))
         db.commit()
+        wholesaler = db.query(User).filter(User.id == wholesaler_id).first()
+        publish_result_update(
+            retailer_id, session_id, wholesaler_id,
+            wholesaler.username if wholesaler else f"Wholesaler {wholesaler_id}",
+            "finalized",
+            [{"product_name": name, "price": price} for name, price in prices.items()],
+            best_prices,
+        )
         return True
     except Exception:
+        db.rollback()
+        logger.exception("Failed to apply final agreement session=%s wholesaler=%s", session_id, wholesaler_id)
         return False
 
-# Endpoint modifications: on product list submit, create session and seed initial chat per wholesaler
+# Push channel for retailer result updates
+# In-process fan-out of offer/status deltas to each retailer's open result streams.
+# Publishing is thread-safe so sync endpoints running in the threadpool can use it.
+# Single-process only: with several workers or instances, a stream sees just the updates handled
+# by its own worker. The results page resyncs from /retailer/negotiation_results every minute
+# (and whenever the stream reconnects) to pick up the rest.
+RESULTS_HEARTBEAT_SECONDS = float(os.getenv("RESULTS_HEARTBEAT_SECONDS", "15"))
+
+class ResultsBroker:
+    def __init__(self):
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self, retailer_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=100)
+        self._subscribers[retailer_id].add(queue)
+        return queue
+
+    def unsubscribe(self, retailer_id: int, queue: asyncio.Queue):
+        subs = self._subscribers.get(retailer_id)
+        if subs is not None:
+            subs.discard(queue)
+            if not subs:
+                self._subscribers.pop(retailer_id, None)
+
+    def publish(self, retailer_id: int, event: dict):
+        if self._loop is None or not self._subscribers.get(retailer_id):
+            return
+        self._loop.call_soon_threadsafe(self._deliver, retailer_id, event)
+
+    def _deliver(self, retailer_id: int, event: dict):
+        for queue in list(self._subscribers.get(retailer_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping result update for slow subscriber retailer_id=%s", retailer_id)
+
+results_broker = ResultsBroker()
+
+# Helper: format one Server-Sent Event frame
+def sse_event(data: dict, event: str | None = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+# Helper: the caller's negotiation in a session; 404 unless the wholesaler was routed to it
+def wholesaler_negotiation(db: Session, session_id: int, wholesaler_id: int) -> WholesalerNegotiation:
+    wn = db.query(WholesalerNegotiation).filter(WholesalerNegotiation.session_id == session_id, WholesalerNegotiation.wholesaler_id == wholesaler_id).first()
+    if not wn:
+        raise HTTPException(status_code=404, detail="Negotiation session not found.")
+    return wn
+
+# Helper: retailer that owns a negotiation session (None if unknown)
+def session_retailer_id(session_id: int, db: Session):
+    row = db.query(ProductList.retailer_id).join(NegotiationSession, NegotiationSession.product_list_id == ProductList.id).filter(NegotiationSession.id == session_id).first()
+    return row[0] if row else None
+
+# Helper: publish an offer/status delta in the same shape as /retailer/negotiation_results entries
+# (best_prices carries the refreshed aggregate rows for the offered products)
+def publish_result_update(retailer_id, session_id: int, wholesaler_id: int, wholesaler_name: str, status: str, offers: list[dict], best_prices: list[dict] | None = None):
+    if not retailer_id:
+        return
+    results_broker.publish(retailer_id, {
+        "session_id": session_id,
+        "wholesaler_id": wholesaler_id,
+        "wholesaler": wholesaler_name,
+        "status": status,
+        "offers": offers,
+        "best_prices": best_prices or [],
+    })
+
+# Helper: opening assistant message shown to every wholesaler in a session
+def build_greeting(retailer_username: str, products: list[dict], chunk: NegotiationChunk | None = None):
+    items = ", ".join([f"{p['name']} (quantity: {p['quantity']})" for p in products])
+    if chunk and chunk.chunked:
+        wanted = (
+            f"They're restocking {chunk.total} products, so let's go through them in batches. "
+            f"Batch 1 of {chunk.count}: {items}. "
+        )
+    else:
+        wanted = f"They're looking to purchase: {items}. "
+    return (
+        f"Hello! I'm the AI negotiator for {retailer_username}. " + wanted +
+        "What's your best per-unit price for each item? Please include any bulk discounts or MOQs."
+    )
+
+# Helper: assistant message that opens the next chunk once the previous one is agreed
+def build_chunk_opening(chunk: NegotiationChunk):
+    items = ", ".join([f"{p['name']} (quantity: {p['quantity']})" for p in chunk.items])
+    return (
+        f"Thanks, batch {chunk.index} is settled. Batch {chunk.index + 1} of {chunk.count}: {items}. "
+        "What's your best per-unit price for each item? Please include any bulk discounts or MOQs."
+    )
+
+# Wholesaler routing
+# A new session goes to the WHOLESALER_ROUTING_TOP_N wholesalers that best cover its products,
+# looked up in the wholesaler_terms index: a product scores the highest weight among its terms a
+# wholesaler has (its canonical product id from SKUs and price books, or the words of its name
+# from categories). Wholesalers outside the retailer's region or at capacity are skipped, and ties
+# go to the least busy. Only when no matching wholesaler can take it is the session offered to
+# the remaining eligible wholesalers (those without routing terms first, least busy first), and
+# a list nobody can take is rejected. 0 broadcasts to every wholesaler.
+WHOLESALER_ROUTING_TOP_N = int(os.getenv("WHOLESALER_ROUTING_TOP_N", "10"))
+ROUTING_SKU_WEIGHT = 2.0
+ROUTING_CATEGORY_WEIGHT = 1.0
+ROUTING_STOPWORDS = {"and", "the", "for", "with", "pack", "packet", "box"}
+ROUTING_QUERY_CHUNK = 1000  # IN-list size for term, load and profile lookups
+
+# Helper: routing words of a product name or category (pack sizes and short words dropped)
+def routing_words(name: str) -> set[str]:
+    return {
+        word for word in product_key(name).split()
+        if len(word) >= 3 and word not in ROUTING_STOPWORDS and not any(c.isdigit() for c in word)
+    }
+
+def routing_terms(name: str, product_id: int | None) -> set[str]:
+    terms = {f"w:{word}" for word in routing_words(name)}
+    if product_id is not None:
+        terms.add(f"p:{product_id}")
+    return terms
+
+# Helper: replace one source of a wholesaler's routing terms
+def index_wholesaler_terms(db: Session, wholesaler_id: int, source: str, terms: dict[str, float]):
+    db.query(WholesalerTerm).filter(WholesalerTerm.wholesaler_id == wholesaler_id, WholesalerTerm.source == source).delete()
+    rows = [{"term": term, "wholesaler_id": wholesaler_id, "source": source, "weight": weight} for term, weight in terms.items()]
+    for start in range(0, len(rows), ROUTING_QUERY_CHUNK):
+        db.execute(insert(WholesalerTerm), rows[start:start + ROUTING_QUERY_CHUNK])
+
+def chunked(values: list, size: int = ROUTING_QUERY_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# Helper: wholesaler ids a new session is routed to, best match first
+def route_wholesalers(db: Session, products: list[dict], region: str | None = None, top_n: int | None = None) -> list[int]:
+    top_n = WHOLESALER_ROUTING_TOP_N if top_n is None else top_n
+    product_ids = resolve_product_ids(db, [p["name"] for p in products])
+    wanted = [routing_terms(p["name"], product_ids.get(p["name"])) for p in products]
+    weights = defaultdict(dict)  # wholesaler -> term -> weight
+    for terms in chunked(sorted(set().union(*wanted))):
+        for term, wholesaler_id, weight in (
+            db.query(WholesalerTerm.term, WholesalerTerm.wholesaler_id, func.max(WholesalerTerm.weight))
+            .filter(WholesalerTerm.term.in_(terms))
+            .group_by(WholesalerTerm.term, WholesalerTerm.wholesaler_id)
+        ):
+            weights[wholesaler_id][term] = weight
+    scores = {
+        wholesaler_id: sum(max((have.get(t, 0) for t in terms), default=0) for terms in wanted)
+        for wholesaler_id, have in weights.items()
+    }
+    eligible = eligible_wholesalers(db, scores, region)
+    if not eligible:
+        # Nobody with a matching profile can take the list: fall back to every wholesaler that
+        # passes the region and capacity checks, those without routing terms first, least busy first
+        indexed = select(WholesalerTerm.id).where(WholesalerTerm.wholesaler_id == User.id).exists()
+        scores = {row.id: -1 if row.indexed else 0 for row in db.query(User.id, indexed.label("indexed")).filter(User.role == "wholesaler")}
+        eligible = eligible_wholesalers(db, scores, region)
+    return eligible[:top_n]
+
+# Helper: scored wholesalers not excluded by region or at capacity, best score then least busy first
+def eligible_wholesalers(db: Session, scores: dict[int, float], region: str | None) -> list[int]:
+    candidates = list(scores)
+    active, limits = {}, {}
+    for ids in chunked(candidates):
+        active.update(
+            db.query(WholesalerNegotiation.wholesaler_id, func.count(WholesalerNegotiation.id))
+            .filter(WholesalerNegotiation.wholesaler_id.in_(ids), WholesalerNegotiation.status != "finalized")
+            .group_by(WholesalerNegotiation.wholesaler_id)
+        )
+        for profile in db.query(WholesalerProfile.wholesaler_id, WholesalerProfile.regions, WholesalerProfile.capacity).filter(WholesalerProfile.wholesaler_id.in_(ids)):
+            limits[profile.wholesaler_id] = (set(json.loads(profile.regions or "[]")), profile.capacity)
+    region = (region or "").strip().lower()
+    eligible = []
+    for wholesaler_id in candidates:
+        regions, capacity = limits.get(wholesaler_id, (set(), None))
+        if region and regions and region not in regions:
+            continue
+        if capacity is not None and active.get(wholesaler_id, 0) >= capacity:
+            continue
+        eligible.append(wholesaler_id)
+    eligible.sort(key=lambda w: (-scores[w], active.get(w, 0), w))
+    return eligible
+
+# Helper: create the negotiation session for a stored product list, seed one best-price row per
+# product, open negotiations with the wholesalers it is routed to and prefill offers from their
+# price books. Lists longer than NEGOTIATION_CHUNK_SIZE are chunked, so the stored prompt and
+# greeting only name the first chunk. Returns (session, routed wholesaler count, prefilled offer count).
+def open_negotiation_session(db: Session, retailer_username: str, product_list_id: int, products: list[dict], region: str | None = None):
+    chunk_size = NEGOTIATION_CHUNK_SIZE if 0 < NEGOTIATION_CHUNK_SIZE < len(products) else None
+    first = NegotiationChunk(
+        index=0, count=chunk_count(len(products), chunk_size), total=len(products),
+        items=products[:chunk_size] if chunk_size else products,
+    )
+    session = NegotiationSession(
+        product_list_id=product_list_id,
+        chunk_size=chunk_size,
+        system_prompt=build_system_prompt(retailer_username, first.items, first),
+        greeting=build_greeting(retailer_username, first.items, first),
+    )
+    db.add(session)
+    db.flush()
+
+    # Seed one best-price row per requested product; offers fill them in as they arrive
+    unique = list({p["name"]: p for p in products}.values())
+    for start in range(0, len(unique), PRODUCT_UPLOAD_BATCH_SIZE):
+        db.execute(insert(SessionBestPrice), [
+            {"session_id": session.id, "product_name": p["name"], "quantity": p["quantity"], "offer_count": 0}
+            for p in unique[start:start + PRODUCT_UPLOAD_BATCH_SIZE]
+        ])
+
+    if WHOLESALER_ROUTING_TOP_N > 0:
+        routed = route_wholesalers(db, unique, region)
+        if routed:
+            db.execute(insert(WholesalerNegotiation), [
+                {"session_id": session.id, "wholesaler_id": wholesaler_id, "status": "in_progress"} for wholesaler_id in routed
+            ])
+        wholesalers = len(routed)
+    else:
+        # Broadcast: WholesalerNegotiation rows for every wholesaler in one statement
+        wholesalers = db.execute(
+            insert(WholesalerNegotiation).from_select(
+                ["session_id", "wholesaler_id", "status"],
+                select(literal(session.id), User.id, literal("in_progress")).where(User.role == "wholesaler"),
+            )
+        ).rowcount
+    if not wholesalers:
+        raise HTTPException(status_code=503, detail="No wholesaler can take this product list right now.")
+    # Standing prices from wholesaler price books become the opening offers
+    prefilled = sum(
+        prefill_offers_from_price_books(db, session.id, unique[start:start + PRODUCT_UPLOAD_BATCH_SIZE])
+        for start in range(0, len(unique), PRODUCT_UPLOAD_BATCH_SIZE)
+    )
+    return session, wholesalers, prefilled
+
+# Endpoint modifications: on product list submit, create session and open a negotiation per routed wholesaler
+# The system prompt and greeting are stored once on the session; per-wholesaler rows are created
+# only for the top WHOLESALER_ROUTING_TOP_N matches, so submission cost doesn't grow with the directory.
 @app.post("/retailer/products")
 def submit_product_list(
     req: ProductListRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != "retailer":
         raise HTTPException(status_code=403, detail="Only retailers can submit product lists.")
+    products = [item.dict() for item in req.products]
     product_list = ProductList(
         retailer_id=current_user.id,
-        products=json.dumps([item.dict() for item in req.products])
+        products=json.dumps(products)
     )
     db.add(product_list)
+    db.flush()
+    product_ids = resolve_product_ids(db, [p["name"] for p in products])
+    db.execute(insert(ProductListItem), [
+        {"product_list_id": product_list.id, "position": i, "name": p["name"], "quantity": p["quantity"], "product_id": product_ids.get(p["name"])}
+        for i, p in enumerate(products)
+    ])
+    session, wholesalers, prefilled = open_negotiation_session(db, current_user.username, product_list.id, products, req.region)
     db.commit()
-    db.refresh(product_list)
 
-    # Create negotiation session
-    session = NegotiationSession(product_list_id=product_list.id)
-    db.add(session)
-    db.commit()
-    db.refresh(session)
-
-    # Seed chat for each wholesaler with a greeting from AI and create WholesalerNegotiation rows
-    wholesalers = db.query(User).filter(User.role == "wholesaler").all()
-    products = [item.dict() for item in req.products]
-    system_prompt = build_system_prompt(current_user.username, products)
-
-    for wholesaler in wholesalers:
-        db.add(WholesalerNegotiation(session_id=session.id, wholesaler_id=wholesaler.id, status="in_progress"))
-        db.add(ChatMessage(session_id=session.id, wholesaler_id=wholesaler.id, role="system", content=system_prompt))
-        greeting = (
-            f"Hello! I'm the AI negotiator for {current_user.username}. "
-            f"They're looking to purchase: " + ", ".join([f"{p['name']} (quantity: {p['quantity']})" for p in products]) + ". "
-            "What's your best per-unit price for each item? Please include any bulk discounts or MOQs."
-        )
-        db.add(ChatMessage(session_id=session.id, wholesaler_id=wholesaler.id, role="assistant", content=greeting))
-    db.commit()
+    return {"message": "Product list submitted and negotiation started!", "session_id": session.id, "wholesalers": wholesalers, "prefilled_offers": prefilled}
+
+# Streaming product-list upload for large catalogs
+# The body is CSV (header row with name and quantity columns) or NDJSON (one {"name", "quantity"}
+# object per line) and is parsed as it streams in. Names are whitespace-normalized and duplicates
+# (same product key) are merged by adding their quantities. Items are written in
+# PRODUCT_UPLOAD_BATCH_SIZE batches; bad rows are skipped and reported. The JSON copy on
+# product_lists is not written for uploads.
+PRODUCT_UPLOAD_BATCH_SIZE = int(os.getenv("PRODUCT_UPLOAD_BATCH_SIZE", "500"))
+PRODUCT_LIST_MAX_ITEMS = int(os.getenv("PRODUCT_LIST_MAX_ITEMS", "20000"))
+PRODUCT_LIST_MAX_ERRORS = 20
+PRODUCT_LIST_COLUMNS = {
+    "name": "name", "product": "name", "product_name": "name", "item": "name", "sku": "name",
+    "quantity": "quantity", "qty": "quantity",
+}
+
+# Helper: validate one uploaded product-list row; raises ValueError with a message for the client
+def product_list_row(record: dict) -> dict:
+    name = " ".join(str(record.get("name") or "").split())
+    if not normalize_product_name(name):
+        raise ValueError("missing product name")
+    quantity = record.get("quantity")
+    try:
+        quantity = int(quantity.strip() if isinstance(quantity, str) else quantity)
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("quantity must be a whole number")
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    return {"name": name, "quantity": quantity}
+
+# Helper: write a batch of product-list item rows with their canonical product ids
+def insert_product_items(db: Session, items: list[dict]):
+    product_ids = resolve_product_ids(db, [item["name"] for item in items])
+    db.execute(insert(ProductListItem), [{**item, "product_id": product_ids.get(item["name"])} for item in items])
+
+@app.post("/retailer/products/upload")
+async def upload_product_list(
+    request: Request,
+    region: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    if current_user.role != "retailer":
+        raise HTTPException(status_code=403, detail="Only retailers can submit product lists.")
+    fmt = upload_format(request)
+    product_list = ProductList(retailer_id=current_user.id)
+    db.add(product_list)
+    await db.commit()
+    list_id = product_list.id
 
-    return {"message": "Product list submitted and negotiation started!"}
+    seen = {}  # product key -> item row (pending rows are updated in place)
+    pending, merged_late, errors = [], set(), []
+    written = duplicates = error_count = 0
+    try:
+        async for line_no, record in iter_upload_records(request, fmt, PRODUCT_LIST_COLUMNS, ("name", "quantity")):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                row = product_list_row(record)
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < PRODUCT_LIST_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+            key = product_key(row["name"])
+            item = seen.get(key)
+            if item is not None:
+                duplicates += 1
+                item["quantity"] += row["quantity"]
+                if item["position"] < written:
+                    merged_late.add(key)
+                continue
+            if len(seen) >= PRODUCT_LIST_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"Product lists are limited to {PRODUCT_LIST_MAX_ITEMS} items.")
+            item = {"product_list_id": list_id, "position": len(seen), "name": row["name"], "quantity": row["quantity"]}
+            seen[key] = item
+            pending.append(item)
+            if len(pending) >= PRODUCT_UPLOAD_BATCH_SIZE:
+                rows, pending = pending, []
+                await db.run_sync(lambda s: insert_product_items(s, rows))
+                await db.commit()
+                written += len(rows)
+        if pending:
+            await db.run_sync(lambda s: insert_product_items(s, pending))
+            written += len(pending)
+        if not seen:
+            raise HTTPException(status_code=400, detail="The upload contained no valid products.")
+        if merged_late:
+            # Duplicates of items already written in an earlier batch
+            await db.execute(
+                ProductListItem.__table__.update()
+                .where(ProductListItem.product_list_id == list_id, ProductListItem.position == bindparam("item_position"))
+                .values(quantity=bindparam("item_quantity")),
+                [{"item_position": seen[k]["position"], "item_quantity": seen[k]["quantity"]} for k in merged_late],
+            )
+        products = [{"name": item["name"], "quantity": item["quantity"]} for item in seen.values()]
+        username = current_user.username
+        session, wholesalers, prefilled = await db.run_sync(lambda s: open_negotiation_session(s, username, list_id, products, region))
+        await db.commit()
+    except Exception:
+        # Remove the partial list; no session references it yet
+        await db.rollback()
+        await db.execute(ProductListItem.__table__.delete().where(ProductListItem.product_list_id == list_id))
+        await db.execute(ProductList.__table__.delete().where(ProductList.id == list_id))
+        await db.commit()
+        raise
+    logger.info("Product list upload retailer=%s items=%s duplicates=%s errors=%s", current_user.id, len(products), duplicates, error_count)
+    return {
+        "message": "Product list submitted and negotiation started!",
+        "session_id": session.id,
+        "items": len(products),
+        "duplicates_merged": duplicates,
+        "chunks": chunk_count(len(products), session.chunk_size),
+        "wholesalers": wholesalers,
+        "prefilled_offers": prefilled,
+        "error_count": error_count,
+        "errors": errors,
+    }
 
-# Endpoint for retailer to fetch negotiation results for their latest product list (include status)
+# Endpoint for retailer to fetch negotiation results for a session (default: their latest product list)
+# best_prices/basket_total come from the incrementally maintained SessionBestPrice rows;
+# per-wholesaler offers are included unless include_offers=false.
 @app.get("/retailer/negotiation_results")
-def get_negotiation_results(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_negotiation_results(
+    session_id: int | None = None,
+    include_offers: bool = True,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal),
+):
     if current_user.role != "retailer":
         raise HTTPException(status_code=403, detail="Only retailers can view negotiation results.")
-    product_list = db.query(ProductList).filter(ProductList.retailer_id == current_user.id).order_by(ProductList.id.desc()).first()
-    if not product_list:
-        return {"results": []}
-    session = db.query(NegotiationSession).filter(NegotiationSession.product_list_id == product_list.id).first()
-    if not session:
-        return {"results": []}
-    offers = db.query(Offer).filter(Offer.session_id == session.id).all()
-    from collections import defaultdict
+    if session_id is None:
+        latest = (
+            db.query(NegotiationSession.id)
+            .join(ProductList, ProductList.id == NegotiationSession.product_list_id)
+            .filter(ProductList.retailer_id == current_user.id)
+            .order_by(ProductList.id.desc(), NegotiationSession.id.desc())
+            .first()
+        )
+        if not latest:
+            return {"session_id": None, "best_prices": [], "basket_total": None, "results": []}
+        session_id = latest[0]
+    elif session_retailer_id(session_id, db) != current_user.id:
+        raise HTTPException(status_code=404, detail="Negotiation session not found.")
+
+    best_prices = [
+        best_price_entry(row)
+        for row in db.query(SessionBestPrice).filter(SessionBestPrice.session_id == session_id).order_by(SessionBestPrice.id)
+    ]
+    requested = [row for row in best_prices if row["quantity"] is not None]
+    basket_total = (
+        sum(row["line_total"] for row in requested)
+        if requested and all(row["line_total"] is not None for row in requested) else None
+    )
+    response = {"session_id": session_id, "best_prices": best_prices, "basket_total": basket_total}
+    if not include_offers:
+        return response
+
     wholesaler_offers = defaultdict(list)
-    for offer in offers:
+    for offer in db.query(Offer).filter(Offer.session_id == session_id).order_by(Offer.id):
         wholesaler_offers[offer.wholesaler_id].append({
             "product_name": offer.product_name,
             "price": offer.price
         })
-    results = []
-    for wholesaler_id, offers_list in wholesaler_offers.items():
-        wholesaler = db.query(User).filter(User.id == wholesaler_id).first()
-        wn = db.query(WholesalerNegotiation).filter(WholesalerNegotiation.session_id == session.id, WholesalerNegotiation.wholesaler_id == wholesaler_id).first()
-        results.append({
-            "wholesaler": wholesaler.username if wholesaler else f"Wholesaler {wholesaler_id}",
-            "status": wn.status if wn else "in_progress",
-            "offers": offers_list
-        })
-    return {"results": results}
+    wholesaler_ids = list(wholesaler_offers)
+    names = dict(db.query(User.id, User.username).filter(User.id.in_(wholesaler_ids))) if wholesaler_ids else {}
+    statuses = dict(
+        db.query(WholesalerNegotiation.wholesaler_id, WholesalerNegotiation.status)
+        .filter(WholesalerNegotiation.session_id == session_id, WholesalerNegotiation.wholesaler_id.in_(wholesaler_ids))
+    ) if wholesaler_ids else {}
+    response["results"] = [
+        {
+            "wholesaler": names.get(wholesaler_id, f"Wholesaler {wholesaler_id}"),
+            "status": statuses.get(wholesaler_id) or "in_progress",
+            "offers": offers_list,
+        }
+        for wholesaler_id, offers_list in wholesaler_offers.items()
+    ]
+    return response
+
+# Retailer result updates pushed as Server-Sent Events (replaces client polling)
+@app.get("/retailer/negotiation_results/stream")
+async def stream_negotiation_results(current_user: Principal = Depends(get_token_principal)):
+    if current_user.role != "retailer":
+        raise HTTPException(status_code=403, detail="Only retailers can view negotiation results.")
+    retailer_id = current_user.id
+    queue = results_broker.subscribe(retailer_id)
+
+    async def event_stream():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=RESULTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": ping\n\n"
+                    continue
+                yield sse_event(event, event="result")
+        finally:
+            results_broker.unsubscribe(retailer_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # Endpoint for wholesaler to view negotiation requests (sessions) - exclude finalized
+# Driven from this wholesaler's WholesalerNegotiation rows with keyset pagination on session id,
+# so cost tracks their own active sessions rather than every session on the platform.
+NEGOTIATIONS_PAGE_SIZE = 50
+NEGOTIATIONS_MAX_PAGE_SIZE = 200
+
 @app.get("/wholesaler/negotiations")
-def wholesaler_negotiations(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def wholesaler_negotiations(
+    after: int | None = None,
+    limit: int = NEGOTIATIONS_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal)
+):
     if current_user.role != "wholesaler":
         raise HTTPException(status_code=403, detail="Only wholesalers can view negotiation requests.")
-    sessions = db.query(NegotiationSession).all()
+    limit = max(1, min(limit, NEGOTIATIONS_MAX_PAGE_SIZE))
+    query = (
+        db.query(WholesalerNegotiation.session_id, WholesalerNegotiation.status, ProductList.id.label("product_list_id"), ProductList.retailer_id)
+        .join(NegotiationSession, NegotiationSession.id == WholesalerNegotiation.session_id)
+        .join(ProductList, ProductList.id == NegotiationSession.product_list_id)
+        .filter(WholesalerNegotiation.wholesaler_id == current_user.id, WholesalerNegotiation.status != "finalized")
+    )
+    if after is not None:
+        query = query.filter(WholesalerNegotiation.session_id > after)
+    rows = query.order_by(WholesalerNegotiation.session_id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # One IN-batched load each for this page's products and offers
+    session_ids = [row.session_id for row in rows]
+    product_items = load_product_items([row.product_list_id for row in rows], db)
+    # Offers are matched by canonical product id (by name for rows written before product ids)
+    offer_map = defaultdict(dict)
+    if session_ids:
+        offers = db.query(Offer.session_id, Offer.product_name, Offer.product_id, Offer.price).filter(Offer.session_id.in_(session_ids), Offer.wholesaler_id == current_user.id).all()
+        for offer in offers:
+            offer_map[offer.session_id][offer.product_id or offer.product_name] = offer.price
+
     results = []
-    for session in sessions:
-        product_list = db.query(ProductList).filter(ProductList.id == session.product_list_id).first()
-        if not product_list:
-            continue
-        products = json.loads(product_list.products)
-        offers = db.query(Offer).filter(Offer.session_id == session.id, Offer.wholesaler_id == current_user.id).all()
-        offer_map = {(offer.product_name): offer.price for offer in offers}
-        wn = db.query(WholesalerNegotiation).filter(WholesalerNegotiation.session_id == session.id, WholesalerNegotiation.wholesaler_id == current_user.id).first()
-        # Skip finalized to "delete" from active list
-        if wn and wn.status == "finalized":
-            continue
+    for row in rows:
+        products = product_items[row.product_list_id]
         results.append({
-            "session_id": session.id,
-            "retailer_id": product_list.retailer_id,
-            "status": wn.status if wn else "in_progress",
+            "session_id": row.session_id,
+            "retailer_id": row.retailer_id,
+            "status": row.status or "in_progress",
             "products": [
                 {
                     "name": p["name"],
                     "quantity": p["quantity"],
-                    "your_price": offer_map.get(p["name"])
+                    "your_price": offer_map[row.session_id].get(p["product_id"] or p["name"])
                 } for p in products
             ]
         })
-    return {"negotiations": results}
+    return {"negotiations": results, "next_cursor": session_ids[-1] if has_more else None}
 
 # New endpoint: wholesaler history (finalized sessions)
+# Newest first with keyset pagination on (finalized_at, id); the cursor is "<finalized_at>|<id>".
+# summary=true returns only session/retailer/time and never reads the JSON snapshot.
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
 @app.get("/wholesaler/history")
-def wholesaler_history(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def wholesaler_history(
+    before: str | None = None,
+    limit: int = HISTORY_PAGE_SIZE,
+    summary: bool = False,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal)
+):
     if current_user.role != "wholesaler":
         raise HTTPException(status_code=403, detail="Only wholesalers can view history.")
-    rows = db.query(WholesalerHistory).filter(WholesalerHistory.wholesaler_id == current_user.id).all()
-    # Include retailer username
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    columns = [WholesalerHistory.id, WholesalerHistory.session_id, WholesalerHistory.retailer_id, WholesalerHistory.finalized_at]
+    if not summary:
+        columns.append(WholesalerHistory.data)
+    query = db.query(*columns).filter(WholesalerHistory.wholesaler_id == current_user.id)
+    if before:
+        try:
+            cursor_at, cursor_id = before.rsplit("|", 1)
+            cursor_id = int(cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid history cursor.")
+        query = query.filter(or_(
+            WholesalerHistory.finalized_at < cursor_at,
+            and_(WholesalerHistory.finalized_at == cursor_at, WholesalerHistory.id < cursor_id),
+        ))
+    rows = query.order_by(WholesalerHistory.finalized_at.desc(), WholesalerHistory.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # Include retailer username (one IN-batched lookup per page)
+    retailer_ids = {row.retailer_id for row in rows}
+    retailers = dict(db.query(User.id, User.username).filter(User.id.in_(retailer_ids))) if retailer_ids else {}
     out = []
     for row in rows:
-        retailer = db.query(User).filter(User.id == row.retailer_id).first()
-        try:
-            payload = json.loads(row.data)
-        except Exception:
-            payload = {"items": []}
-        out.append({
+        entry = {
             "session_id": row.session_id,
-            "retailer": retailer.username if retailer else f"Retailer {row.retailer_id}",
+            "retailer": retailers.get(row.retailer_id, f"Retailer {row.retailer_id}"),
             "finalized_at": row.finalized_at,
-            "currency": payload.get("currency", "INR"),
-            "items": payload.get("items", [])
-        })
-    # Newest first
-    out.sort(key=lambda r: r.get("finalized_at") or "", reverse=True)
-    return {"history": out}
+        }
+        if not summary:
+            try:
+                payload = json.loads(row.data)
+            except Exception:
+                payload = {"items": []}
+            entry["currency"] = payload.get("currency", "INR")
+            entry["items"] = payload.get("items", [])
+        out.append(entry)
+    next_cursor = f"{rows[-1].finalized_at}|{rows[-1].id}" if has_more else None
+    return {"history": out, "next_cursor": next_cursor}
 
 # Endpoint for wholesaler to submit/update their offer for a product in a session
 class OfferRequest(BaseModel):
@@ -682,115 +2408,915 @@ class OfferRequest(BaseModel):
 def submit_offer(
     req: OfferRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != "wholesaler":
         raise HTTPException(status_code=403, detail="Only wholesalers can submit offers.")
-    # Check if offer exists
-    offer = db.query(Offer).filter(
-        Offer.session_id == req.session_id,
-        Offer.wholesaler_id == current_user.id,
-        Offer.product_name == req.product_name
-    ).first()
-    if offer:
-        offer.price = req.price
-    else:
-        offer = Offer(
-            session_id=req.session_id,
-            wholesaler_id=current_user.id,
-            product_name=req.product_name,
-            price=req.price
-        )
-        db.add(offer)
+    if req.price <= 0:
+        raise HTTPException(status_code=400, detail="Prices must be positive.")
+    wn = wholesaler_negotiation(db, req.session_id, current_user.id)
+    if wn.status == "finalized":
+        raise HTTPException(status_code=409, detail="This negotiation is already finalized.")
+    prices, best_prices = upsert_offers(db, req.session_id, current_user.id, {req.product_name: req.price})
     db.commit()
+    publish_result_update(
+        session_retailer_id(req.session_id, db), req.session_id, current_user.id, current_user.username,
+        wn.status or "in_progress",
+        [{"product_name": name, "price": price} for name, price in prices.items()],
+        best_prices,
+    )
     return {"message": "Offer submitted!"}
 
+# Bulk offers: every price for one session in a single upsert and commit
+class OfferItem(BaseModel):
+    product_name: str
+    price: float
+
+class BulkOfferRequest(BaseModel):
+    session_id: int
+    offers: List[OfferItem]
+
+BULK_OFFER_MAX_ITEMS = 500
+
+@app.post("/wholesaler/offers")
+def submit_offers(
+    req: BulkOfferRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers can submit offers.")
+    if not req.offers or len(req.offers) > BULK_OFFER_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {BULK_OFFER_MAX_ITEMS} offers.")
+    if any(item.price <= 0 for item in req.offers):
+        raise HTTPException(status_code=400, detail="Prices must be positive.")
+    wn = wholesaler_negotiation(db, req.session_id, current_user.id)
+    if wn.status == "finalized":
+        raise HTTPException(status_code=409, detail="This negotiation is already finalized.")
+    prices = {item.product_name: item.price for item in req.offers}
+    prices, best_prices = upsert_offers(db, req.session_id, current_user.id, prices)
+    db.commit()
+    publish_result_update(
+        session_retailer_id(req.session_id, db), req.session_id, current_user.id, current_user.username,
+        wn.status or "in_progress",
+        [{"product_name": name, "price": price} for name, price in prices.items()],
+        best_prices,
+    )
+    return {"message": "Offers submitted!", "count": len(prices)}
+
+# Wholesaler price book
+# Uploaded as CSV (header row: name, price, and optionally min_quantity, moq, currency) or NDJSON
+# (one {"name", "price", ...} object per line). The body is parsed as it streams in and written in
+# PRICE_BOOK_BATCH_SIZE upserts, so large catalogs never sit in memory. replace=true drops entries
+# that were not in this upload once it has been read completely.
+PRICE_BOOK_BATCH_SIZE = int(os.getenv("PRICE_BOOK_BATCH_SIZE", "500"))
+PRICE_BOOK_MAX_ERRORS = 20
+PRICE_BOOK_PAGE_SIZE = 100
+PRICE_BOOK_MAX_PAGE_SIZE = 500
+PRICE_BOOK_COLUMNS = {
+    "name": "name", "product": "name", "product_name": "name",
+    "price": "price", "min_quantity": "min_quantity", "min_qty": "min_quantity", "tier": "min_quantity",
+    "moq": "moq", "currency": "currency",
+}
+
+# Helper: validate one uploaded price-book row; raises ValueError with a message for the client
+def price_book_row(record: dict, wholesaler_id: int, stamp: str) -> dict:
+    name = str(record.get("name") or "").strip()
+    if not normalize_product_name(name):
+        raise ValueError("missing product name")
+    try:
+        price = float(record.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("price must be a number")
+    if price <= 0:
+        raise ValueError("price must be positive")
+    try:
+        min_quantity = int(record.get("min_quantity") or 1)
+        moq = int(record["moq"]) if record.get("moq") not in (None, "") else None
+    except (TypeError, ValueError):
+        raise ValueError("min_quantity and moq must be whole numbers")
+    if min_quantity < 1 or (moq is not None and moq < 1):
+        raise ValueError("min_quantity and moq must be at least 1")
+    return {
+        "wholesaler_id": wholesaler_id, "product_name": name, "normalized_name": normalize_product_name(name),
+        "min_quantity": min_quantity, "price": price, "moq": moq,
+        "currency": str(record.get("currency") or "INR").strip().upper(), "updated_at": stamp,
+    }
+
+# Helper: insert or update a batch of price-book rows in one statement
+def upsert_price_book(db: Session, rows: list[dict]):
+    # ON CONFLICT may touch a row only once per statement, so the last duplicate in a batch wins
+    rows = list({(r["normalized_name"], r["min_quantity"]): r for r in rows}.values())
+    product_ids = resolve_product_ids(db, [r["product_name"] for r in rows])
+    stmt = dialect_insert(db, PriceBookEntry).values([{**r, "product_id": product_ids.get(r["product_name"])} for r in rows])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["wholesaler_id", "normalized_name", "min_quantity"],
+        set_={c: getattr(stmt.excluded, c) for c in ("product_name", "product_id", "price", "moq", "currency", "updated_at")},
+    )
+    db.execute(stmt)
+
+# Helper: decoded lines of a streamed request body
+async def iter_body_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+# Helper: upload format from the Content-Type header (415 for anything else)
+def upload_format(request: Request) -> str:
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        return "csv"
+    if "json" in content_type:
+        return "ndjson"
+    raise HTTPException(status_code=415, detail="Upload text/csv or application/x-ndjson.")
+
+# Helper: records of a streamed CSV (header row first) or NDJSON upload, with keys mapped through
+# columns. Yields (line number, record); a malformed line yields a ValueError in place of the record.
+async def iter_upload_records(request: Request, fmt: str, columns: dict, required: tuple):
+    header = None
+    line_no = 0
+    async for line in iter_body_lines(request):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            if fmt == "csv":
+                fields = next(csv.reader([line]))
+                if header is None:
+                    header = [columns.get(f.strip().lower()) for f in fields]
+                    if any(column not in header for column in required):
+                        raise HTTPException(status_code=400, detail=f"CSV header needs {' and '.join(required)} columns.")
+                    continue
+                record = {column: value for column, value in zip(header, fields) if column}
+            else:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
+                record = {columns[k.lower()]: v for k, v in data.items() if k.lower() in columns}
+        except (ValueError, csv.Error) as e:
+            yield line_no, ValueError(str(e))
+            continue
+        yield line_no, record
+
+# Helper: standing offers for a new session from the participating wholesalers' price books
+# Entries match requested products by canonical product id. For each product the tier with the
+# largest min_quantity not above the requested quantity is used; entries whose MOQ exceeds the
+# quantity are skipped. Returns the number of offers inserted.
+def prefill_offers_from_price_books(db: Session, session_id: int, products: list[dict]) -> int:
+    product_ids = resolve_product_ids(db, [p["name"] for p in products])
+    wanted = {}
+    for p in products:
+        if product_ids.get(p["name"]) is not None:
+            wanted.setdefault(product_ids[p["name"]], p)
+    if not wanted:
+        return 0
+    entries = (
+        db.query(PriceBookEntry.wholesaler_id, PriceBookEntry.product_id, PriceBookEntry.min_quantity, PriceBookEntry.price, PriceBookEntry.moq)
+        .join(WholesalerNegotiation, and_(
+            WholesalerNegotiation.wholesaler_id == PriceBookEntry.wholesaler_id,
+            WholesalerNegotiation.session_id == session_id,
+        ))
+        .filter(PriceBookEntry.product_id.in_(list(wanted)), PriceBookEntry.currency == "INR")
+        .all()
+    )
+    chosen = {}
+    for entry in entries:
+        quantity = wanted[entry.product_id]["quantity"]
+        if entry.min_quantity > quantity or (entry.moq is not None and entry.moq > quantity):
+            continue
+        key = (entry.wholesaler_id, entry.product_id)
+        if key not in chosen or entry.min_quantity > chosen[key].min_quantity:
+            chosen[key] = entry
+    if not chosen:
+        return 0
+    db.execute(insert(Offer), [
+        {"session_id": session_id, "wholesaler_id": wholesaler_id, "product_name": wanted[product_id]["name"], "product_id": product_id, "price": entry.price}
+        for (wholesaler_id, product_id), entry in chosen.items()
+    ])
+    refresh_best_prices(db, session_id, {wanted[product_id]["name"] for _, product_id in chosen})
+    return len(chosen)
+
+@app.post("/wholesaler/price_book")
+async def upload_price_book(
+    request: Request,
+    replace: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers can upload price books.")
+    fmt = upload_format(request)
+    wholesaler_id = current_user.id
+    stamp = datetime.utcnow().isoformat()
+    batch, errors = [], []
+    stored = error_count = 0
+
+    async for line_no, record in iter_upload_records(request, fmt, PRICE_BOOK_COLUMNS, ("name", "price")):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            batch.append(price_book_row(record, wholesaler_id, stamp))
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < PRICE_BOOK_MAX_ERRORS:
+                errors.append({"line": line_no, "error": str(e)})
+            continue
+        if len(batch) >= PRICE_BOOK_BATCH_SIZE:
+            rows, batch = batch, []
+            await db.run_sync(lambda s: upsert_price_book(s, rows))
+            await db.commit()
+            stored += len(rows)
+    if batch:
+        await db.run_sync(lambda s: upsert_price_book(s, batch))
+        stored += len(batch)
+    removed = 0
+    if replace:
+        result = await db.execute(
+            PriceBookEntry.__table__.delete().where(PriceBookEntry.wholesaler_id == wholesaler_id, PriceBookEntry.updated_at != stamp)
+        )
+        removed = result.rowcount or 0
+    await db.run_sync(lambda s: index_price_book_terms(s, wholesaler_id))
+    await db.commit()
+    logger.info("Price book upload wholesaler=%s rows=%s errors=%s removed=%s", wholesaler_id, stored, error_count, removed)
+    return {"stored": stored, "removed": removed, "error_count": error_count, "errors": errors}
+
+@app.get("/wholesaler/price_book")
+def get_price_book(
+    after: int | None = None,
+    limit: int = PRICE_BOOK_PAGE_SIZE,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal),
+):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers can view price books.")
+    limit = max(1, min(limit, PRICE_BOOK_MAX_PAGE_SIZE))
+    query = db.query(PriceBookEntry).filter(PriceBookEntry.wholesaler_id == current_user.id)
+    if after is not None:
+        query = query.filter(PriceBookEntry.id > after)
+    rows = query.order_by(PriceBookEntry.id.asc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    entries = [
+        {"id": r.id, "name": r.product_name, "price": r.price, "min_quantity": r.min_quantity, "moq": r.moq, "currency": r.currency, "updated_at": r.updated_at}
+        for r in rows
+    ]
+    return {"entries": entries, "next_cursor": rows[-1].id if has_more else None}
+
+# Helper: route sessions to a wholesaler for every product in their price book
+def index_price_book_terms(db: Session, wholesaler_id: int):
+    product_ids = db.query(PriceBookEntry.product_id).filter(
+        PriceBookEntry.wholesaler_id == wholesaler_id, PriceBookEntry.product_id.isnot(None)
+    ).distinct()
+    index_wholesaler_terms(db, wholesaler_id, "price_book", {f"p:{pid}": ROUTING_SKU_WEIGHT for (pid,) in product_ids})
+
+# Wholesaler capability profile
+# categories are matched against the words of requested product names and skus against canonical
+# products; both are written to the routing index. regions and capacity filter routing.
+class WholesalerProfileRequest(BaseModel):
+    categories: List[str] = []
+    skus: List[str] = []
+    regions: List[str] = []
+    capacity: int | None = None
+
+PROFILE_MAX_ENTRIES = 2000
+
+def profile_response(profile, terms: int) -> dict:
+    return {
+        "categories": json.loads(profile.categories or "[]") if profile else [],
+        "skus": json.loads(profile.skus or "[]") if profile else [],
+        "regions": json.loads(profile.regions or "[]") if profile else [],
+        "capacity": profile.capacity if profile else None,
+        "updated_at": profile.updated_at if profile else None,
+        "routing_terms": terms,
+    }
+
+@app.put("/wholesaler/profile")
+def update_wholesaler_profile(
+    req: WholesalerProfileRequest,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers have capability profiles.")
+    if len(req.categories) + len(req.skus) > PROFILE_MAX_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"Profiles are limited to {PROFILE_MAX_ENTRIES} categories and SKUs.")
+    if req.capacity is not None and req.capacity < 0:
+        raise HTTPException(status_code=400, detail="Capacity must not be negative.")
+    categories = sorted({" ".join(c.split()) for c in req.categories if routing_words(c)})
+    skus = sorted({" ".join(s.split()) for s in req.skus if product_key(s)})
+    regions = sorted({r.strip().lower() for r in req.regions if r.strip()})
+    terms = {f"w:{word}": ROUTING_CATEGORY_WEIGHT for c in categories for word in routing_words(c)}
+    product_ids = resolve_product_ids(db, skus)
+    terms.update({f"p:{pid}": ROUTING_SKU_WEIGHT for pid in product_ids.values() if pid is not None})
+
+    values = {
+        "categories": json.dumps(categories), "skus": json.dumps(skus), "regions": json.dumps(regions),
+        "capacity": req.capacity, "updated_at": datetime.utcnow().isoformat(),
+    }
+    stmt = dialect_insert(db, WholesalerProfile).values(wholesaler_id=current_user.id, **values)
+    db.execute(stmt.on_conflict_do_update(index_elements=["wholesaler_id"], set_=values))
+    index_wholesaler_terms(db, current_user.id, "profile", terms)
+    db.commit()
+    profile = db.query(WholesalerProfile).filter(WholesalerProfile.wholesaler_id == current_user.id).first()
+    count = db.query(func.count(WholesalerTerm.id)).filter(WholesalerTerm.wholesaler_id == current_user.id).scalar()
+    return profile_response(profile, count)
+
+@app.get("/wholesaler/profile")
+def get_wholesaler_profile(
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal),
+):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers have capability profiles.")
+    profile = db.query(WholesalerProfile).filter(WholesalerProfile.wholesaler_id == current_user.id).first()
+    count = db.query(func.count(WholesalerTerm.id)).filter(WholesalerTerm.wholesaler_id == current_user.id).scalar()
+    return profile_response(profile, count)
+
 # Wholesaler chat: list messages
+# after_id returns only messages with a larger id (the greeting has id 0 and is only sent on a
+# full fetch). The ETag changes with the last message id and the negotiation status, so a
+# matching If-None-Match is answered 304 before any message is loaded.
 @app.get("/wholesaler/chat/{session_id}")
-def get_chat(session_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_chat(
+    session_id: int,
+    after_id: int | None = None,
+    if_none_match: str | None = Header(default=None),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal),
+):
     if current_user.role != "wholesaler":
         raise HTTPException(status_code=403, detail="Only wholesalers can access this chat.")
-    msgs = db.query(ChatMessage).filter(ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == current_user.id).order_by(ChatMessage.id.asc()).all()
+    conversation = (ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == current_user.id)
     # Include status
-    wn = db.query(WholesalerNegotiation).filter(WholesalerNegotiation.session_id == session_id, WholesalerNegotiation.wholesaler_id == current_user.id).first()
+    chat_status = wholesaler_negotiation(db, session_id, current_user.id).status or "in_progress"
+    # Finalized conversations may have been compacted; their turns are then read back from the archive
+    archive = (ChatArchive.session_id == session_id, ChatArchive.wholesaler_id == current_user.id)
+    archived_through = (db.query(ChatArchive.last_message_id).filter(*archive).scalar() or 0) if chat_status == "finalized" else 0
+    last_id = max(db.query(func.max(ChatMessage.id)).filter(*conversation).scalar() or 0, archived_through)
+    etag = f'W/"chat-{session_id}-{last_id}-{chat_status}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    messages = []
+    if after_id is None:
+        opening = db.query(NegotiationSession.greeting, NegotiationSession.created_at).filter(NegotiationSession.id == session_id).first()
+        if opening and opening.greeting:
+            messages.append({"id": 0, "role": "assistant", "content": opening.greeting, "created_at": opening.created_at})
+    after = after_id or 0
+    if archived_through > after:
+        transcript = db.query(ChatArchive.transcript).filter(*archive).scalar()
+        messages.extend(m for m in unpack_transcript(transcript) if m["id"] > after and m["role"] != "system")
+    query = db.query(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at).filter(
+        *conversation, ChatMessage.role != "system",  # Filter out system messages
+        ChatMessage.id > max(after, archived_through),
+    )
+    messages.extend(
+        {"id": m.id, "role": m.role, "content": m.content, "created_at": m.created_at}
+        for m in query.order_by(ChatMessage.id.asc())
+    )
+    return JSONResponse({"status": chat_status, "last_id": last_id, "messages": messages}, headers=headers)
+
+# Full transcript of one negotiation for audits, including system messages, whether or not it has
+# been compacted. Wholesalers read their own; retailers name the wholesaler of a session they own.
+@app.get("/chat/{session_id}/transcript")
+def get_chat_transcript(
+    session_id: int,
+    wholesaler_id: int | None = None,
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_token_principal),
+):
+    if current_user.role == "wholesaler":
+        wholesaler_id = current_user.id
+    elif current_user.role == "retailer":
+        if session_retailer_id(session_id, db) != current_user.id:
+            raise HTTPException(status_code=404, detail="Session not found.")
+        if wholesaler_id is None:
+            raise HTTPException(status_code=400, detail="wholesaler_id is required.")
+    else:
+        raise HTTPException(status_code=403, detail="Not allowed to read transcripts.")
+    wn = db.query(WholesalerNegotiation.status, WholesalerNegotiation.finalized_at).filter(
+        WholesalerNegotiation.session_id == session_id, WholesalerNegotiation.wholesaler_id == wholesaler_id
+    ).first()
+    if not wn:
+        raise HTTPException(status_code=404, detail="Negotiation not found.")
+    session = db.query(NegotiationSession.system_prompt, NegotiationSession.greeting).filter(NegotiationSession.id == session_id).first()
+    archive = db.query(ChatArchive.last_message_id, ChatArchive.transcript, ChatArchive.archived_at).filter(
+        ChatArchive.session_id == session_id, ChatArchive.wholesaler_id == wholesaler_id
+    ).first()
+    messages = unpack_transcript(archive.transcript) if archive else []
+    messages.extend(
+        {"id": m.id, "role": m.role, "content": m.content, "created_at": m.created_at}
+        for m in db.query(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at).filter(
+            ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == wholesaler_id,
+            ChatMessage.id > (archive.last_message_id if archive else 0),
+        ).order_by(ChatMessage.id.asc())
+    )
     return {
-        "status": wn.status if wn else "in_progress",
-        "messages": [
-            {"role": m.role, "content": m.content, "created_at": m.created_at}
-            for m in msgs if m.role != "system"  # Filter out system messages
-        ]
+        "session_id": session_id,
+        "wholesaler_id": wholesaler_id,
+        "status": wn.status or "in_progress",
+        "finalized_at": wn.finalized_at,
+        "archived_at": archive.archived_at if archive else None,
+        "system_prompt": session.system_prompt if session else None,
+        "greeting": session.greeting if session else None,
+        "messages": messages,
     }
 
+# Compaction of finalized conversations
+# Once a negotiation has been finalized for COMPACTION_GRACE_SECONDS, its chat turns (including
+# the per-wholesaler system prompt copies of older sessions) are packed into one compressed
+# chat_archives row and its chat_messages/chat_summaries rows are deleted, so the hot chat tables
+# grow with active negotiations rather than lifetime volume. Each pass commits the archives first
+# and marks the negotiations last, so a pass interrupted in between is simply redone.
+COMPACTION_INTERVAL_SECONDS = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "300"))  # 0 disables the background job
+COMPACTION_GRACE_SECONDS = float(os.getenv("COMPACTION_GRACE_SECONDS", "3600"))
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "500"))  # chat rows per DELETE and per transaction
+COMPACTION_MAX_CONVERSATIONS = int(os.getenv("COMPACTION_MAX_CONVERSATIONS", "200"))  # conversations archived per pass
+COMPACTION_VACUUM_PAGES = int(os.getenv("COMPACTION_VACUUM_PAGES", "2000"))  # SQLite free pages released per run
+
+CHAT_COMPACTION = REGISTRY.counter("negokart_chat_compaction_total", "Conversations archived and hot rows deleted by compaction", ("kind",))
+
+def pack_transcript(messages: list[dict]) -> bytes:
+    return zlib.compress(json.dumps(messages, separators=(",", ":")).encode("utf-8"))
+
+def unpack_transcript(blob) -> list[dict]:
+    return json.loads(zlib.decompress(blob).decode("utf-8")) if blob else []
+
+# Helper: fold one conversation's hot turns into its archive row and drop its summary (not committed);
+# returns the ids of every hot row the archive now covers
+def archive_conversation(db: Session, session_id: int, wholesaler_id: int, stamp: str) -> list[int]:
+    archive = db.query(ChatArchive).filter(ChatArchive.session_id == session_id, ChatArchive.wholesaler_id == wholesaler_id).first()
+    rows = db.query(ChatMessage.id, ChatMessage.role, ChatMessage.content, ChatMessage.created_at).filter(
+        ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == wholesaler_id
+    ).order_by(ChatMessage.id.asc()).all()
+    through = archive.last_message_id if archive else 0
+    fresh = [{"id": r.id, "role": r.role, "content": r.content, "created_at": r.created_at} for r in rows if r.id > through]
+    if fresh:
+        if archive is None:
+            archive = ChatArchive(session_id=session_id, wholesaler_id=wholesaler_id)
+            db.add(archive)
+            messages = fresh
+        else:
+            messages = unpack_transcript(archive.transcript) + fresh
+        archive.transcript = pack_transcript(messages)
+        archive.message_count = len(messages)
+        archive.last_message_id = fresh[-1]["id"]
+        archive.archived_at = stamp
+    db.query(ChatSummary).filter(ChatSummary.session_id == session_id, ChatSummary.wholesaler_id == wholesaler_id).delete(synchronize_session=False)
+    return [r.id for r in rows]
+
+def compact_finalized_conversations(db: Session, limit: int = COMPACTION_MAX_CONVERSATIONS) -> tuple[int, int]:
+    """Archive up to limit finalized conversations; returns (conversations, hot rows deleted)"""
+    cutoff = (datetime.utcnow() - timedelta(seconds=COMPACTION_GRACE_SECONDS)).isoformat()
+    pending = db.query(WholesalerNegotiation.id, WholesalerNegotiation.session_id, WholesalerNegotiation.wholesaler_id).filter(
+        WholesalerNegotiation.status == "finalized",
+        WholesalerNegotiation.archived_at.is_(None),
+        WholesalerNegotiation.finalized_at < cutoff,
+    ).order_by(WholesalerNegotiation.finalized_at.asc()).limit(limit).all()
+    if not pending:
+        return 0, 0
+    stamp = datetime.utcnow().isoformat()
+    covered = {row.id: archive_conversation(db, row.session_id, row.wholesaler_id, stamp) for row in pending}
+    db.commit()
+    # SQLite assigns max(id) + 1, so deleting the newest row would let message ids (and after_id
+    # cursors) run backwards; that conversation is finished by a later pass instead
+    newest = db.query(func.max(ChatMessage.id)).scalar() if db.get_bind().dialect.name == "sqlite" else None
+    done = [wn_id for wn_id, ids in covered.items() if newest not in ids]
+    message_ids = [message_id for wn_id in done for message_id in covered[wn_id]]
+    # Hot rows go in bounded batches, one short transaction each, so chat writers are never held up
+    deleted = 0
+    for batch in chunked(message_ids, COMPACTION_BATCH_SIZE):
+        deleted += db.query(ChatMessage).filter(ChatMessage.id.in_(batch)).delete(synchronize_session=False)
+        db.commit()
+    if done:
+        db.query(WholesalerNegotiation).filter(WholesalerNegotiation.id.in_(done)).update(
+            {WholesalerNegotiation.archived_at: stamp}, synchronize_session=False
+        )
+        db.commit()
+    CHAT_COMPACTION.inc(len(done), kind="conversations")
+    CHAT_COMPACTION.inc(deleted, kind="messages")
+    return len(done), deleted
+
+# Helper: hand pages freed by compaction back to the filesystem. SQLite needs auto_vacuum=INCREMENTAL
+# (set by migration 11); on Postgres the batched deletes leave the dead tuples to autovacuum.
+def release_free_pages(bind=None):
+    bind = bind or engine
+    if bind.dialect.name != "sqlite" or COMPACTION_VACUUM_PAGES <= 0:
+        return
+    with bind.connect() as conn:
+        # executescript steps the pragma to completion; a plain execute frees a single page
+        conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({COMPACTION_VACUUM_PAGES});")
+
+def run_compaction() -> tuple[int, int]:
+    """One compaction run: archive passes until no finalized conversation is due, then vacuum"""
+    conversations = deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            archived, removed = compact_finalized_conversations(db)
+            conversations += archived
+            deleted += removed
+            if archived < COMPACTION_MAX_CONVERSATIONS:
+                break
+    finally:
+        db.close()
+    if deleted:
+        release_free_pages()
+        logger.info("Compacted %s conversations (%s chat rows archived)", conversations, deleted)
+    return conversations, deleted
+
+async def compaction_loop():
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(run_compaction)
+        except Exception:
+            logger.exception("Chat compaction failed")
+
 class ChatSendRequest(BaseModel):
     message: str
 
+# Conversation context management
+# The LLM sees the system prompt, a running summary of older turns, the latest quoted price
+# per product, and the last LLM_KEEP_TURNS messages verbatim, all within a per-model token budget.
+LLM_CONTEXT_BUDGETS = {
+    "llama3.2:3b": 3000,
+    "llama3.1": 6000,
+    "gpt-4o-mini": 12000,
+    "llama-3.1-70b-versatile": 12000,
+    "deepseek-chat": 12000,
+}
+LLM_CONTEXT_BUDGET = int(os.getenv("LLM_CONTEXT_BUDGET", "0"))  # overrides the per-model table when set
+LLM_DEFAULT_CONTEXT_BUDGET = 6000
+LLM_KEEP_TURNS = int(os.getenv("LLM_KEEP_TURNS", "6"))
+SUMMARY_LINE_CHARS = 240
+SUMMARY_MAX_LINES = 40
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token plus per-message overhead; close enough for budgeting
+    return len(text or "") // 4 + 4
+
+def context_budget(model: str) -> int:
+    if LLM_CONTEXT_BUDGET > 0:
+        return LLM_CONTEXT_BUDGET
+    return LLM_CONTEXT_BUDGETS.get(model, LLM_DEFAULT_CONTEXT_BUDGET)
+
+def active_llm_models() -> list[str]:
+    return [route.model for route in llm_router.routes] or [OLLAMA_MODEL]
+
+QUANTITY_HINT_RE = re.compile(r"quantity|qty|moq|units|\bx\b", re.IGNORECASE)
+
+# Helper: record the last price each side quoted per product mentioned in a message
+def update_price_state(state: dict, product_names: list[str], role: str, content: str):
+    side = "wholesaler" if role == "user" else "agent"
+    for name in product_names:
+        matches = re.findall(re.escape(name) + r"([^\d\n]{0,24}?)(\d+(?:\.\d+)?)", content or "", re.IGNORECASE)
+        # Ignore quantities and MOQs ("Rice (quantity: 10)", "Sugar MOQ 50")
+        prices = [value for gap, value in matches if not QUANTITY_HINT_RE.search(gap)]
+        if prices:
+            state.setdefault(name, {})[side] = float(prices[-1])
+
+def summary_line(role: str, content: str) -> str:
+    speaker = "Wholesaler" if role == "user" else "Agent"
+    text = " ".join((content or "").split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS - 3] + "..."
+    return f"{speaker}: {text}"
+
+def build_llm_context(session_id: int, wholesaler_id: int, db: Session) -> list[dict]:
+    """Return the message list for the next LLM call, folding turns that fell out of the
+    verbatim window into the persisted ChatSummary first. The session's system prompt and
+    greeting are always kept. In a chunked session past its first chunk, the prompt is rebuilt for
+    the current chunk and the message that opened it replaces the greeting."""
+    opening = db.query(NegotiationSession.system_prompt, NegotiationSession.greeting).filter(NegotiationSession.id == session_id).first()
+    chunk = negotiation_chunk(session_id, wholesaler_id, db)
+    if opening and opening.system_prompt and chunk and chunk.index > 0:
+        retailer_username = (
+            db.query(User.username)
+            .join(ProductList, ProductList.retailer_id == User.id)
+            .join(NegotiationSession, NegotiationSession.product_list_id == ProductList.id)
+            .filter(NegotiationSession.id == session_id)
+            .scalar()
+        )
+        head = [{"role": "system", "content": build_system_prompt(retailer_username or "the retailer", chunk.items, chunk)}]
+        opener = db.query(ChatMessage.content).filter(ChatMessage.id == chunk.started_after).scalar()
+        if opener:
+            head.append({"role": "assistant", "content": opener})
+    elif opening and opening.system_prompt:
+        head = [{"role": "system", "content": opening.system_prompt}]
+        if opening.greeting:
+            head.append({"role": "assistant", "content": opening.greeting})
+    else:
+        # Sessions created before prompts moved onto NegotiationSession
+        system_msg = db.query(ChatMessage).filter(ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == wholesaler_id, ChatMessage.role == "system").order_by(ChatMessage.id.asc()).first()
+        head = [{"role": "system", "content": system_msg.content}] if system_msg else []
+    state = db.query(ChatSummary).filter(ChatSummary.session_id == session_id, ChatSummary.wholesaler_id == wholesaler_id).first()
+    if state is None:
+        state = ChatSummary(session_id=session_id, wholesaler_id=wholesaler_id, summary="", summarized_through_id=0, price_state="{}")
+    tail = db.query(ChatMessage).filter(
+        ChatMessage.session_id == session_id,
+        ChatMessage.wholesaler_id == wholesaler_id,
+        ChatMessage.role != "system",
+        ChatMessage.id > max(state.summarized_through_id or 0, chunk.started_after if chunk else 0),
+    ).order_by(ChatMessage.id.asc()).all()
+
+    product_names = [p["name"] for p in chunk.items] if chunk else []
+    prices = json.loads(state.price_state or "{}")
+    keep_turns = max(LLM_KEEP_TURNS, 1)
+    fold, keep = tail[:-keep_turns], tail[-keep_turns:]
+    if fold:
+        lines = [l for l in (state.summary or "").split("\n") if l]
+        for m in fold:
+            lines.append(summary_line(m.role, m.content))
+            update_price_state(prices, product_names, m.role, m.content)
+        state.summary = "\n".join(lines[-SUMMARY_MAX_LINES:])
+        state.summarized_through_id = fold[-1].id
+        state.price_state = json.dumps(prices)
+        state.updated_at = datetime.utcnow().isoformat()
+        db.add(state)
+        db.commit()
+
+    # Prices quoted in the verbatim window are visible to the model already, but keep the
+    # structured view current so it survives trimming below
+    current_prices = json.loads(json.dumps(prices))
+    for m in keep:
+        update_price_state(current_prices, product_names, m.role, m.content)
+
+    summary_lines = [l for l in (state.summary or "").split("\n") if l]
+    recent = [{"role": m.role, "content": m.content} for m in keep]
+
+    def summary_message():
+        parts = []
+        if summary_lines:
+            parts.append("Summary of earlier conversation:\n" + "\n".join(summary_lines))
+        if current_prices:
+            price_lines = [
+                f"- {name}: " + ", ".join(f"{side} {price:g}" for side, price in sides.items())
+                for name, sides in current_prices.items()
+            ]
+            parts.append("Latest quoted per-unit prices:\n" + "\n".join(price_lines))
+        return {"role": "system", "content": "\n\n".join(parts)} if parts else None
+
+    # Any route may answer, so fit the smallest context window among them
+    budget = min(context_budget(model) for model in active_llm_models())
+    while True:
+        summary = summary_message()
+        messages = head + ([summary] if summary else []) + recent
+        if sum(estimate_tokens(m["content"]) for m in messages) <= budget:
+            return messages
+        # Trim oldest verbatim turns first (always keep the latest exchange), then old summary lines
+        if len(recent) > 2:
+            recent.pop(0)
+        elif summary_lines:
+            summary_lines.pop(0)
+        else:
+            return messages
+
+# Rule-based fast path for routine turns
+# A wholesaler message that is a plain price list for every requested product ("Rice 42, Sugar 38,
+# final") is answered without the LLM: the agent counters by a target discount (deeper for larger
+# quantities, conceding each round) and accepts once the wholesaler calls the prices final, meets
+# the counter, or FAST_PATH_MAX_ROUNDS is reached. Anything the parser isn't sure about - missing
+# products, extra numbers, conditions, questions, MOQs above the requested quantity - goes to the LLM.
+NEGOTIATION_FAST_PATH = os.getenv("NEGOTIATION_FAST_PATH", "1").lower() in ("1", "true", "yes")
+FAST_PATH_TARGET_DISCOUNT = float(os.getenv("FAST_PATH_TARGET_DISCOUNT", "0.08"))
+FAST_PATH_QTY_LEVERAGE = float(os.getenv("FAST_PATH_QTY_LEVERAGE", "0.01"))  # extra discount per 100 units
+FAST_PATH_MAX_LEVERAGE = float(os.getenv("FAST_PATH_MAX_LEVERAGE", "0.05"))
+FAST_PATH_MAX_ROUNDS = int(os.getenv("FAST_PATH_MAX_ROUNDS", "3"))  # counter-offers before accepting the latest quote
+FAST_PATH_ACCEPT_MARGIN = float(os.getenv("FAST_PATH_ACCEPT_MARGIN", "0.05"))  # closing quote allowed above our last counter
+
+NEGOTIATION_TURNS = REGISTRY.counter("negokart_negotiation_turns_total", "Wholesaler chat turns by how they were answered", ("path",))
+
+PRICE_NUMBER_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+MOQ_RE = re.compile(r"\b(?:moq|min(?:imum)?\.?(?:\s+order)?(?:\s+(?:qty|quantity))?)\s*(?:of|is|:|=|-)?\s*(\d+)(?:\s*units?)?", re.IGNORECASE)
+FAST_PATH_UNSURE_RE = re.compile(
+    r"\?|\$|\b(?:if|unless|provided|except|excluding|plus|extra|delivery|freight|shipping|gst|tax|credit|advance|usd|dollars?|per\s+(?:dozen|box|case|pack|bag|carton|quintal|tonne?|ton))\b",
+    re.IGNORECASE,
+)
+FAST_PATH_FINAL_RE = re.compile(r"\b(?:final|best\s+(?:possible\s+)?price|last\s+price|lowest|can'?t\s+go\s+(?:any\s+)?lower|take\s+it\s+or\s+leave\s+it)\b", re.IGNORECASE)
+
+@dataclass
+class PriceQuote:
+    prices: dict  # product name -> per-unit price
+    moqs: dict  # product name -> minimum order quantity, when stated
+    final: bool  # the wholesaler called these prices final
+
+# Helper: read a per-unit price (and MOQ) for every requested product from a wholesaler message
+# Returns None unless each product is named exactly once and followed by exactly one price.
+def parse_price_quote(message: str, products: list[dict]) -> PriceQuote | None:
+    text = message or ""
+    if not products or FAST_PATH_UNSURE_RE.search(text):
+        return None
+    # Locate product names, longest first so "Basmati Rice" isn't also read as "Rice"
+    spans, taken = [], [False] * len(text)
+    for p in sorted(products, key=lambda p: -len(p["name"])):
+        found = [
+            m for m in re.finditer(r"(?<!\w)" + re.escape(p["name"]) + r"(?:e?s)?(?!\w)", text, re.IGNORECASE)
+            if not any(taken[m.start():m.end()])
+        ]
+        if len(found) != 1:
+            return None
+        m = found[0]
+        taken[m.start():m.end()] = [True] * (m.end() - m.start())
+        spans.append((m.start(), m.end(), p))
+    spans.sort(key=lambda span: span[0])
+    if PRICE_NUMBER_RE.search(text[:spans[0][0]]):
+        return None  # numbers before the first product ("for 500 units: ...")
+
+    prices, moqs = {}, {}
+    for i, (_, end, p) in enumerate(spans):
+        segment = text[end:spans[i + 1][0] if i + 1 < len(spans) else len(text)]
+        moq = MOQ_RE.search(segment)
+        if moq:
+            moqs[p["name"]] = int(moq.group(1))
+            segment = segment[:moq.start()] + " " + segment[moq.end():]
+        numbers = PRICE_NUMBER_RE.findall(segment)
+        if len(numbers) != 1:
+            return None
+        price = float(numbers[0].replace(",", ""))
+        if price <= 0:
+            return None
+        if moqs.get(p["name"], 0) > (p.get("quantity") or 0):
+            return None  # the retailer has to decide on a larger order
+        prices[p["name"]] = price
+    return PriceQuote(prices=prices, moqs=moqs, final=bool(FAST_PATH_FINAL_RE.search(text)))
+
+# Helper: discount asked for on a product this round; shrinks linearly to zero at FAST_PATH_MAX_ROUNDS
+def fast_path_discount(quantity: int, rounds: int) -> float:
+    leverage = min(FAST_PATH_MAX_LEVERAGE, FAST_PATH_QTY_LEVERAGE * (quantity or 0) / 100)
+    return (FAST_PATH_TARGET_DISCOUNT + leverage) * max(0.0, 1 - rounds / max(FAST_PATH_MAX_ROUNDS, 1))
+
+def fast_path_turn(session_id: int, wholesaler_id: int, message: str, db: Session):
+    """Decide a routine turn without the LLM. Returns (reply, final_agreement or None), or None
+    when the message needs the model."""
+    chunk = negotiation_chunk(session_id, wholesaler_id, db)
+    products = chunk.items if chunk else []
+    quote = parse_price_quote(message, products)
+    if quote is None:
+        return None
+    # Rounds are counted within the current chunk
+    conversation = (ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == wholesaler_id, ChatMessage.id > chunk.started_after)
+    rounds = db.query(func.count(ChatMessage.id)).filter(*conversation, ChatMessage.role == "assistant").scalar() or 0
+    last_reply = db.query(ChatMessage.content).filter(*conversation, ChatMessage.role == "assistant").order_by(ChatMessage.id.desc()).first()
+    state = {}
+    if last_reply:
+        update_price_state(state, [p["name"] for p in products], "assistant", last_reply.content)
+    last_counters = {name: sides["agent"] for name, sides in state.items() if "agent" in sides}
+    # The wholesaler's latest complete quote before this message
+    previous = None
+    earlier = db.query(ChatMessage.content).filter(*conversation, ChatMessage.role == "user").order_by(ChatMessage.id.desc()).offset(1).limit(FAST_PATH_MAX_ROUNDS + 1)
+    for (content,) in earlier:
+        previous = parse_price_quote(content, products)
+        if previous is not None:
+            break
+
+    counters = {}
+    for p in products:
+        quoted = quote.prices[p["name"]]
+        counter = round(quoted * (1 - fast_path_discount(p["quantity"], rounds)), 2)
+        # Never walk back an earlier counter, never ask for more than the quote
+        counters[p["name"]] = min(max(counter, last_counters.get(p["name"], 0)), quoted)
+    met = len(last_counters) == len(products) and all(quote.prices[n] <= last_counters[n] for n in last_counters)
+    closing = quote.final or rounds >= FAST_PATH_MAX_ROUNDS or all(counters[n] >= quote.prices[n] for n in counters)
+    if closing and not met:
+        # Only close after countering at least once, and never on a quote that went up:
+        # each price must be no higher than the previous quote or within the margin of our counter
+        acceptable = len(last_counters) == len(products) and all(
+            (previous is not None and quote.prices[n] <= previous.prices[n])
+            or quote.prices[n] <= last_counters[n] * (1 + FAST_PATH_ACCEPT_MARGIN)
+            for n in last_counters
+        )
+        if not acceptable:
+            return None
+    if closing or met:
+        items = [
+            {"name": p["name"], "final_price": quote.prices[p["name"]], **({"moq": quote.moqs[p["name"]]} if p["name"] in quote.moqs else {})}
+            for p in products
+        ]
+        summary = ", ".join(f"{p['name']} {quote.prices[p['name']]:.2f}" for p in products)
+        if chunk.index + 1 < chunk.count:
+            reply = f"Agreed, thank you. Final per-unit prices for batch {chunk.index + 1}: {summary} (INR)."
+        else:
+            reply = f"Agreed, thank you. Final per-unit prices: {summary} (INR). We'll confirm the order with the retailer."
+        return reply, {"currency": "INR", "items": items}
+    counter_text = ", ".join(f"{name}: {price:.2f}" for name, price in counters.items())
+    reply = (
+        f"Thanks for the quote. Given our volumes, can you do {counter_text}? "
+        "If you can meet these, we can close today."
+    )
+    return reply, None
+
+# Helper: answer the wholesaler's (already persisted) message through the fast path when it applies
+# Returns (reply, finalized), or None when the LLM should answer.
+async def try_fast_path_turn(session_id: int, wholesaler_id: int, message: str, db: AsyncSession):
+    if not NEGOTIATION_FAST_PATH:
+        NEGOTIATION_TURNS.inc(path="llm")
+        return None
+    decision = await db.run_sync(lambda s: fast_path_turn(session_id, wholesaler_id, message, s))
+    if decision is None:
+        NEGOTIATION_TURNS.inc(path="llm")
+        return None
+    reply, agreement = decision
+    NEGOTIATION_TURNS.inc(path="accept" if agreement else "counter")
+    db.add(ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="assistant", content=reply))
+    await db.commit()
+    finalized = bool(agreement) and await db.run_sync(lambda s: apply_final_agreement(session_id, wholesaler_id, agreement, s))
+    return reply, finalized
+
 # Wholesaler chat: send a message, AI replies
-@app.post("/wholesaler/chat/{session_id}")
-async def send_chat(session_id: int, req: ChatSendRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    if current_user.role != "wholesaler":
-        raise HTTPException(status_code=403, detail="Only wholesalers can send chat messages.")
+# Async endpoints use AsyncSession; the shared sync helpers (context building, finalization)
+# run through run_sync so their queries also go through the async driver.
+async def process_chat_turn(session_id: int, wholesaler_id: int, message: str, db: AsyncSession):
+    """Persist a wholesaler message, get the AI reply and apply any final agreement.
+    Returns (reply, finalized)."""
     # Persist wholesaler message
-    user_msg = ChatMessage(session_id=session_id, wholesaler_id=current_user.id, role="user", content=req.message)
+    user_msg = ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="user", content=message)
     db.add(user_msg)
-    db.commit()
+    await db.commit()
+
+    # Routine price lists are answered by the rule-based fast path
+    fast = await try_fast_path_turn(session_id, wholesaler_id, message, db)
+    if fast is not None:
+        return fast
 
-    # Build conversation history for LLM
-    raw_msgs = db.query(ChatMessage).filter(ChatMessage.session_id == session_id, ChatMessage.wholesaler_id == current_user.id).order_by(ChatMessage.id.asc()).all()
-    history = [{"role": m.role, "content": m.content} for m in raw_msgs]
+    # Build token-budgeted conversation context for LLM
+    history = await db.run_sync(lambda s: build_llm_context(session_id, wholesaler_id, s))
 
     # Generate AI reply
     ai_text = await generate_ai_reply(history)
 
-    ai_msg = ChatMessage(session_id=session_id, wholesaler_id=current_user.id, role="assistant", content=ai_text or "")
+    ai_msg = ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="assistant", content=ai_text or "")
     db.add(ai_msg)
-    db.commit()
+    await db.commit()
 
     # If AI produced final JSON, parse and store offers + mark finalized
-    finalized = maybe_apply_final_json(session_id, current_user.id, ai_text or "", db)
+    finalized = await db.run_sync(lambda s: maybe_apply_final_json(session_id, wholesaler_id, ai_text or "", s))
+    return ai_msg.content, finalized
 
-    return {"reply": ai_msg.content, "finalized": finalized}
+@app.post("/wholesaler/chat/{session_id}")
+async def send_chat(session_id: int, req: ChatSendRequest, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers can send chat messages.")
+    wn = await db.run_sync(lambda s: wholesaler_negotiation(s, session_id, current_user.id))
+    if wn.status == "finalized":
+        raise HTTPException(status_code=409, detail="This negotiation is already finalized.")
+    reply, finalized = await process_chat_turn(session_id, current_user.id, req.message, db)
+    return {"reply": reply, "finalized": finalized}
+
+# Wholesaler chat: send a message, AI reply is streamed back as Server-Sent Events
+@app.post("/wholesaler/chat/{session_id}/stream")
+async def send_chat_stream(session_id: int, req: ChatSendRequest, db: AsyncSession = Depends(get_async_db), current_user: Principal = Depends(get_current_user)):
+    if current_user.role != "wholesaler":
+        raise HTTPException(status_code=403, detail="Only wholesalers can send chat messages.")
+    wholesaler_id = current_user.id
+    wn = await db.run_sync(lambda s: wholesaler_negotiation(s, session_id, wholesaler_id))
+    if wn.status == "finalized":
+        raise HTTPException(status_code=409, detail="This negotiation is already finalized.")
+    user_msg = ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="user", content=req.message)
+    db.add(user_msg)
+    await db.commit()
+    fast = await try_fast_path_turn(session_id, wholesaler_id, req.message, db)
+    if fast is not None:
+        reply, finalized = fast
 
-# Database initialization and health check
-def init_database():
-    """Initialize database and create tables"""
-    try:
-        # Test database connection
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        logger.info("Database connection successful")
-        
-        # Create tables
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully")
-        
-        # Create default users if they don't exist
-        db = SessionLocal()
-        try:
-            # Check if any users exist
-            user_count = db.query(User).count()
-            if user_count == 0:
-                logger.info("No users found, creating default users")
-                
-                # Create default retailer with shorter password
-                retailer_password = get_password_hash("retailer")
-                retailer = User(username="retailer", hashed_password=retailer_password, role="retailer")
-                db.add(retailer)
-                
-                # Create default wholesaler with shorter password
-                wholesaler_password = get_password_hash("wholesaler")
-                wholesaler = User(username="wholesaler", hashed_password=wholesaler_password, role="wholesaler")
-                db.add(wholesaler)
-                
-                db.commit()
-                logger.info("Default users created: retailer/retailer, wholesaler/wholesaler")
-            else:
-                logger.info(f"Database initialized with {user_count} existing users")
-        finally:
-            db.close()
-            
-    except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
-        raise
+        async def fast_stream():
+            yield sse_event({"token": reply})
+            yield sse_event({"reply": reply, "finalized": finalized}, event="done")
+
+        return StreamingResponse(fast_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    history = await db.run_sync(lambda s: build_llm_context(session_id, wholesaler_id, s))
 
-# Initialize database
-init_database()
+    async def event_stream():
+        parts = []
+        try:
+            async for token in stream_ai_reply(history):
+                parts.append(token)
+                yield sse_event({"token": token})
+        except LLMRouteError:
+            # The reply was cut off: store the fallback instead of the partial text, never apply it
+            async with AsyncSessionLocal() as stream_db:
+                stream_db.add(ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="assistant", content=LLM_FALLBACK_REPLY))
+                await stream_db.commit()
+            yield sse_event({"detail": "The AI reply was interrupted.", "reply": LLM_FALLBACK_REPLY, "finalized": False}, event="error")
+            return
+        ai_text = "".join(parts)
+        # The request-scoped session is closed once streaming starts, so use a fresh one
+        async with AsyncSessionLocal() as stream_db:
+            stream_db.add(ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="assistant", content=ai_text))
+            await stream_db.commit()
+            finalized = await stream_db.run_sync(lambda s: maybe_apply_final_json(session_id, wholesaler_id, ai_text, s))
+        yield sse_event({"reply": ai_text, "finalized": finalized}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
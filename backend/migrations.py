@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations.
+
+Run once per deploy, before starting the web workers:
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # show applied/pending versions
+
+Applied versions are recorded in the schema_migrations table. Each step creates or
+alters only the tables, columns and indexes it introduced, from the frozen definitions
+below rather than the current models in main.py, so a version number always names the
+same schema. Data backfills are frozen the same way (migration 9 carries its own copy of
+the product-name matching rules). Steps are idempotent so databases created before versioning was introduced
+upgrade cleanly. Runs are serialized with a lock, so workers started together with
+AUTO_MIGRATE wait for the first one instead of migrating in parallel.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, Float, ForeignKey, Index, Integer, LargeBinary, MetaData, String, Table,
+    inspect, insert, select, text,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: local development runs a single worker
+    fcntl = None
+
+import main
+from main import get_password_hash
+
+logger = logging.getLogger("negokart.backend")
+
+# Frozen table definitions
+# Never edit a definition an applied migration has used; later changes go in a new migration.
+
+# v1: the schema when versioning was introduced
+v1 = MetaData()
+users_v1 = Table(
+    "users", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("role", String),
+)
+product_lists_v1 = Table(
+    "product_lists", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("retailer_id", Integer),
+    Column("products", String),
+)
+product_list_items_v1 = Table(
+    "product_list_items", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("product_list_id", Integer, ForeignKey("product_lists.id"), index=True),
+    Column("position", Integer),
+    Column("name", String),
+    Column("quantity", Integer),
+)
+negotiation_sessions_v1 = Table(
+    "negotiation_sessions", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("product_list_id", Integer, ForeignKey("product_lists.id")),
+    Column("system_prompt", String, nullable=True),
+    Column("greeting", String, nullable=True),
+    Column("created_at", String, nullable=True),
+)
+offers_v1 = Table(
+    "offers", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer, ForeignKey("negotiation_sessions.id")),
+    Column("wholesaler_id", Integer),
+    Column("product_name", String),
+    Column("price", Float),
+    Index("ux_offers_session_wholesaler_product", "session_id", "wholesaler_id", "product_name", unique=True),
+)
+wholesaler_negotiations_v1 = Table(
+    "wholesaler_negotiations", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer, index=True),
+    Column("wholesaler_id", Integer, index=True),
+    Column("status", String),
+    Column("finalized_at", String, nullable=True),
+    Index("ix_wholesaler_negotiations_wholesaler_status_session", "wholesaler_id", "status", "session_id"),
+)
+wholesaler_history_v1 = Table(
+    "wholesaler_history", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer, index=True),
+    Column("wholesaler_id", Integer, index=True),
+    Column("retailer_id", Integer, index=True),
+    Column("finalized_at", String),
+    Column("data", String),
+)
+chat_messages_v1 = Table(
+    "chat_messages", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer, index=True),
+    Column("wholesaler_id", Integer, index=True),
+    Column("role", String),
+    Column("content", String),
+    Column("created_at", String),
+)
+chat_summaries_v1 = Table(
+    "chat_summaries", v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer),
+    Column("wholesaler_id", Integer),
+    Column("summary", String),
+    Column("summarized_through_id", Integer),
+    Column("price_state", String),
+    Column("updated_at", String, nullable=True),
+    Index("ux_chat_summaries_session_wholesaler", "session_id", "wholesaler_id", unique=True),
+)
+
+# v4
+v4 = MetaData()
+session_best_prices_v4 = Table(
+    "session_best_prices", v4,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer),
+    Column("product_name", String),
+    Column("quantity", Integer, nullable=True),
+    Column("best_price", Float, nullable=True),
+    Column("best_wholesaler_id", Integer, nullable=True),
+    Column("best_wholesaler", String, nullable=True),
+    Column("second_price", Float, nullable=True),
+    Column("offer_count", Integer),
+    Column("line_total", Float, nullable=True),
+    Index("ux_session_best_prices_session_product", "session_id", "product_name", unique=True),
+)
+
+# v7
+v7 = MetaData()
+price_book_entries_v7 = Table(
+    "price_book_entries", v7,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("wholesaler_id", Integer),
+    Column("product_name", String),
+    Column("normalized_name", String),
+    Column("min_quantity", Integer),
+    Column("price", Float),
+    Column("moq", Integer, nullable=True),
+    Column("currency", String),
+    Column("updated_at", String, nullable=True),
+    Index("ux_price_book_entries_wholesaler_name_tier", "wholesaler_id", "normalized_name", "min_quantity", unique=True),
+    Index("ix_price_book_entries_name_wholesaler", "normalized_name", "wholesaler_id", "min_quantity"),
+)
+
+# v9
+v9 = MetaData()
+products_v9 = Table(
+    "products", v9,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("key", String, unique=True),
+    Column("name", String),
+    Column("gram_count", Integer),
+    Column("created_at", String, nullable=True),
+)
+product_aliases_v9 = Table(
+    "product_aliases", v9,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String, unique=True),
+    Column("product_id", Integer, ForeignKey("products.id"), index=True),
+)
+product_grams_v9 = Table(
+    "product_grams", v9,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("gram", String),
+    Column("product_id", Integer, ForeignKey("products.id")),
+    Index("ux_product_grams_gram_product", "gram", "product_id", unique=True),
+)
+
+# v10
+v10 = MetaData()
+wholesaler_profiles_v10 = Table(
+    "wholesaler_profiles", v10,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("wholesaler_id", Integer, unique=True),
+    Column("categories", String),
+    Column("skus", String),
+    Column("regions", String),
+    Column("capacity", Integer, nullable=True),
+    Column("updated_at", String, nullable=True),
+)
+wholesaler_terms_v10 = Table(
+    "wholesaler_terms", v10,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("term", String),
+    Column("wholesaler_id", Integer),
+    Column("source", String),
+    Column("weight", Float),
+    Index("ux_wholesaler_terms_term_wholesaler_source", "term", "wholesaler_id", "source", unique=True),
+    Index("ix_wholesaler_terms_wholesaler_source", "wholesaler_id", "source"),
+)
+
+# v11
+v11 = MetaData()
+chat_archives_v11 = Table(
+    "chat_archives", v11,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", Integer),
+    Column("wholesaler_id", Integer),
+    Column("message_count", Integer),
+    Column("last_message_id", Integer),
+    Column("transcript", LargeBinary),
+    Column("archived_at", String, nullable=True),
+    Index("ux_chat_archives_session_wholesaler", "session_id", "wholesaler_id", unique=True),
+)
+
+# DDL helpers
+def add_columns(engine, table: str, *columns: Column):
+    """Add the columns a table doesn't have yet"""
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    with engine.begin() as conn:
+        for column in columns:
+            if column.name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"))
+                logger.info("Added column %s.%s", table, column.name)
+
+def ensure_tables(engine, *tables: Table):
+    """Create missing tables; on existing ones (from before versioning) add missing columns and indexes"""
+    existing = inspect(engine)
+    for table in tables:
+        if not existing.has_table(table.name):
+            table.create(bind=engine)
+            continue
+        add_columns(engine, table.name, *table.columns)
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def create_index(engine, ddl: str):
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+
+# Steps
+def baseline_schema(engine):
+    """Tables as of version 1"""
+    if inspect(engine).has_table("offers"):
+        existing_indexes = {i["name"] for i in inspect(engine).get_indexes("offers")}
+        if "ux_offers_session_wholesaler_product" not in existing_indexes:
+            # Older databases may hold duplicate offers from the previous select-then-insert upsert
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "DELETE FROM offers WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM offers GROUP BY session_id, wholesaler_id, product_name)"
+                ))
+    ensure_tables(engine, *v1.sorted_tables)
+
+def backfill_product_items(engine):
+    """Populate product_list_items for product lists stored before the table existed"""
+    lists, items = product_lists_v1, product_list_items_v1
+    has_items = select(items.c.id).where(items.c.product_list_id == lists.c.id).exists()
+    with engine.begin() as conn:
+        rows = []
+        for list_id, products in conn.execute(select(lists.c.id, lists.c.products).where(~has_items)):
+            try:
+                products = json.loads(products or "[]")
+            except Exception:
+                continue
+            rows.extend(
+                {"product_list_id": list_id, "position": i, "name": p["name"], "quantity": p["quantity"]}
+                for i, p in enumerate(products)
+            )
+        if rows:
+            conn.execute(insert(items), rows)
+            logger.info("Backfilled %s product list items", len(rows))
+
+def seed_default_users(engine):
+    """Create default users on an empty database"""
+    with engine.begin() as conn:
+        if conn.execute(select(users_v1.c.id).limit(1)).first() is None:
+            conn.execute(insert(users_v1), [
+                {"username": "retailer", "hashed_password": get_password_hash("retailer"), "role": "retailer"},
+                {"username": "wholesaler", "hashed_password": get_password_hash("wholesaler"), "role": "wholesaler"},
+            ])
+            logger.info("Default users created: retailer/retailer, wholesaler/wholesaler")
+
+def backfill_best_prices(engine, batch_size: int = 500):
+    """Add session_best_prices and build its rows for sessions created before the table existed"""
+    ensure_tables(engine, session_best_prices_v4)
+    sessions, items, offers, users, best = negotiation_sessions_v1, product_list_items_v1, offers_v1, users_v1, session_best_prices_v4
+    with engine.begin() as conn:
+        quantities = defaultdict(dict)
+        for session_id, name, quantity in conn.execute(
+            select(sessions.c.id, items.c.name, items.c.quantity).join(items, items.c.product_list_id == sessions.c.product_list_id)
+        ):
+            quantities[session_id][name] = quantity
+        bids = defaultdict(lambda: defaultdict(list))
+        for session_id, name, price, wholesaler_id, username in conn.execute(
+            select(offers.c.session_id, offers.c.product_name, offers.c.price, offers.c.wholesaler_id, users.c.username)
+            .outerjoin(users, users.c.id == offers.c.wholesaler_id)
+            .where(offers.c.price.isnot(None))
+            .order_by(offers.c.price, offers.c.id)
+        ):
+            bids[session_id][name].append((price, wholesaler_id, username or f"Wholesaler {wholesaler_id}"))
+        present = set(conn.execute(select(best.c.session_id, best.c.product_name)).tuples())
+        rows = []
+        for session_id in set(quantities) | set(bids):
+            for name in sorted(set(quantities.get(session_id, {})) | set(bids.get(session_id, {}))):
+                if (session_id, name) in present:
+                    continue
+                ranked = bids.get(session_id, {}).get(name, [])
+                price, wholesaler_id, username = ranked[0] if ranked else (None, None, None)
+                quantity = quantities.get(session_id, {}).get(name)
+                rows.append({
+                    "session_id": session_id, "product_name": name, "quantity": quantity,
+                    "best_price": price, "best_wholesaler_id": wholesaler_id, "best_wholesaler": username,
+                    "second_price": ranked[1][0] if len(ranked) > 1 else None,
+                    "offer_count": len(ranked),
+                    "line_total": price * quantity if price is not None and quantity is not None else None,
+                })
+        for start in range(0, len(rows), batch_size):
+            conn.execute(insert(best), rows[start:start + batch_size])
+        logger.info("Backfilled best prices for %s sessions", len({row["session_id"] for row in rows}))
+
+def wholesaler_history_keyset_index(engine):
+    create_index(engine, (
+        "CREATE INDEX IF NOT EXISTS ix_wholesaler_history_wholesaler_finalized "
+        "ON wholesaler_history (wholesaler_id, finalized_at DESC, id DESC)"
+    ))
+
+def chat_messages_conversation_index(engine):
+    create_index(engine, (
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_session_wholesaler_id "
+        "ON chat_messages (session_id, wholesaler_id, id)"
+    ))
+
+def price_book_entries(engine):
+    ensure_tables(engine, price_book_entries_v7)
+
+def negotiation_chunks(engine):
+    add_columns(engine, "negotiation_sessions", Column("chunk_size", Integer))
+    add_columns(engine, "wholesaler_negotiations", Column("chunk_index", Integer), Column("chunk_message_id", Integer))
+
+# v9 name resolution, frozen as shipped: later changes to main.product_key or the match
+# threshold must not change what migration 9 writes
+V9_UNIT_ALIASES = {
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogram": "kg", "kilograms": "kg",
+    "g": "g", "gm": "g", "gms": "g", "gram": "g", "grams": "g",
+    "l": "l", "ltr": "l", "ltrs": "l", "litre": "l", "litres": "l", "liter": "l", "liters": "l",
+    "ml": "ml", "mls": "ml", "pc": "pc", "pcs": "pc", "piece": "pc", "pieces": "pc",
+}
+V9_PACK_SIZE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(" + "|".join(sorted(V9_UNIT_ALIASES, key=len, reverse=True)) + r")\b")
+V9_MATCH_THRESHOLD = 0.65
+V9_MATCH_CANDIDATES = 5
+
+def v9_product_key(name: str) -> str:
+    value = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", (name or "").lower())  # keep decimal points only
+    value = re.sub(r"[^\w\s.]", " ", value)
+    value = V9_PACK_SIZE_RE.sub(lambda m: m.group(1) + V9_UNIT_ALIASES[m.group(2)], value)
+    return " ".join(sorted(value.split()))
+
+def v9_product_grams(key: str) -> set[str]:
+    grams = set()
+    for word in key.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def v9_key_numbers(key: str) -> list[str]:
+    return sorted(word for word in key.split() if any(c.isdigit() for c in word))
+
+def v9_fuzzy_match(key: str, known: dict, gram_index: dict) -> int | None:
+    """Existing product (id -> (key, gram_count)) whose key is a close spelling of this one"""
+    grams = v9_product_grams(key)
+    shared = defaultdict(int)
+    for gram in grams:
+        for product_id in gram_index.get(gram, ()):
+            shared[product_id] += 1
+    words, numbers = len(key.split()), v9_key_numbers(key)
+    best = None
+    for product_id, count in sorted(shared.items(), key=lambda kv: (-kv[1], kv[0]))[:V9_MATCH_CANDIDATES]:
+        candidate, gram_count = known[product_id]
+        if len(candidate.split()) != words or v9_key_numbers(candidate) != numbers:
+            continue
+        score = count / (len(grams) + gram_count - count)
+        if score >= V9_MATCH_THRESHOLD and (best is None or score > best[0]):
+            best = (score, product_id)
+    return best[1] if best else None
+
+def v9_resolve_names(conn, names: list[str], batch_size: int):
+    """Match each name by alias, then key, then trigram similarity to a product that existed before
+    its batch; unmatched keys become new products. Every resolved name is recorded as an alias."""
+    known = {pid: (key, gram_count or 0) for pid, key, gram_count in conn.execute(
+        select(products_v9.c.id, products_v9.c.key, products_v9.c.gram_count)
+    )}
+    by_key = {key: pid for pid, (key, _) in known.items()}
+    gram_index = defaultdict(set)
+    for gram, product_id in conn.execute(select(product_grams_v9.c.gram, product_grams_v9.c.product_id)):
+        gram_index[gram].add(product_id)
+    aliased = {name for (name,) in conn.execute(select(product_aliases_v9.c.name))}
+    names = [name for name in names if name not in aliased]
+    for start in range(0, len(names), batch_size):
+        keys = {name: v9_product_key(name) for name in names[start:start + batch_size]}
+        matched, new = {}, {}  # key -> product id; key -> first spelling
+        for name, key in keys.items():
+            if not key or key in by_key or key in matched or key in new:
+                continue
+            product_id = v9_fuzzy_match(key, known, gram_index)
+            if product_id:
+                matched[key] = product_id
+            else:
+                new[key] = name
+        stamp = datetime.utcnow().isoformat()
+        for key, name in new.items():
+            grams = v9_product_grams(key)
+            product_id = conn.execute(
+                insert(products_v9).values(key=key, name=name, gram_count=len(grams), created_at=stamp)
+            ).inserted_primary_key[0]
+            conn.execute(insert(product_grams_v9), [{"gram": gram, "product_id": product_id} for gram in sorted(grams)])
+            known[product_id] = (key, len(grams))
+            by_key[key] = product_id
+            for gram in grams:
+                gram_index[gram].add(product_id)
+        by_key.update(matched)
+        aliases = [{"name": name, "product_id": by_key[key]} for name, key in keys.items() if key]
+        if aliases:
+            conn.execute(insert(product_aliases_v9), aliases)
+
+def backfill_product_identity(engine, batch_size: int = 500):
+    """Add canonical products, resolve every stored product name to one, then fill the product_id
+    columns with one UPDATE per table joined through the alias table"""
+    ensure_tables(engine, *v9.sorted_tables)
+    targets = (("product_list_items", "name"), ("offers", "product_name"), ("price_book_entries", "product_name"))
+    for table, _ in targets:
+        add_columns(engine, table, Column("product_id", Integer))
+    with engine.begin() as conn:
+        # Superseded by the product_id index; prefill no longer matches on normalized_name
+        conn.execute(text("DROP INDEX IF EXISTS ix_price_book_entries_name_wholesaler"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_price_book_entries_product_wholesaler "
+            "ON price_book_entries (product_id, wholesaler_id, min_quantity)"
+        ))
+        names = set()
+        for table, column in targets:
+            names.update(name for (name,) in conn.execute(text(f"SELECT DISTINCT {column} FROM {table}")) if name)
+        v9_resolve_names(conn, sorted(names), batch_size)
+        logger.info("Resolved %s product names", len(names))
+        for table, column in targets:
+            conn.execute(text(
+                f"UPDATE {table} SET product_id = "
+                f"(SELECT a.product_id FROM product_aliases a WHERE a.name = {table}.{column}) "
+                "WHERE product_id IS NULL"
+            ))
+
+def wholesaler_routing(engine):
+    ensure_tables(engine, *v10.sorted_tables)
+
+def chat_archives(engine):
+    """Add the transcript archive, then switch SQLite to incremental auto-vacuum (a one-off full
+    VACUUM) so compaction can release freed pages; on Postgres, vacuum chat_messages sooner"""
+    ensure_tables(engine, chat_archives_v11)
+    add_columns(engine, "wholesaler_negotiations", Column("archived_at", String))
+    create_index(engine, (
+        "CREATE INDEX IF NOT EXISTS ix_wholesaler_negotiations_status_archived_finalized "
+        "ON wholesaler_negotiations (status, archived_at, finalized_at)"
+    ))
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+                logger.info("Enabled incremental auto-vacuum")
+    elif engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text(
+                "ALTER TABLE chat_messages SET (autovacuum_vacuum_scale_factor = 0.02, autovacuum_vacuum_threshold = 1000)"
+            ))
+
+# (version, name, step) -- append only; never renumber an applied step or change the schema it produces
+MIGRATIONS = [
+    (1, "sync_schema", baseline_schema),
+    (2, "backfill_product_list_items", backfill_product_items),
+    (3, "seed_default_users", seed_default_users),
+    (4, "session_best_prices", backfill_best_prices),
+    (5, "wholesaler_history_keyset_index", wholesaler_history_keyset_index),
+    (6, "chat_messages_conversation_index", chat_messages_conversation_index),
+    (7, "price_book_entries", price_book_entries),
+    (8, "negotiation_chunks", negotiation_chunks),
+    (9, "canonical_products", backfill_product_identity),
+    (10, "wholesaler_routing", wholesaler_routing),
+    (11, "chat_archives", chat_archives),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+MIGRATION_LOCK_KEY = 0x4E474B4D  # pg_advisory_lock key ("NGKM")
+
+@contextmanager
+def migration_lock(engine):
+    """Hold an exclusive lock across a migration run: a Postgres advisory lock, or a lock
+    file next to the SQLite database"""
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                conn.commit()
+        return
+    database = engine.url.database if engine.dialect.name == "sqlite" else None
+    if fcntl is None or not database or database == ":memory:":
+        yield
+        return
+    with open(os.path.abspath(database) + ".migrate.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at VARCHAR NOT NULL)"
+        ))
+
+def applied_versions(engine) -> set[int]:
+    ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+def run_migrations(engine=None) -> list[int]:
+    """Apply pending migrations in order; returns the versions applied"""
+    engine = engine or main.engine
+    applied = []
+    with migration_lock(engine):
+        # Read under the lock: a run that held it before us may have applied everything
+        done = applied_versions(engine)
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info("Applying migration %s_%s", version, name)
+            step(engine)
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": version, "n": name, "t": datetime.utcnow().isoformat()},
+                )
+            applied.append(version)
+    if applied:
+        logger.info("Database migrated to version %s", LATEST_VERSION)
+    else:
+        logger.info("Database schema up to date (version %s)", LATEST_VERSION)
+    return applied
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply NegoKart database migrations")
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations")
+    args = parser.parse_args()
+    if args.status:
+        done = applied_versions(main.engine)
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:>4}  {name:<32} {'applied' if version in done else 'pending'}")
+    else:
+        run_migrations()
@@ -0,0 +1,99 @@
+"""
+Password hashing helpers.
+
+Kept free of import-time side effects so the functions can run in the worker
+processes of the hashing pool in main.py.
+"""
+import hashlib
+import logging
+import secrets
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger("negokart.backend")
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Simple but secure password hashing for production
+def simple_hash_password(password: str) -> str:
+    """Create a secure hash of the password"""
+    salt = secrets.token_hex(16)
+    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
+    return f"{salt}:{password_hash.hex()}"
+
+def simple_verify_password(password: str, hashed: str) -> bool:
+    """Verify a password against its hash"""
+    try:
+        salt, stored_hash = hashed.split(':')
+        password_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
+        return secrets.compare_digest(password_hash.hex(), stored_hash)
+    except Exception:
+        return False
+
+@lru_cache(maxsize=1)
+def bcrypt_available() -> bool:
+    """Probe bcrypt once per process, on first use rather than at import"""
+    try:
+        pwd_context.hash("test")
+        logger.info("Using bcrypt for password hashing")
+        return True
+    except Exception as e:
+        logger.warning(f"bcrypt not available, using fallback hashing: {e}")
+        return False
+
+def is_bcrypt_hash(hashed: str) -> bool:
+    return (hashed or "").startswith("$2")
+
+def truncate_for_bcrypt(password: str) -> str:
+    # bcrypt only uses the first 72 bytes
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        password = password_bytes[:72].decode('utf-8', errors='ignore')
+    return password
+
+def get_password_hash(password: str) -> str:
+    """Hash a password using the best available method"""
+    try:
+        if not isinstance(password, str):
+            password = str(password)
+        if bcrypt_available():
+            return pwd_context.hash(truncate_for_bcrypt(password))
+        return simple_hash_password(password)
+    except Exception as e:
+        logger.error(f"Error hashing password: {e}")
+        # Final fallback
+        return simple_hash_password(password)
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash"""
+    try:
+        if not isinstance(plain_password, str):
+            plain_password = str(plain_password)
+        if is_bcrypt_hash(hashed_password):
+            if not bcrypt_available():
+                return False
+            return pwd_context.verify(truncate_for_bcrypt(plain_password), hashed_password)
+        return simple_verify_password(plain_password, hashed_password)
+    except Exception as e:
+        logger.error(f"Error verifying password: {e}")
+        return False
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True when the hash isn't in the preferred scheme (or uses outdated bcrypt settings)"""
+    if not bcrypt_available():
+        return False
+    if not is_bcrypt_hash(hashed_password):
+        return True
+    try:
+        return pwd_context.needs_update(hashed_password)
+    except Exception:
+        return False
+
+def verify_and_rehash(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify a password; on success also return a replacement hash if an upgrade is due"""
+    if not verify_password(plain_password, hashed_password):
+        return False, None
+    if needs_rehash(hashed_password):
+        return True, get_password_hash(plain_password)
+    return True, None
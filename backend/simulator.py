@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Offline negotiation simulator.
+
+Runs scripted wholesaler agents against the real negotiation pipeline
+(process_chat_turn: rule-based fast path, or build_llm_context -> generate_ai_reply -> maybe_apply_final_json)
+with local stand-in LLMs that speak the Ollama /api/chat and OpenAI chat-completions
+protocols, and reports turns-to-close, LLM latency percentiles, route health and
+final-price quality.
+
+Examples:
+    python simulator.py --sessions 1000 --concurrency 100 --strategy ladder
+    python simulator.py --llm-url http://127.0.0.1:11434 --sessions 20   # real Ollama
+    python simulator.py --serve-llm --port 11435                         # stand-in only
+    python simulator.py --standins 2 --llm-tail-rate 0.05 --hedge        # routing/hedging
+    python simulator.py --standins 2 --llm-error-rate 0.3                # retries/breakers
+    python simulator.py --no-fast-path                                   # every turn through the LLM
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+# Catalog used to generate product lists: name -> typical per-unit price (INR)
+CATALOG = {
+    "Basmati Rice": 95.0,
+    "Sugar": 42.0,
+    "Wheat Flour": 36.0,
+    "Sunflower Oil": 140.0,
+    "Toor Dal": 120.0,
+    "Tea Leaves": 260.0,
+    "Iodized Salt": 22.0,
+    "Turmeric Powder": 180.0,
+}
+
+STRATEGIES = ("ladder", "firm", "eager", "mixed")
+
+
+# ---------------------------------------------------------------------------
+# Stand-in LLM (Ollama /api/chat protocol)
+# ---------------------------------------------------------------------------
+
+PRODUCT_LINE_RE = re.compile(r"^- (.+) x (\d+)$", re.MULTILINE)
+STANDIN_CLOSE_AFTER = 4  # wholesaler turns before the stand-in accepts the latest quote
+
+
+def quoted_prices(products: list[str], text: str) -> dict:
+    prices = {}
+    for name in products:
+        m = re.search(re.escape(name) + r"\D{0,12}?(\d+(?:\.\d+)?)", text or "", re.IGNORECASE)
+        if m:
+            prices[name] = float(m.group(1))
+    return prices
+
+
+def standin_reply(messages: list[dict]) -> str:
+    """Deterministic purchasing agent: counters ~8% below each quote and emits FINAL_JSON
+    once the wholesaler calls their prices final or enough rounds have passed."""
+    system = "\n".join(m["content"] for m in messages if m.get("role") == "system")
+    products = [name for name, _ in PRODUCT_LINE_RE.findall(system)]
+    last_user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    # Rounds folded into the running summary still count
+    rounds = sum(1 for m in messages if m.get("role") == "user") + system.count("\nWholesaler:")
+    quotes = quoted_prices(products, last_user)
+    if products and len(quotes) == len(products) and ("final" in last_user.lower() or rounds >= STANDIN_CLOSE_AFTER):
+        items = [{"name": name, "final_price": quotes[name]} for name in products]
+        return "Agreed, thank you. <FINAL_JSON> " + json.dumps({"currency": "INR", "items": items}) + " </FINAL_JSON>"
+    if not quotes:
+        return "Could you share your best per-unit price for each item: " + ", ".join(products) + "?"
+    counters = ", ".join(f"{name}: {price * 0.92:.2f}" for name, price in quotes.items())
+    return f"Thanks. Given our volumes, can you do {counters}? Please confirm your final prices."
+
+
+def build_standin_app(latency_ms: float, jitter_ms: float, error_rate: float = 0.0, tail_rate: float = 0.0, tail_ms: float = 0.0):
+    """Stand-in LLM speaking both the Ollama (/api/chat) and OpenAI (/v1/chat/completions)
+    protocols. error_rate answers 503/429 at random; tail_rate adds tail_ms to some replies."""
+    from fastapi import FastAPI, Body
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+
+    def delay_s() -> float:
+        delay = max(0.0, random.gauss(latency_ms, jitter_ms))
+        if random.random() < tail_rate:
+            delay += tail_ms
+        return delay / 1000
+
+    def failure():
+        if random.random() < error_rate:
+            status = random.choice((429, 503))
+            return JSONResponse({"error": "stand-in failure"}, status_code=status, headers={"Retry-After": "0"})
+        return None
+
+    @app.get("/api/tags")
+    def tags():
+        return {"models": [{"name": "standin"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict = Body(...)):
+        if (error := failure()) is not None:
+            return error
+        delay = delay_s()
+        content = standin_reply(body.get("messages", []))
+        model = body.get("model", "standin")
+        if body.get("stream"):
+            async def events():
+                await asyncio.sleep(delay)
+                for word in re.findall(r"\S+\s*", content):
+                    yield "data: " + json.dumps({"model": model, "choices": [{"delta": {"content": word}}]}) + "\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+        await asyncio.sleep(delay)
+        return {"model": model, "choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    @app.post("/api/chat")
+    async def chat(body: dict = Body(...)):
+        if (error := failure()) is not None:
+            return error
+        delay = delay_s()
+        content = standin_reply(body.get("messages", []))
+        model = body.get("model", "standin")
+        if body.get("stream"):
+            async def chunks():
+                await asyncio.sleep(delay)
+                for word in re.findall(r"\S+\s*", content):
+                    yield json.dumps({"model": model, "message": {"role": "assistant", "content": word}, "done": False}) + "\n"
+                yield json.dumps({"model": model, "done": True}) + "\n"
+            return StreamingResponse(chunks(), media_type="application/x-ndjson")
+        await asyncio.sleep(delay)
+        return {"model": model, "message": {"role": "assistant", "content": content}, "done": True}
+
+    return app
+
+
+async def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+# ---------------------------------------------------------------------------
+# Scripted wholesaler agents
+# ---------------------------------------------------------------------------
+
+@dataclass
+class WholesalerAgent:
+    """Quotes per-unit prices that move from an opening price toward a private floor."""
+    strategy: str
+    opening: dict
+    floor: dict
+    step: float = 0.05
+    rounds: int = 0
+
+    def prices(self) -> dict:
+        if self.strategy == "eager":
+            return dict(self.floor)
+        if self.strategy == "firm":
+            # Holds the opening quote, then drops straight to the floor
+            return dict(self.floor) if self.rounds >= 3 else dict(self.opening)
+        # ladder: concede a fixed fraction of the opening price each round
+        return {
+            name: max(self.floor[name], price * (1 - self.step * (self.rounds - 1)))
+            for name, price in self.opening.items()
+        }
+
+    def message(self) -> str:
+        self.rounds += 1
+        prices = self.prices()
+        quote = ", ".join(f"{name}: {price:.2f}" for name, price in prices.items())
+        if all(prices[name] <= self.floor[name] for name in prices):
+            return f"My prices are {quote}. These are my final prices, INR, no MOQ."
+        return f"My prices are {quote}. INR per unit."
+
+
+def make_agent(strategy: str, products: list[dict], rng: random.Random) -> WholesalerAgent:
+    if strategy == "mixed":
+        strategy = rng.choice(("ladder", "firm", "eager"))
+    floor = {p["name"]: round(CATALOG[p["name"]] * rng.uniform(0.82, 0.98), 2) for p in products}
+    opening = {name: round(price * rng.uniform(1.15, 1.4), 2) for name, price in floor.items()}
+    return WholesalerAgent(strategy=strategy, opening=opening, floor=floor, step=rng.uniform(0.03, 0.08))
+
+
+@dataclass
+class ConversationResult:
+    strategy: str
+    turns: int
+    closed: bool
+    premium: float | None = None  # final basket cost over the wholesaler's floor cost
+    savings: float | None = None  # final basket cost below the opening quote
+    error: str | None = None
+
+
+@dataclass
+class Stats:
+    llm_latencies: list = field(default_factory=list)
+    results: list = field(default_factory=list)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def negotiate(main, session_id: int, wholesaler_id: int, agent: WholesalerAgent, quantities: dict, max_turns: int) -> ConversationResult:
+    finalized = False
+    turns = 0
+    try:
+        async with main.AsyncSessionLocal() as db:
+            while turns < max_turns:
+                turns += 1
+                _, finalized = await main.process_chat_turn(session_id, wholesaler_id, agent.message(), db)
+                if finalized:
+                    break
+            if finalized:
+                # Agreed prices as stored, whether the LLM or the rule-based fast path closed the deal
+                offers = (await db.execute(
+                    main.select(main.Offer.product_name, main.Offer.price)
+                    .where(main.Offer.session_id == session_id, main.Offer.wholesaler_id == wholesaler_id)
+                )).all()
+    except Exception as e:
+        return ConversationResult(agent.strategy, turns, False, error=str(e))
+    if not finalized:
+        return ConversationResult(agent.strategy, turns, False)
+    items = [{"name": name, "final_price": price} for name, price in offers]
+    final_cost = sum(float(i["final_price"]) * quantities.get(i["name"], 0) for i in items)
+    floor_cost = sum(agent.floor[name] * qty for name, qty in quantities.items())
+    opening_cost = sum(agent.opening[name] * qty for name, qty in quantities.items())
+    return ConversationResult(
+        agent.strategy, turns, True,
+        premium=final_cost / floor_cost - 1 if floor_cost else None,
+        savings=1 - final_cost / opening_cost if opening_cost else None,
+    )
+
+
+async def run_simulation(args) -> dict:
+    # main reads its configuration at import time, so point it at the simulation database first
+    os.environ["DATABASE_URL"] = args.db
+    os.environ["LLM_PROVIDER"] = ""
+    os.environ["LLM_ROUTES"] = ""
+    if args.hedge:
+        os.environ["LLM_HEDGE"] = "1"
+    if args.no_fast_path:
+        os.environ["NEGOTIATION_FAST_PATH"] = "0"
+    os.environ.setdefault("LLM_MAX_CONNECTIONS", str(args.concurrency))
+    # Every scripted wholesaler serves the whole catalog, so each session reaches all of them
+    os.environ.setdefault("WHOLESALER_ROUTING_TOP_N", str(args.wholesalers))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    import main
+    import migrations
+
+    if not args.verbose:
+        logging.getLogger("negokart.backend").setLevel(logging.WARNING)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    servers = []
+    if args.model:
+        main.OLLAMA_MODEL = args.model
+    if args.routes:
+        routes = args.routes
+    elif args.llm_url:
+        routes = f"ollama:{main.OLLAMA_MODEL}@{args.llm_url}"
+    else:
+        app = build_standin_app(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate, args.llm_tail_rate, args.llm_tail_ms)
+        for i in range(args.standins):
+            servers.append(await start_server(app, args.port + i))
+        routes = ",".join(f"ollama:{main.OLLAMA_MODEL}@http://127.0.0.1:{args.port + i}" for i in range(args.standins))
+    main.llm_router.configure(routes)
+
+    stats = Stats()
+    original_reply = main.generate_ai_reply
+
+    async def timed_reply(messages):
+        start = time.perf_counter()
+        try:
+            return await original_reply(messages)
+        finally:
+            stats.llm_latencies.append((time.perf_counter() - start) * 1000)
+
+    main.generate_ai_reply = timed_reply
+
+    rng = random.Random(args.seed)
+
+    def setup():
+        db = main.SessionLocal()
+        try:
+            retailer = db.query(main.User).filter(main.User.username == "sim-retailer").first()
+            if not retailer:
+                retailer = main.User(username="sim-retailer", hashed_password="!", role="retailer")
+                db.add(retailer)
+            existing = {u.username: u for u in db.query(main.User).filter(main.User.username.like("sim-wholesaler-%"))}
+            for i in range(args.wholesalers):
+                name = f"sim-wholesaler-{i}"
+                if name not in existing:
+                    existing[name] = main.User(username=name, hashed_password="!", role="wholesaler")
+                    db.add(existing[name])
+            db.commit()
+            db.refresh(retailer)
+            wholesaler_ids = [existing[f"sim-wholesaler-{i}"].id for i in range(args.wholesalers)]
+            product_ids = main.resolve_product_ids(db, CATALOG)
+            for wholesaler_id in wholesaler_ids:
+                main.index_wholesaler_terms(db, wholesaler_id, "profile", {f"p:{pid}": main.ROUTING_SKU_WEIGHT for pid in product_ids.values()})
+            db.commit()
+            return retailer.id, wholesaler_ids
+        finally:
+            db.close()
+
+    def submit(retailer_id: int, products: list[dict]) -> tuple[int, set[int]]:
+        """Submit a list; returns the session id and the wholesalers it was routed to"""
+        db = main.SessionLocal()
+        try:
+            retailer = db.query(main.User).filter(main.User.id == retailer_id).first()
+            req = main.ProductListRequest(products=[main.ProductItem(**p) for p in products])
+            session_id = main.submit_product_list(req, db=db, current_user=retailer)["session_id"]
+            routed = db.query(main.WholesalerNegotiation.wholesaler_id).filter(main.WholesalerNegotiation.session_id == session_id)
+            return session_id, {wholesaler_id for (wholesaler_id,) in routed}
+        finally:
+            db.close()
+
+    await asyncio.to_thread(migrations.run_migrations, main.engine)
+    retailer_id, wholesaler_ids = await asyncio.to_thread(setup)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def conversation(session_id, wholesaler_id, agent, quantities):
+        async with semaphore:
+            stats.results.append(await negotiate(main, session_id, wholesaler_id, agent, quantities, args.max_turns))
+
+    async def one_session():
+        names = rng.sample(sorted(CATALOG), rng.randint(2, min(4, len(CATALOG))))
+        products = [{"name": name, "quantity": rng.choice((10, 25, 50, 100, 200))} for name in names]
+        async with semaphore:
+            session_id, routed = await asyncio.to_thread(submit, retailer_id, products)
+        quantities = {p["name"]: p["quantity"] for p in products}
+        await asyncio.gather(*(
+            conversation(session_id, wholesaler_id, make_agent(args.strategy, products, rng), quantities)
+            for wholesaler_id in wholesaler_ids if wholesaler_id in routed
+        ))
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one_session() for _ in range(args.sessions)))
+    finally:
+        elapsed = time.perf_counter() - started
+        main.generate_ai_reply = original_reply
+        await main.llm_clients.aclose()
+        await main.async_engine.dispose()
+        for server, task in servers:
+            server.should_exit = True
+            await task
+    report = build_report(stats, elapsed, args)
+    report["llm_cache"] = main.llm_response_cache.stats()
+    report["llm_routes"] = main.llm_router.snapshot()
+    report["turns_by_path"] = {path: main.NEGOTIATION_TURNS.value(path=path) for path in ("counter", "accept", "llm")}
+    return report
+
+
+def build_report(stats: Stats, elapsed: float, args) -> dict:
+    results = stats.results
+    closed = [r for r in results if r.closed]
+    turns = [r.turns for r in closed]
+    premiums = [r.premium * 100 for r in closed if r.premium is not None]
+    savings = [r.savings * 100 for r in closed if r.savings is not None]
+    by_strategy = {}
+    for name in sorted({r.strategy for r in results}):
+        group = [r for r in results if r.strategy == name]
+        group_closed = [r for r in group if r.closed]
+        by_strategy[name] = {
+            "conversations": len(group),
+            "closed": len(group_closed),
+            "mean_turns": sum(r.turns for r in group_closed) / len(group_closed) if group_closed else None,
+            "mean_premium_pct": sum(r.premium * 100 for r in group_closed) / len(group_closed) if group_closed else None,
+        }
+    total_turns = sum(r.turns for r in results)
+    return {
+        "sessions": args.sessions,
+        "conversations": len(results),
+        "closed": len(closed),
+        "errors": sum(1 for r in results if r.error),
+        "elapsed_s": elapsed,
+        "turns_per_s": total_turns / elapsed if elapsed else None,
+        "turns_to_close": {
+            "mean": sum(turns) / len(turns) if turns else None,
+            "p50": percentile(turns, 50),
+            "p95": percentile(turns, 95),
+            "max": max(turns) if turns else None,
+        },
+        "llm_latency_ms": {
+            "calls": len(stats.llm_latencies),
+            "p50": percentile(stats.llm_latencies, 50),
+            "p95": percentile(stats.llm_latencies, 95),
+            "p99": percentile(stats.llm_latencies, 99),
+        },
+        "price_premium_over_floor_pct": {
+            "mean": sum(premiums) / len(premiums) if premiums else None,
+            "p50": percentile(premiums, 50),
+            "p95": percentile(premiums, 95),
+        },
+        "savings_vs_opening_pct": {
+            "mean": sum(savings) / len(savings) if savings else None,
+        },
+        "by_strategy": by_strategy,
+    }
+
+
+def fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def print_report(report: dict):
+    print("=" * 60)
+    print("SIMULATION RESULTS")
+    print(f"Sessions: {report['sessions']}  conversations: {report['conversations']}  "
+          f"closed: {report['closed']}  errors: {report['errors']}")
+    print(f"Wall time: {report['elapsed_s']:.2f}s  throughput: {fmt(report['turns_per_s'])} turns/s")
+    t = report["turns_to_close"]
+    print(f"Turns to close: mean {fmt(t['mean'], '.2f')}  p50 {fmt(t['p50'], 'd')}  p95 {fmt(t['p95'], 'd')}  max {fmt(t['max'], 'd')}")
+    l = report["llm_latency_ms"]
+    print(f"LLM latency (ms, {l['calls']} calls): p50 {fmt(l['p50'])}  p95 {fmt(l['p95'])}  p99 {fmt(l['p99'])}")
+    for route in report.get("llm_routes", []):
+        print(f"  route {route['route']:<40} {route['state']:<9} ewma {fmt(route['ewma_latency_ms'])}ms  "
+              f"p95 {fmt(route['p95_ms'])}ms  errors {fmt(route['ewma_error_rate'] * 100)}%")
+    paths = report.get("turns_by_path")
+    if paths:
+        print("Turns by path: " + "  ".join(f"{path} {count:g}" for path, count in paths.items()))
+    c = report.get("llm_cache")
+    if c:
+        print(f"LLM cache: hit rate {fmt(c['hit_rate'] and c['hit_rate'] * 100)}%  coalesced {c['coalesced']}  misses {c['misses']}")
+    p = report["price_premium_over_floor_pct"]
+    print(f"Price premium over floor: mean {fmt(p['mean'], '.2f')}%  p50 {fmt(p['p50'], '.2f')}%  p95 {fmt(p['p95'], '.2f')}%")
+    print(f"Savings vs opening quote: mean {fmt(report['savings_vs_opening_pct']['mean'], '.2f')}%")
+    for name, s in report["by_strategy"].items():
+        print(f"  {name:<7} closed {s['closed']}/{s['conversations']}  mean turns {fmt(s['mean_turns'], '.2f')}  "
+              f"mean premium {fmt(s['mean_premium_pct'], '.2f')}%")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless NegoKart negotiation simulator")
+    parser.add_argument("--sessions", type=int, default=100, help="product lists to submit")
+    parser.add_argument("--wholesalers", type=int, default=3, help="scripted wholesalers per session")
+    parser.add_argument("--concurrency", type=int, default=50, help="max concurrent conversations")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="mixed")
+    parser.add_argument("--max-turns", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db", default=None, help="database URL (default: fresh SQLite file in the temp dir)")
+    parser.add_argument("--llm-url", default=None, help="use this Ollama server instead of the stand-in")
+    parser.add_argument("--model", default=None, help="Ollama model name")
+    parser.add_argument("--llm-latency-ms", type=float, default=150.0, help="stand-in mean latency")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0, help="stand-in latency std-dev")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="stand-in 429/503 probability")
+    parser.add_argument("--llm-tail-rate", type=float, default=0.0, help="probability of a slow stand-in reply")
+    parser.add_argument("--llm-tail-ms", type=float, default=2000.0, help="extra latency of slow stand-in replies")
+    parser.add_argument("--standins", type=int, default=1, help="stand-in LLM servers (one route each)")
+    parser.add_argument("--routes", default=None, help="LLM_ROUTES spec to use instead of the stand-ins")
+    parser.add_argument("--hedge", action="store_true", help="enable hedged LLM requests")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every turn to the LLM (disable the rule-based fast path)")
+    parser.add_argument("--port", type=int, default=11435, help="stand-in LLM port (first of --standins)")
+    parser.add_argument("--serve-llm", action="store_true", help="only run the stand-in LLM server")
+    parser.add_argument("--json", default=None, help="write the report to this file")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    if args.serve_llm:
+        import uvicorn
+        print(f"Stand-in LLM listening on http://127.0.0.1:{args.port} (Ollama /api/chat, OpenAI /v1/chat/completions)")
+        app = build_standin_app(args.llm_latency_ms, args.llm_jitter_ms, args.llm_error_rate, args.llm_tail_rate, args.llm_tail_ms)
+        uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+        return
+    if args.db is None:
+        path = os.path.join(tempfile.gettempdir(), "negokart-simulation.db")
+        if os.path.exists(path):
+            os.remove(path)
+        args.db = f"sqlite:///{path}"
+    report = asyncio.run(run_simulation(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# main reads its configuration at import time: point it at a throwaway SQLite database
+DB_DIR = tempfile.mkdtemp(prefix="negokart-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(DB_DIR, 'test.db')}"
+os.environ["AUTO_MIGRATE"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import migrations  # noqa: E402
+
+migrations.run_migrations(main.engine)
+
+@pytest.fixture
+def db():
+    session = main.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
@@ -0,0 +1,106 @@
+import pytest
+
+import main
+
+PRODUCTS = [{"name": "Rice", "quantity": 100}, {"name": "Sugar", "quantity": 50}]
+
+@pytest.mark.parametrize("message, prices, moqs, final", [
+    ("Rice 50, Sugar 40", {"Rice": 50.0, "Sugar": 40.0}, {}, False),
+    ("Sugar: 40.50 and rice: 1,050", {"Rice": 1050.0, "Sugar": 40.5}, {}, False),
+    ("Rices 50, Sugars 40", {"Rice": 50.0, "Sugar": 40.0}, {}, False),
+    ("Rice 50 MOQ 80, Sugar 40 min order 20", {"Rice": 50.0, "Sugar": 40.0}, {"Rice": 80, "Sugar": 20}, False),
+    ("Rice 48, Sugar 39 final", {"Rice": 48.0, "Sugar": 39.0}, {}, True),
+    ("Rice 48, Sugar 39, can't go any lower", {"Rice": 48.0, "Sugar": 39.0}, {}, True),
+])
+def test_parse_price_quote(message, prices, moqs, final):
+    quote = main.parse_price_quote(message, PRODUCTS)
+    assert quote == main.PriceQuote(prices=prices, moqs=moqs, final=final)
+
+@pytest.mark.parametrize("message", [
+    "",
+    "Rice 50",  # Sugar missing
+    "Rice 50, Sugar 40, Rice 45",  # product named twice
+    "Rice 50 or 48, Sugar 40",  # two prices for one product
+    "Rice, Sugar 40",  # no price for Rice
+    "For 500 units: Rice 50, Sugar 40",  # number before the first product
+    "Rice 0, Sugar 40",
+    "Rice 50, Sugar 40?",
+    "Rice 50, Sugar 40 plus GST",
+    "Rice 50, Sugar 40 if you pay in advance",
+    "Rice 50 per bag, Sugar 40",
+    "Rice 50 MOQ 500, Sugar 40",  # MOQ above the requested quantity
+])
+def test_parse_price_quote_rejects(message):
+    assert main.parse_price_quote(message, PRODUCTS) is None
+
+def test_parse_price_quote_prefers_longest_name():
+    products = [{"name": "Rice", "quantity": 10}, {"name": "Basmati Rice", "quantity": 10}]
+    quote = main.parse_price_quote("Basmati Rice 120, Rice 50", products)
+    assert quote.prices == {"Basmati Rice": 120.0, "Rice": 50.0}
+
+def open_session(db) -> int:
+    product_list = main.ProductList(retailer_id=1, products="[]")
+    db.add(product_list)
+    db.flush()
+    db.add_all(
+        main.ProductListItem(product_list_id=product_list.id, position=i, name=p["name"], quantity=p["quantity"])
+        for i, p in enumerate(PRODUCTS)
+    )
+    session = main.NegotiationSession(product_list_id=product_list.id)
+    db.add(session)
+    db.commit()
+    return session.id
+
+def play(db, messages) -> list[str | None]:
+    """Send wholesaler messages through the fast path; returns "counter", "accept" or None (LLM) per turn"""
+    session_id, wholesaler_id = open_session(db), 7
+    outcomes = []
+    for message in messages:
+        db.add(main.ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="user", content=message))
+        db.commit()
+        decision = main.fast_path_turn(session_id, wholesaler_id, message, db)
+        if decision is None:
+            outcomes.append(None)
+            continue
+        reply, agreement = decision
+        db.add(main.ChatMessage(session_id=session_id, wholesaler_id=wholesaler_id, role="assistant", content=reply))
+        db.commit()
+        outcomes.append("accept" if agreement else "counter")
+    return outcomes
+
+@pytest.mark.parametrize("messages, expected", [
+    (["Rice 50, Sugar 40"], ["counter"]),
+    (["Need more details first"], [None]),
+    (["Rice 5000, Sugar 5000 final"], [None]),  # never close before countering
+    (["Rice 50, Sugar 40", "Rice 50, Sugar 40 final"], ["counter", "accept"]),
+    (["Rice 50, Sugar 40", "Rice 48, Sugar 39 final"], ["counter", "accept"]),
+    (["Rice 50, Sugar 40", "Rice 60, Sugar 40 final"], ["counter", None]),  # raised and far above our counter
+    (["Rice 50, Sugar 40", "Rice 40, Sugar 30"], ["counter", "accept"]),  # meets the counter
+    (["Rice 50, Sugar 40", "Rice 49, Sugar 39", "Rice 48, Sugar 38", "Rice 47, Sugar 37"], ["counter"] * 3 + ["accept"]),
+    (["Rice 50, Sugar 40", "Rice 49, Sugar 39", "Rice 48, Sugar 38", "Rice 55, Sugar 45"], ["counter"] * 3 + [None]),
+])
+def test_fast_path_turn(db, messages, expected):
+    assert play(db, messages) == expected
+
+def test_fast_path_counter_never_exceeds_quote(db):
+    session_id = open_session(db)
+    reply, agreement = main.fast_path_turn(session_id, 7, "Rice 50, Sugar 40", db)
+    assert agreement is None
+    state = {}
+    main.update_price_state(state, [p["name"] for p in PRODUCTS], "assistant", reply)
+    assert 0 < state["Rice"]["agent"] < 50
+    assert 0 < state["Sugar"]["agent"] < 40
+
+def test_fast_path_agreement_carries_quoted_prices(db):
+    session_id = open_session(db)
+    for role, content in [("user", "Rice 50, Sugar 40"), ("assistant", main.fast_path_turn(session_id, 7, "Rice 50, Sugar 40", db)[0])]:
+        db.add(main.ChatMessage(session_id=session_id, wholesaler_id=7, role=role, content=content))
+    db.commit()
+    message = "Rice 48 MOQ 60, Sugar 39 final"
+    db.add(main.ChatMessage(session_id=session_id, wholesaler_id=7, role="user", content=message))
+    db.commit()
+    _, agreement = main.fast_path_turn(session_id, 7, message, db)
+    assert agreement == {"currency": "INR", "items": [
+        {"name": "Rice", "final_price": 48.0, "moq": 60},
+        {"name": "Sugar", "final_price": 39.0},
+    ]}
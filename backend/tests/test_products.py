@@ -0,0 +1,55 @@
+import pytest
+
+import main
+
+@pytest.mark.parametrize("name, key", [
+    ("Basmati Rice", "basmati rice"),
+    ("Rice, Basmati", "basmati rice"),
+    ("  BASMATI   rice ", "basmati rice"),
+    ("Sugar 5 kg", "5kg sugar"),
+    ("Sugar 5Kgs", "5kg sugar"),
+    ("Sugar (5 kilograms)", "5kg sugar"),
+    ("Oil 1.5 ltr.", "1.5l oil"),
+    ("Salt 500 gms", "500g salt"),
+    ("Eggs 30 pcs", "30pc eggs"),
+    ("---", ""),
+])
+def test_product_key(name, key):
+    assert main.product_key(name) == key
+
+def test_product_grams():
+    assert main.product_grams("5kg") == {" 5k", "5kg", "kg "}
+    assert main.product_grams("") == set()
+
+# Trigram Jaccard score in the comments; PRODUCT_MATCH_THRESHOLD defaults to 0.65
+@pytest.mark.parametrize("stored, spelling, matches", [
+    ("Basmati Rice", "Basmatti Rice", True),  # 0.77
+    ("Chana Dal", "Chana Daal", True),  # 0.70
+    ("Turmeric Powder", "Turmeric Powdr", True),  # 0.69
+    ("Sunflower Oil", "Sunflowr Oil", False),  # 0.64
+    ("Basmati Rice", "Basmati Rce", False),  # 0.62
+    ("Basmati Rice", "Jasmine Rice", False),  # 0.29
+    ("Basmati Rice", "Basmati", False),  # word count differs
+    ("Sugar 5 kg", "Sugar 1 kg", False),  # pack sizes must agree exactly
+])
+def test_fuzzy_match_product(db, stored, spelling, matches):
+    product_id = main.resolve_product_ids(db, [stored])[stored]
+    matched = main.fuzzy_match_product(db, main.product_key(spelling))
+    assert (matched == product_id) is matches
+
+def test_fuzzy_match_threshold(db, monkeypatch):
+    product_id = main.resolve_product_ids(db, ["Turmeric Powder"])["Turmeric Powder"]
+    key = main.product_key("Turmerik Powder")  # 0.75
+    assert main.fuzzy_match_product(db, key) == product_id
+    monkeypatch.setattr(main, "PRODUCT_MATCH_THRESHOLD", 0.8)
+    assert main.fuzzy_match_product(db, key) is None
+
+def test_resolve_product_ids_shares_canonical_product(db):
+    ids = main.resolve_product_ids(db, ["Sugar 5 kg", "sugar 5kgs", "Sugar 1 kg", "!!"])
+    assert ids["Sugar 5 kg"] == ids["sugar 5kgs"]
+    assert ids["Sugar 1 kg"] not in (None, ids["Sugar 5 kg"])
+    assert ids["!!"] is None
+    # Later spellings match existing products and are recorded as aliases
+    rice = main.resolve_product_ids(db, ["Basmatti Rice"])["Basmatti Rice"]
+    assert rice == main.resolve_product_ids(db, ["Basmati Rice"])["Basmati Rice"]
+    assert db.query(main.ProductAlias.product_id).filter(main.ProductAlias.name == "Basmatti Rice").scalar() == rice
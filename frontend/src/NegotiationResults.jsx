@@ -1,15 +1,75 @@
 import React, { useEffect, useState, useRef } from 'react';
 import './Dashboard.css';
 
+// Pushed updates only come from the backend worker serving the stream; a slow resync picks up the rest
+const RESYNC_INTERVAL_MS = 60000;
+
 function NegotiationResults({ token }) {
   const [results, setResults] = useState([]);
+  const [bestPriceRows, setBestPriceRows] = useState([]);
+  const [basketTotal, setBasketTotal] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [lastUpdated, setLastUpdated] = useState(null);
   const [newOffers, setNewOffers] = useState(false);
   const [finalizedAlerts, setFinalizedAlerts] = useState([]); 
   const prevResults = useRef([]);
-  const pollRef = useRef(null);
+  const sessionRef = useRef(null);
+
+  const applyResults = (current) => {
+    // Detect general changes
+    if (JSON.stringify(current) !== JSON.stringify(prevResults.current)) {
+      setNewOffers(prevResults.current.length > 0);
+    } else {
+      setNewOffers(false);
+    }
+    // Detect wholesalers that newly became finalized
+    const prevStatus = new Map(prevResults.current.map(r => [r.wholesaler, r.status]));
+    const newlyFinalized = current
+      .filter(r => r.status === 'finalized' && prevStatus.get(r.wholesaler) !== 'finalized')
+      .map(r => r.wholesaler);
+    if (newlyFinalized.length) {
+      setFinalizedAlerts(newlyFinalized);
+      // auto-clear banner after 8s
+      setTimeout(() => setFinalizedAlerts([]), 8000);
+    }
+    setResults(current);
+    prevResults.current = current;
+    setLastUpdated(new Date());
+  };
+
+  // Merge refreshed best-price rows; the basket total is known once every requested product has a price
+  const applyBestPrices = (rows) => {
+    setBestPriceRows(prev => {
+      const merged = [...prev];
+      rows.forEach(row => {
+        const i = merged.findIndex(r => r.product_name === row.product_name);
+        if (i >= 0) merged[i] = row; else merged.push(row);
+      });
+      const requested = merged.filter(r => r.quantity !== null);
+      setBasketTotal(requested.length && requested.every(r => r.line_total !== null)
+        ? requested.reduce((sum, r) => sum + r.line_total, 0) : null);
+      return merged;
+    });
+  };
+
+  // Merge a pushed delta ({ session_id, wholesaler, status, offers, best_prices }) into the current results
+  const applyUpdate = (update) => {
+    if (sessionRef.current !== null && update.session_id !== sessionRef.current) return;
+    applyBestPrices(update.best_prices || []);
+    const current = prevResults.current.map(r => ({ ...r, offers: [...r.offers] }));
+    let entry = current.find(r => r.wholesaler === update.wholesaler);
+    if (!entry) {
+      entry = { wholesaler: update.wholesaler, status: update.status, offers: [] };
+      current.push(entry);
+    }
+    entry.status = update.status;
+    update.offers.forEach(offer => {
+      const i = entry.offers.findIndex(o => o.product_name === offer.product_name);
+      if (i >= 0) entry.offers[i] = offer; else entry.offers.push(offer);
+    });
+    applyResults(current);
+  };
 
   const fetchResults = async () => {
     setError('');
@@ -20,26 +80,10 @@ function NegotiationResults({ token }) {
       });
       const data = await res.json();
       if (res.ok) {
-        const current = data.results || [];
-        // Detect general changes
-        if (JSON.stringify(current) !== JSON.stringify(prevResults.current)) {
-          setNewOffers(prevResults.current.length > 0);
-        } else {
-          setNewOffers(false);
-        }
-        // Detect wholesalers that newly became finalized
-        const prevStatus = new Map(prevResults.current.map(r => [r.wholesaler, r.status]));
-        const newlyFinalized = current
-          .filter(r => r.status === 'finalized' && prevStatus.get(r.wholesaler) !== 'finalized')
-          .map(r => r.wholesaler);
-        if (newlyFinalized.length) {
-          setFinalizedAlerts(newlyFinalized);
-          // auto-clear banner after 8s
-          setTimeout(() => setFinalizedAlerts([]), 8000);
-        }
-        setResults(current);
-        prevResults.current = current;
-        setLastUpdated(new Date());
+        sessionRef.current = data.session_id ?? null;
+        setBestPriceRows(data.best_prices || []);
+        setBasketTotal(data.basket_total ?? null);
+        applyResults(data.results || []);
       } else {
         setError(data.detail || 'Failed to fetch results');
       }
@@ -48,13 +92,47 @@ function NegotiationResults({ token }) {
     }
   };
 
+  // Subscribe to pushed result updates; reconnect (and resync) if the stream drops
+  const subscribe = async (controller) => {
+    const API_BASE = import.meta.env.VITE_API_BASE || 'https://negokart-backend-8pt9.onrender.com';
+    while (!controller.signal.aborted) {
+      try {
+        const res = await fetch(`${API_BASE}/retailer/negotiation_results/stream`, {
+          headers: { 'Authorization': `Bearer ${token}` },
+          signal: controller.signal,
+        });
+        if (!res.ok || !res.body) throw new Error('stream unavailable');
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const events = buffer.split('\n\n');
+          buffer = events.pop();
+          for (const evt of events) {
+            const dataLine = evt.split('\n').find(l => l.startsWith('data:'));
+            if (dataLine) applyUpdate(JSON.parse(dataLine.slice(5)));
+          }
+        }
+      } catch {
+        if (controller.signal.aborted) return;
+      }
+      await new Promise(r => setTimeout(r, 5000));
+      if (!controller.signal.aborted) await fetchResults();
+    }
+  };
+
   useEffect(() => {
     setLoading(true);
     fetchResults().finally(() => setLoading(false));
-    // start polling every 10s
-    pollRef.current = setInterval(fetchResults, 10000);
+    const controller = new AbortController();
+    subscribe(controller);
+    const resync = setInterval(fetchResults, RESYNC_INTERVAL_MS);
     return () => {
-      if (pollRef.current) clearInterval(pollRef.current);
+      controller.abort();
+      clearInterval(resync);
     };
     // eslint-disable-next-line
   }, [token]);
@@ -75,15 +153,12 @@ function NegotiationResults({ token }) {
     return 0;
   });
 
-  // Find best price per product
+  // Best price per product, maintained by the backend across all offers (unfinalized and prefilled included);
+  // the finalized totals and the BEST DEAL badge use finalized offers only
   const finalizedOffers = sortedResults.filter(r => r.status === 'finalized');
   const bestPrices = {};
-  finalizedOffers.forEach(wholesaler => {
-    wholesaler.offers.forEach(offer => {
-      if (!bestPrices[offer.product_name] || offer.price < bestPrices[offer.product_name]) {
-        bestPrices[offer.product_name] = offer.price;
-      }
-    });
+  bestPriceRows.forEach(row => {
+    if (row.best_price !== null) bestPrices[row.product_name] = row.best_price;
   });
 
   if (loading) {
@@ -166,8 +241,14 @@ function NegotiationResults({ token }) {
             </div>
             <div className="stat-card">
               <div className="stat-value">₹{Math.min(...finalizedOffers.map(w => w.totalCost)).toFixed(2)}</div>
-              <div className="stat-label">Best Total Price</div>
+              <div className="stat-label">Best Finalized Total</div>
             </div>
+            {basketTotal !== null && (
+              <div className="stat-card">
+                <div className="stat-value">₹{basketTotal.toFixed(2)}</div>
+                <div className="stat-label">Best Mixed Basket (all offers, incl. unfinalized)</div>
+              </div>
+            )}
             <div className="stat-card">
               <div className="stat-value">{Object.keys(bestPrices).length}</div>
               <div className="stat-label">Products</div>
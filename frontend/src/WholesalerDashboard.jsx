@@ -11,6 +11,8 @@ function WholesalerDashboard({ token }) {
   const [sendingPrices, setSendingPrices] = useState({}); 
   const [tab, setTab] = useState('active'); 
   const [history, setHistory] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [historyCursor, setHistoryCursor] = useState(null);
 
   const fetchNegotiations = async () => {
     setLoading(true);
@@ -23,6 +25,7 @@ function WholesalerDashboard({ token }) {
       const data = await res.json();
       if (res.ok) {
         setNegotiations(data.negotiations || []);
+        setNextCursor(data.next_cursor ?? null);
         setLastUpdated(new Date());
       } else {
         setError(data.detail || 'Failed to fetch negotiations');
@@ -33,6 +36,21 @@ function WholesalerDashboard({ token }) {
     setLoading(false);
   };
 
+  const loadMoreNegotiations = async () => {
+    if (nextCursor === null) return;
+    try {
+      const API_BASE = import.meta.env.VITE_API_BASE || 'https://negokart-backend-8pt9.onrender.com';
+      const res = await fetch(`${API_BASE}/wholesaler/negotiations?after=${nextCursor}`, {
+        headers: { 'Authorization': `Bearer ${token}` },
+      });
+      const data = await res.json();
+      if (res.ok) {
+        setNegotiations(prev => [...prev, ...(data.negotiations || [])]);
+        setNextCursor(data.next_cursor ?? null);
+      }
+    } catch {}
+  };
+
   const fetchHistory = async () => {
     try {
       const API_BASE = import.meta.env.VITE_API_BASE || 'https://negokart-backend-8pt9.onrender.com';
@@ -42,19 +60,50 @@ function WholesalerDashboard({ token }) {
       const data = await res.json();
       if (res.ok) {
         setHistory(data.history || []);
+        setHistoryCursor(data.next_cursor ?? null);
       }
     } catch {}
   };
 
-  const fetchChat = async (sessionId) => {
+  const loadMoreHistory = async () => {
+    if (historyCursor === null) return;
     try {
       const API_BASE = import.meta.env.VITE_API_BASE || 'https://negokart-backend-8pt9.onrender.com';
-      const res = await fetch(`${API_BASE}/wholesaler/chat/${sessionId}`, {
+      const res = await fetch(`${API_BASE}/wholesaler/history?before=${encodeURIComponent(historyCursor)}`, {
         headers: { 'Authorization': `Bearer ${token}` },
       });
       const data = await res.json();
       if (res.ok) {
-        setChats(ch => ({ ...ch, [sessionId]: { ...(ch[sessionId] || { input: '' }), messages: data.messages || [], status: data.status } }));
+        setHistory(prev => [...prev, ...(data.history || [])]);
+        setHistoryCursor(data.next_cursor ?? null);
+      }
+    } catch {}
+  };
+
+  // incremental: only fetch messages after the last saved one, revalidating with the ETag of the
+  // previous response (each after_id URL is a new browser cache entry, so it is sent explicitly)
+  const fetchChat = async (sessionId, incremental = false) => {
+    try {
+      const API_BASE = import.meta.env.VITE_API_BASE || 'https://negokart-backend-8pt9.onrender.com';
+      const saved = (chats[sessionId]?.messages || []).filter(m => m.id !== undefined);
+      const afterId = incremental && saved.length ? saved[saved.length - 1].id : null;
+      const query = afterId !== null ? `?after_id=${afterId}` : '';
+      const etag = afterId !== null ? chats[sessionId]?.etag : null;
+      const res = await fetch(`${API_BASE}/wholesaler/chat/${sessionId}${query}`, {
+        headers: { 'Authorization': `Bearer ${token}`, ...(etag ? { 'If-None-Match': etag } : {}) },
+      });
+      if (res.status === 304) {
+        // Nothing new; only drop optimistic (unsaved) messages
+        setChats(ch => ({ ...ch, [sessionId]: { ...ch[sessionId], messages: (ch[sessionId]?.messages || []).filter(m => m.id !== undefined) } }));
+        return;
+      }
+      const data = await res.json();
+      if (res.ok) {
+        setChats(ch => {
+          // Drop optimistic (unsaved) messages; the server copies replace them
+          const kept = afterId !== null ? (ch[sessionId]?.messages || []).filter(m => m.id !== undefined && m.id <= afterId) : [];
+          return { ...ch, [sessionId]: { ...(ch[sessionId] || { input: '' }), messages: [...kept, ...(data.messages || [])], status: data.status, etag: res.headers.get('ETag') } };
+        });
       }
     } catch {}
   };
@@ -63,21 +112,77 @@ function WholesalerDashboard({ token }) {
     const current = chats[sessionId] || { input: '' };
     const text = (textOverride !== undefined ? textOverride : current.input || '').trim();
     if (!text) return;
-    setChats(ch => ({ ...ch, [sessionId]: { ...current, input: '' } }));
+    const now = new Date().toISOString();
+    setChats(ch => ({
+      ...ch,
+      [sessionId]: {
+        ...current,
+        input: '',
+        error: '',
+        messages: [...(current.messages || []), { role: 'user', content: text, created_at: now, pending: true }, { role: 'assistant', content: '', created_at: now, pending: true }]
+      }
+    }));
+    // On failure: drop the optimistic messages, give the input back and show why
+    const fail = (detail) => setChats(ch => ({
+      ...ch,
+      [sessionId]: {
+        ...ch[sessionId],
+        input: current.input || '',
+        error: detail,
+        messages: (ch[sessionId]?.messages || []).filter(m => !m.pending),
+      }
+    }));
+    // Append streamed tokens to the in-progress assistant message
+    const appendToken = (tok) => setChats(ch => {
+      const msgs = [...(ch[sessionId]?.messages || [])];
+      const last = msgs[msgs.length - 1];
+      msgs[msgs.length - 1] = { ...last, content: last.content + tok };
+      return { ...ch, [sessionId]: { ...ch[sessionId], messages: msgs } };
+    });
     try {
       const API_BASE = import.meta.env.VITE_API_BASE || 'https://negokart-backend-8pt9.onrender.com';
-      const res = await fetch(`${API_BASE}/wholesaler/chat/${sessionId}`, {
+      const res = await fetch(`${API_BASE}/wholesaler/chat/${sessionId}/stream`, {
         method: 'POST',
         headers: { 'Authorization': `Bearer ${token}`, 'Content-Type': 'application/json' },
         body: JSON.stringify({ message: text })
       });
-      const data = await res.json();
-      if (res.ok) {
-        await fetchChat(sessionId);
+      if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({}));
+        fail(typeof data.detail === 'string' ? data.detail : `Failed to send message (${res.status})`);
+        return;
+      }
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let finalized = false;
+      let streamError = null;
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const evt of events) {
+          const dataLine = evt.split('\n').find(l => l.startsWith('data:'));
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine.slice(5));
+          if (data.token !== undefined) appendToken(data.token);
+          if (evt.startsWith('event: done')) finalized = data.finalized;
+          if (evt.startsWith('event: error')) streamError = data.detail || 'The AI reply was interrupted.';
+        }
+      }
+      if (streamError) {
+        fail(streamError);
+        return;
+      }
+      await fetchChat(sessionId, true);
+      if (finalized) {
         await fetchNegotiations();
         await fetchHistory();
       }
-    } catch {}
+    } catch {
+      fail('Network error');
+    }
   };
 
   useEffect(() => {
@@ -253,6 +358,11 @@ function WholesalerDashboard({ token }) {
                         </div>
                       )}
                     </div>
+                    {chats[neg.session_id]?.error && (
+                      <div className="alert alert-error">
+                        ❌ {chats[neg.session_id].error}
+                      </div>
+                    )}
                     <div className="chat-input-container">
                       <input
                         type="text"
@@ -272,6 +382,11 @@ function WholesalerDashboard({ token }) {
                 </div>
               ))
             )}
+            {nextCursor !== null && (
+              <button onClick={loadMoreNegotiations} className="btn btn-secondary btn-sm">
+                Load more
+              </button>
+            )}
           </>
         ) : (
           // History tab
@@ -325,6 +440,11 @@ function WholesalerDashboard({ token }) {
                 </div>
               ))
             )}
+            {historyCursor !== null && (
+              <button onClick={loadMoreHistory} className="btn btn-secondary btn-sm">
+                Load more
+              </button>
+            )}
           </div>
         )}
       </div>